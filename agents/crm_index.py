@@ -0,0 +1,185 @@
+# agents/crm_index.py
+import re
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+from utils import logger, shared_instance
+
+# HubSpot's 409 message for a duplicate email names the contact that already has it
+_EXISTING_ID = re.compile(r"Existing ID: ?(\d+)")
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    email = (email or "").strip().lower()
+    return email or None
+
+def normalize_domain(domain: Optional[str]) -> Optional[str]:
+    domain = (domain or "").strip().lower()
+    domain = re.sub(r"^[a-z]+://", "", domain).split("/")[0]
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain or None
+
+def existing_id_from_error(error: Any) -> Optional[str]:
+    """Contact id from a 'Contact already exists. Existing ID: …' conflict, if present."""
+    match = _EXISTING_ID.search(str(error or ""))
+    return match.group(1) if match else None
+
+class CRMIndex:
+    """Local email -> contact id and domain -> company id index in SQLite.
+
+    Lets create_contact update an existing contact without a CRM search call;
+    a lookup is one primary-key read however large the portal is. Filled by
+    `bootstrap` (paged export of every contact and company), by create/update
+    responses and by webhook events.
+    """
+
+    def __init__(self, path: str = "hubspot_automation.db"):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS hubspot_email_index (
+                email TEXT PRIMARY KEY,
+                contact_id TEXT NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_email_index_contact ON hubspot_email_index (contact_id)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS hubspot_domain_index (
+                domain TEXT PRIMARY KEY,
+                company_id TEXT NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_domain_index_company ON hubspot_domain_index (company_id)")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "CRMIndex":
+        return cls(path=config.get("hubspot_index_db_path", config.get("queue_db_path", "hubspot_automation.db")))
+
+    def _lookup(self, table: str, column: str, id_column: str, value: Optional[str]) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {id_column} FROM {table} WHERE {column} = ?", (value,)).fetchone() if value else None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def contact_id_for(self, email: Optional[str]) -> Optional[str]:
+        return self._lookup("hubspot_email_index", "email", "contact_id", normalize_email(email))
+
+    def company_id_for(self, domain: Optional[str]) -> Optional[str]:
+        return self._lookup("hubspot_domain_index", "domain", "company_id", normalize_domain(domain))
+
+    def _record(self, table: str, column: str, id_column: str, pairs: Iterable[Tuple[str, Optional[str]]]) -> int:
+        """Map each value to its object id, replacing the object's previous value; one transaction.
+
+        An empty value (the email or domain was cleared) only drops the object's old mapping.
+        """
+        pairs = [(str(object_id), value) for object_id, value in pairs if object_id]
+        rows = [(oid, value) for oid, value in pairs if value]
+        if not pairs:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(f"DELETE FROM {table} WHERE {id_column} = ?", [(oid,) for oid, _ in pairs])
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({column}, {id_column}) VALUES (?, ?)",
+                    [(value, oid) for oid, value in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def record_contacts(self, pairs: Iterable[Tuple[str, Optional[str]]]) -> int:
+        """Record (contact_id, email) pairs."""
+        return self._record("hubspot_email_index", "email", "contact_id",
+                            ((oid, normalize_email(email)) for oid, email in pairs))
+
+    def record_companies(self, pairs: Iterable[Tuple[str, Optional[str]]]) -> int:
+        """Record (company_id, domain) pairs."""
+        return self._record("hubspot_domain_index", "domain", "company_id",
+                            ((oid, normalize_domain(domain)) for oid, domain in pairs))
+
+    def record_contact(self, contact_id: str, email: Optional[str]) -> None:
+        self.record_contacts([(contact_id, email)])
+
+    def record_company(self, company_id: str, domain: Optional[str]) -> None:
+        self.record_companies([(company_id, domain)])
+
+    def remove(self, object_type: str, object_ids: Iterable[Any]) -> None:
+        table, id_column = {"contact": ("hubspot_email_index", "contact_id"),
+                            "company": ("hubspot_domain_index", "company_id")}[object_type]
+        with self._lock:
+            self._conn.executemany(f"DELETE FROM {table} WHERE {id_column} = ?", [(str(oid),) for oid in object_ids])
+
+    def apply_event(self, event: Dict[str, Any]) -> None:
+        """Track email/domain changes, deletions and merges from a webhook event."""
+        object_type, _, action = event.get('subscriptionType', '').partition('.')
+        if object_type not in ("contact", "company"):
+            return
+        object_id = event.get('objectId')
+        if action == 'propertyChange':
+            if object_type == 'contact' and event.get('propertyName') == 'email':
+                self.record_contact(object_id, event.get('propertyValue'))
+            elif object_type == 'company' and event.get('propertyName') == 'domain':
+                self.record_company(object_id, event.get('propertyValue'))
+        elif action == 'deletion':
+            self.remove(object_type, [object_id])
+        elif action == 'merge':
+            # Merged-away records disappear; the surviving record keeps its id
+            merged = [oid for oid in event.get('mergedObjectIds') or [] if oid != event.get('primaryObjectId')]
+            self.remove(object_type, merged)
+
+    def apply_events(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            try:
+                self.apply_event(event)
+            except Exception as e:
+                logger.error(f"CRM index update failed for event {event.get('eventId')}: {e}")
+
+    def bootstrap(self, client, limiter=None, page_size: int = 100) -> Dict[str, int]:
+        """Page through every contact and company (email/domain only) and fill the index."""
+        counts = {}
+        for object_type, prop, record in (("contacts", "email", self.record_contacts),
+                                          ("companies", "domain", self.record_companies)):
+            api = getattr(client.crm, object_type).basic_api
+            after, total = None, 0
+            while True:
+                kwargs = {"limit": page_size, "properties": [prop], "archived": False}
+                if after:
+                    kwargs["after"] = after
+                page = limiter.call(api.get_page, **kwargs) if limiter else api.get_page(**kwargs)
+                total += record((obj.id, (obj.properties or {}).get(prop)) for obj in page.results or [])
+                after = page.paging.next.after if page.paging and page.paging.next else None
+                if not after:
+                    break
+            logger.info(f"CRM index: {total} {object_type} indexed")
+            counts[object_type] = total
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            contacts = self._conn.execute("SELECT COUNT(*) FROM hubspot_email_index").fetchone()[0]
+            companies = self._conn.execute("SELECT COUNT(*) FROM hubspot_domain_index").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "contacts": contacts,
+            "companies": companies,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def get_crm_index(config: Dict[str, Any]) -> CRMIndex:
+    """Process-wide index shared by every HubSpotAgent and the webhook handlers."""
+    path = config.get("hubspot_index_db_path", config.get("queue_db_path", "hubspot_automation.db"))
+    return shared_instance("crm_index", path, lambda: CRMIndex(path))
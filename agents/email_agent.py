@@ -1,141 +1,204 @@
-# agents/email_agent.py
-from typing import Dict, Any, List
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.tools import tool
-from langchain.tools import create_openai_tools_agent
-from langchain.agents import AgentExecutor
-from email.message import EmailMessage
-from mailjet_rest import Client
-import smtplib
-import ssl
-from utils import logger, load_config
-from tenacity import retry, stop_after_attempt, wait_exponential
-
-class EmailAgent:
-    """Email Agent: Sends notifications via configurable provider (smtp or mailjet)."""
-    
-    def __init__(self, config: Dict[str, str]):
-        # Use Gemini (ChatGoogleGenerativeAI) for all agent LLM calls
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.get("gemini_model", "gemini-2.5-flash"),
-            google_api_key=config['gemini_api_key'],
-            temperature=float(config.get("gemini_temperature", 0.0))
-        )
-        self.provider = config.get("email_provider", "smtp").lower()  # "smtp" or "mailjet"
-        self.config = config
-        self.sender = config.get('sender_email')
-        self.tools = self._define_tools()
-        self.agent = self._build_agent()
-    
-    def _send_via_smtp(self, to_email: str, subject: str, body: str) -> Dict[str, Any]:
-        """Send email using SMTP. Expects SMTP creds in config:
-           smtp_host, smtp_port (int), smtp_username, smtp_password, smtp_use_tls (bool)
-        """
-        try:
-            msg = EmailMessage()
-            msg["From"] = self.sender
-            msg["To"] = to_email
-            msg["Subject"] = subject
-            msg.set_content(body)
-            msg.add_alternative(body, subtype="html")
-
-            host = self.config.get("smtp_host")
-            port = int(self.config.get("smtp_port", 587))
-            username = self.config.get("smtp_username")
-            password = self.config.get("smtp_password")
-            use_tls = self.config.get("smtp_use_tls", "true").lower() in ("1", "true", "yes")
-
-            if use_tls:
-                context = ssl.create_default_context()
-                with smtplib.SMTP(host, port, timeout=30) as server:
-                    server.starttls(context=context)
-                    if username and password:
-                        server.login(username, password)
-                    server.send_message(msg)
-            else:
-                with smtplib.SMTP_SSL(host, port, timeout=30) as server:
-                    if username and password:
-                        server.login(username, password)
-                    server.send_message(msg)
-
-            logger.info(f"SMTP: Email sent to {to_email}")
-            return {"success": True}
-        except Exception as e:
-            logger.error(f"SMTP send failed: {e}")
-            return {"success": False, "error": str(e)}
-    
-    def _send_via_mailjet(self, to_email: str, subject: str, body: str) -> Dict[str, Any]:
-        """Send email using Mailjet API. Expects mailjet_api_key and mailjet_api_secret in config."""
-        try:
-            api_key = self.config.get("mailjet_api_key")
-            api_secret = self.config.get("mailjet_api_secret")
-            
-            if not api_key or not api_secret:
-                raise ValueError("Mailjet config missing (mailjet_api_key/mailjet_api_secret)")
-            
-            mailjet = Client(auth=(api_key, api_secret), version='v3.1')
-            
-            data = {
-                'Messages': [
-                    {
-                        "From": {
-                            "Email": self.sender,
-                            "Name": "HubSpot Automation"
-                        },
-                        "To": [
-                            {
-                                "Email": to_email
-                            }
-                        ],
-                        "Subject": subject,
-                        "HTMLPart": body
-                    }
-                ]
-            }
-            
-            result = mailjet.send.create(data=data)
-            
-            if result.status_code in (200, 201):
-                logger.info(f"Mailjet: Email sent to {to_email}")
-                return {"success": True}
-            else:
-                raise ValueError(f"Mailjet error: {result.status_code} {result.json()}")
-                
-        except Exception as e:
-            logger.error(f"Mailjet send failed: {e}")
-            return {"success": False, "error": str(e)}
-
-    def _define_tools(self) -> List:
-        @tool
-        @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-        def send_notification(to_email: str, subject: str, body: str) -> Dict[str, Any]:
-            """Send email notification (tool wrapper)."""
-            if self.provider == "mailjet":
-                return self._send_via_mailjet(to_email, subject, body)
-            else:
-                return self._send_via_smtp(to_email, subject, body)
-        
-        return [send_notification]
-    
-    def _build_agent(self):
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are an email agent. Use tools to send notifications based on action results."),
-            ("human", "{input}"),
-            ("placeholder", "{agent_scratchpad}"),
-        ])
-        agent = create_openai_tools_agent(self.llm, self.tools, prompt)
-        return AgentExecutor(agent=agent, tools=self.tools, verbose=True, handle_parsing_errors=True)
-    
-    def run(self, to_email: str, action_result: Dict[str, Any]) -> Dict[str, Any]:
-        """Run email agent to send confirmation."""
-        try:
-            subject = "HubSpot Action Confirmation"
-            body = f"<pre>Action completed: {action_result}</pre>"
-            input_data = f"Send email to {to_email} with subject '{subject}' and body '{body}'"
-            result = self.agent.invoke({"input": input_data})
-            logger.info(f"Email result: {result}")
-            return result.get('output', {})
-        except Exception as e:
-            logger.error(f"Email run failed: {str(e)}")
+# agents/email_agent.py
+from typing import Dict, Any, List
+from langchain_core.tools import tool
+from email.message import EmailMessage
+from mailjet_rest import Client
+import asyncio
+import functools
+import threading
+from utils import logger, load_config
+from metrics import external_call, RETRIES
+from agents.email_templates import render_notification
+from agents.smtp_pool import get_smtp_pool
+from agents.mailjet_batcher import MailjetBatcher, MAX_MESSAGES_PER_CALL
+from agents.llm_usage import LLMUsageCallback
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+class EmailAgent:
+    """Email Agent: Sends notifications via configurable provider (smtp or mailjet)."""
+    
+    def __init__(self, config: Dict[str, str]):
+        # Checked here although the Gemini client is built on first use (see llm)
+        self.gemini_api_key = config['gemini_api_key']
+        self.provider = config.get("email_provider", "smtp").lower()  # "smtp" or "mailjet"
+        self.config = config
+        self.sender = config.get('sender_email')
+        # "direct" renders templates and sends without the LLM; "agent" asks Gemini to call the tool
+        self.send_mode = config.get("email_send_mode", "direct").lower()
+        self._mailjet = None
+        self._batcher = None
+        self._mailjet_lock = threading.Lock()
+        self.tools = self._define_tools()
+    
+    @functools.cached_property
+    def llm(self):
+        # Use Gemini (ChatGoogleGenerativeAI) for all agent LLM calls; only "agent" send mode needs it
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=self.config.get("gemini_model", "gemini-2.5-flash"),
+            google_api_key=self.gemini_api_key,
+            temperature=float(self.config.get("gemini_temperature", 0.0)),
+            callbacks=[LLMUsageCallback("email")]
+        )
+    
+    @functools.cached_property
+    def agent(self):
+        return self._build_agent()
+    
+    def _send_via_smtp(self, to_email: str, subject: str, body: str, text_body: str = None) -> Dict[str, Any]:
+        """Send email using SMTP. Expects SMTP creds in config:
+           smtp_host, smtp_port (int), smtp_username, smtp_password, smtp_use_tls (bool)
+           Sessions come from a shared pool unless smtp_pool_enabled is false.
+        """
+        try:
+            msg = EmailMessage()
+            msg["From"] = self.sender
+            msg["To"] = to_email
+            msg["Subject"] = subject
+            msg.set_content(text_body or body)
+            msg.add_alternative(body, subtype="html")
+
+            with external_call("smtp", "send"):
+                if str(self.config.get("smtp_pool_enabled", "true")).lower() in ("1", "true", "yes"):
+                    # Reuse an authenticated session instead of connect/STARTTLS/login per email
+                    get_smtp_pool(self.config).send_message(msg)
+                else:
+                    with get_smtp_pool(self.config).connect() as server:
+                        server.send_message(msg)
+
+            logger.info(f"SMTP: Email sent to {to_email}")
+            return {"success": True}
+        except Exception as e:
+            logger.error(f"SMTP send failed: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def _mailjet_client(self) -> Client:
+        """Client shared by every send of this agent, so its HTTP session stays alive between emails."""
+        with self._mailjet_lock:
+            if self._mailjet is None:
+                api_key = self.config.get("mailjet_api_key")
+                api_secret = self.config.get("mailjet_api_secret")
+                
+                if not api_key or not api_secret:
+                    raise ValueError("Mailjet config missing (mailjet_api_key/mailjet_api_secret)")
+                
+                kwargs = {"api_url": self.config["mailjet_api_url"]} if self.config.get("mailjet_api_url") else {}
+                self._mailjet = Client(auth=(api_key, api_secret), version='v3.1', **kwargs)
+            return self._mailjet
+    
+    def _mailjet_batcher(self) -> MailjetBatcher:
+        client = self._mailjet_client()
+        with self._mailjet_lock:
+            if self._batcher is None:
+                self._batcher = MailjetBatcher(
+                    client,
+                    window=float(self.config.get("mailjet_batch_window", 0.05)),
+                    max_batch=int(self.config.get("mailjet_batch_size", MAX_MESSAGES_PER_CALL)),
+                )
+            return self._batcher
+    
+    def _send_via_mailjet(self, to_email: str, subject: str, body: str, text_body: str = None) -> Dict[str, Any]:
+        """Send email using Mailjet API. Expects mailjet_api_key and mailjet_api_secret in config.
+           Unless mailjet_batching is false, concurrent sends share one v3.1 call (up to 50 messages).
+        """
+        try:
+            message = {
+                "From": {
+                    "Email": self.sender,
+                    "Name": "HubSpot Automation"
+                },
+                "To": [
+                    {
+                        "Email": to_email
+                    }
+                ],
+                "Subject": subject,
+                "HTMLPart": body
+            }
+            if text_body:
+                message["TextPart"] = text_body
+            
+            if str(self.config.get("mailjet_batching", "true")).lower() in ("1", "true", "yes"):
+                result = self._mailjet_batcher().send(message)
+                if not result.get("success"):
+                    raise ValueError(f"Mailjet error: {result.get('error')}")
+                logger.info(f"Mailjet: Email sent to {to_email}")
+                return {"success": True}
+            
+            with external_call("mailjet", "send"):
+                result = self._mailjet_client().send.create(data={'Messages': [message]})
+            
+            if result.status_code in (200, 201):
+                logger.info(f"Mailjet: Email sent to {to_email}")
+                return {"success": True}
+            else:
+                raise ValueError(f"Mailjet error: {result.status_code} {result.json()}")
+                
+        except Exception as e:
+            logger.error(f"Mailjet send failed: {e}")
+            return {"success": False, "error": str(e)}
+
+    def _send(self, to_email: str, subject: str, body: str, text_body: str = None) -> Dict[str, Any]:
+        """Send through the configured provider."""
+        if self.provider == "mailjet":
+            return self._send_via_mailjet(to_email, subject, body, text_body)
+        return self._send_via_smtp(to_email, subject, body, text_body)
+    
+    def send_direct(self, to_email: str, action_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Render the notification templates and send without an LLM round trip."""
+        subject, html, text = render_notification(action_result)
+        result = self._send(to_email, subject, html, text)
+        logger.info(f"Email result: {result}")
+        return result
+
+    def _define_tools(self) -> List:
+        @tool
+        @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+               before_sleep=lambda retry_state: RETRIES.inc(component="email_tool"))
+        def send_notification(to_email: str, subject: str, body: str) -> Dict[str, Any]:
+            """Send email notification (tool wrapper)."""
+            return self._send(to_email, subject, body)
+        
+        return [send_notification]
+    
+    def _build_agent(self):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain.tools import create_openai_tools_agent
+        from langchain.agents import AgentExecutor
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are an email agent. Use tools to send notifications based on action results."),
+            ("human", "{input}"),
+            ("placeholder", "{agent_scratchpad}"),
+        ])
+        agent = create_openai_tools_agent(self.llm, self.tools, prompt)
+        return AgentExecutor(agent=agent, tools=self.tools, verbose=True, handle_parsing_errors=True)
+    
+    def run(self, to_email: str, action_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Run email agent to send confirmation."""
+        try:
+            if self.send_mode == "direct":
+                return self.send_direct(to_email, action_result)
+            subject = "HubSpot Action Confirmation"
+            body = f"<pre>Action completed: {action_result}</pre>"
+            input_data = f"Send email to {to_email} with subject '{subject}' and body '{body}'"
+            result = self.agent.invoke({"input": input_data})
+            logger.info(f"Email result: {result}")
+            return result.get('output', {})
+        except Exception as e:
+            logger.error(f"Email run failed: {str(e)}")
+            raise
+    
+    async def arun(self, to_email: str, action_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of run; awaits the agent instead of blocking the event loop."""
+        try:
+            if self.send_mode == "direct":
+                return await asyncio.to_thread(self.send_direct, to_email, action_result)
+            subject = "HubSpot Action Confirmation"
+            body = f"<pre>Action completed: {action_result}</pre>"
+            input_data = f"Send email to {to_email} with subject '{subject}' and body '{body}'"
+            result = await self.agent.ainvoke({"input": input_data})
+            logger.info(f"Email result: {result}")
+            return result.get('output', {})
+        except Exception as e:
+            logger.error(f"Email run failed: {str(e)}")
             raise
\ No newline at end of file
@@ -0,0 +1,32 @@
+# agents/email_templates.py
+from html import escape
+from string import Template
+from typing import Dict, Any, Tuple
+
+# Compiled once at import; rendering is a dict lookup and string substitution per email
+SUBJECT_TEMPLATE = Template("HubSpot Action Confirmation: $action")
+HTML_TEMPLATE = Template(
+    "<html><body>"
+    "<p>Action completed: <strong>$action</strong></p>"
+    "<p>Record ID: $record_id</p>"
+    "<table>$rows</table>"
+    "</body></html>"
+)
+HTML_ROW_TEMPLATE = Template("<tr><td>$name</td><td>$value</td></tr>")
+TEXT_TEMPLATE = Template("Action completed: $action\nRecord ID: $record_id\n$rows")
+TEXT_ROW_TEMPLATE = Template("$name: $value")
+
+def render_notification(action_result: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Render (subject, html, text) for a HubSpot action result."""
+    action = str(action_result.get('action') or ("success" if action_result.get('success') else "failed"))
+    record_id = str(action_result.get('id', 'n/a'))
+    details = action_result.get('details') or {}
+    if not isinstance(details, dict):
+        details = {"details": details}
+    items = [(str(name), "" if value is None else str(value)) for name, value in sorted(details.items())]
+    html_rows = "".join(HTML_ROW_TEMPLATE.substitute(name=escape(name), value=escape(value)) for name, value in items)
+    text_rows = "\n".join(TEXT_ROW_TEMPLATE.substitute(name=name, value=value) for name, value in items)
+    subject = SUBJECT_TEMPLATE.substitute(action=action)
+    html = HTML_TEMPLATE.substitute(action=escape(action), record_id=escape(record_id), rows=html_rows)
+    text = TEXT_TEMPLATE.substitute(action=action, record_id=record_id, rows=text_rows)
+    return subject, html, text
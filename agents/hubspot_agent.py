@@ -1,121 +1,293 @@
-# agents/hubspot_agent.py
-from typing import Dict, Any, List
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.tools import tool
-from langchain.agents import create_openai_tools_agent, AgentExecutor
-from hubspot import HubSpot
-from hubspot.crm.contacts import SimplePublicObjectInputForCreate
-from hubspot.crm.companies import SimplePublicObjectInputForCreate as CompanyInputForCreate
-from hubspot.crm.deals import SimplePublicObjectInputForCreate as DealInputForCreate
-from utils import logger, load_config
-from tenacity import retry, stop_after_attempt, wait_exponential
-
-class HubSpotAgent:
-    """HubSpot Agent: Performs CRM operations via tools."""
-    
-    def __init__(self, config: Dict[str, str]):
-        # Use Gemini for HubSpot agent as well
-        self.llm = ChatGoogleGenerativeAI(
-            model=config.get("gemini_model", "gemini-2.5-flash"),
-            google_api_key=config['gemini_api_key'],
-            temperature=float(config.get("gemini_temperature", 0.0))
-        )
-        self.client = HubSpot(api_key=config['hubspot_api_key'])
-        self.tools = self._define_tools()
-        self.agent = self._build_agent()
-    
-    def _define_tools(self) -> List:
-        @tool
-        @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-        def create_contact(payload: Dict[str, Any]) -> Dict[str, Any]:
-            """Create a new contact in HubSpot."""
-            try:
-                properties = payload.get('properties', {})
-                contact_input = SimplePublicObjectInputForCreate(properties=properties)
-                response = self.client.crm.contacts.basic_api.create(contact_input)
-                logger.info(f"Contact created: {response.id}")
-                return {"success": True, "id": response.id, "details": response.properties}
-            except Exception as e:
-                logger.error(f"Create contact failed: {str(e)}")
-                return {"success": False, "error": str(e)}
-        
-        @tool
-        @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-        def update_contact(payload: Dict[str, Any]) -> Dict[str, Any]:
-            """Update an existing contact."""
-            try:
-                contact_id = payload.get('id')
-                properties = payload.get('properties', {})
-                response = self.client.crm.contacts.basic_api.update(contact_id, {"properties": properties})
-                logger.info(f"Contact updated: {contact_id}")
-                return {"success": True, "id": contact_id, "details": response.properties}
-            except Exception as e:
-                logger.error(f"Update contact failed: {str(e)}")
-                return {"success": False, "error": str(e)}
-        
-        @tool
-        @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-        def create_deal(payload: Dict[str, Any]) -> Dict[str, Any]:
-            """Create a new deal."""
-            try:
-                properties = payload.get('properties', {})
-                deal_input = DealInputForCreate(properties=properties)
-                response = self.client.crm.deals.basic_api.create(deal_input)
-                logger.info(f"Deal created: {response.id}")
-                return {"success": True, "id": response.id, "details": response.properties}
-            except Exception as e:
-                logger.error(f"Create deal failed: {str(e)}")
-                return {"success": False, "error": str(e)}
-        
-        @tool
-        @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-        def update_deal(payload: Dict[str, Any]) -> Dict[str, Any]:
-            """Update an existing deal."""
-            try:
-                deal_id = payload.get('id')
-                properties = payload.get('properties', {})
-                response = self.client.crm.deals.basic_api.update(deal_id, {"properties": properties})
-                logger.info(f"Deal updated: {deal_id}")
-                return {"success": True, "id": deal_id, "details": response.properties}
-            except Exception as e:
-                logger.error(f"Update deal failed: {str(e)}")
-                return {"success": False, "error": str(e)}
-        
-        @tool
-        @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-        def create_company(payload: Dict[str, Any]) -> Dict[str, Any]:
-            """Create a new company."""
-            try:
-                properties = payload.get('properties', {})
-                company_input = CompanyInputForCreate(properties=properties)
-                response = self.client.crm.companies.basic_api.create(company_input)
-                logger.info(f"Company created: {response.id}")
-                return {"success": True, "id": response.id, "details": response.properties}
-            except Exception as e:
-                logger.error(f"Create company failed: {str(e)}")
-                return {"success": False, "error": str(e)}
-        
-        # Add more tools for edit_deal, etc., similarly
-        
-        return [create_contact, update_contact, create_deal, update_deal, create_company]
-    
-    def _build_agent(self):
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a HubSpot CRM agent. Use tools to perform operations based on intent and payload."),
-            ("human", "{input}"),
-            ("placeholder", "{agent_scratchpad}"),
-        ])
-        agent = create_openai_tools_agent(self.llm, self.tools, prompt)
-        return AgentExecutor(agent=agent, tools=self.tools, verbose=True, handle_parsing_errors=True)
-    
-    def run(self, intent: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """Run HubSpot agent with intent and payload."""
-        try:
-            input_data = f"Perform {intent} with payload: {payload}"
-            result = self.agent.invoke({"input": input_data})
-            logger.info(f"HubSpot result: {result}")
-            return result['output']
-        except Exception as e:
-            logger.error(f"HubSpot run failed: {str(e)}")
+# agents/hubspot_agent.py
+import functools
+from typing import Dict, Any, List
+from langchain_core.tools import tool
+from hubspot import HubSpot
+from hubspot.crm.contacts import SimplePublicObjectInputForCreate
+from hubspot.crm.companies import SimplePublicObjectInputForCreate as CompanyInputForCreate
+from hubspot.crm.deals import SimplePublicObjectInputForCreate as DealInputForCreate
+from utils import logger, load_config, open_optional
+from agents.hubspot_batcher import HubSpotBatchWriter, MAX_INPUTS_PER_CALL
+from agents.rate_limiter import get_rate_limiter
+from agents.object_cache import get_object_cache
+from agents.crm_index import get_crm_index, existing_id_from_error
+from agents.llm_usage import LLMUsageCallback
+
+class HubSpotAgent:
+    """HubSpot Agent: Performs CRM operations via tools."""
+    
+    def __init__(self, config: Dict[str, str]):
+        # Gemini and the AgentExecutor are only built if a run needs the agent (see llm/agent)
+        self.config = config
+        self.gemini_api_key = config['gemini_api_key']
+        # hubspot_api_url overrides the API host (e.g. a local emulator for benchmarks)
+        self.client = HubSpot(api_key=config['hubspot_api_key'], host=config.get("hubspot_api_url"))
+        # "direct" calls the tool named by the intent; "agent" always goes through the LLM
+        self.dispatch_mode = config.get("hubspot_dispatch_mode", "direct").lower()
+        # Every call is paced by a limiter shared across agents (and processes with the sqlite backend);
+        # it retries 429/5xx only, honouring Retry-After
+        self.limiter = get_rate_limiter(config)
+        # Object properties seen in reads and write responses (config: hubspot_cache_enabled)
+        self.cache = None
+        if str(config.get("hubspot_cache_enabled", "true")).lower() in ("1", "true", "yes"):
+            self.cache = open_optional("HubSpot object cache", lambda: get_object_cache(config))
+        # Email -> contact id and domain -> company id, so create_contact can upsert (config: hubspot_index_enabled)
+        self.index = None
+        if str(config.get("hubspot_index_enabled", "true")).lower() in ("1", "true", "yes"):
+            self.index = open_optional("CRM index", lambda: get_crm_index(config))
+        # Send only properties that differ from the cached snapshot (config: hubspot_update_diffing)
+        self.update_diffing = str(config.get("hubspot_update_diffing", "false")).lower() in ("1", "true", "yes")
+        # Concurrent creates/updates share batch_api calls unless hubspot_batching is false
+        self.batch_writer = None
+        if str(config.get("hubspot_batching", "true")).lower() in ("1", "true", "yes"):
+            self.batch_writer = HubSpotBatchWriter(
+                self.client,
+                window=float(config.get("hubspot_batch_window", 0.05)),
+                max_batch=int(config.get("hubspot_batch_size", MAX_INPUTS_PER_CALL)),
+                limiter=self.limiter,
+            )
+        self.tools = self._define_tools()
+        self.tool_map = {t.name: t for t in self.tools}
+    
+    @functools.cached_property
+    def llm(self):
+        # Use Gemini for HubSpot agent as well
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=self.config.get("gemini_model", "gemini-2.5-flash"),
+            google_api_key=self.gemini_api_key,
+            temperature=float(self.config.get("gemini_temperature", 0.0)),
+            callbacks=[LLMUsageCallback("hubspot")]
+        )
+    
+    @functools.cached_property
+    def agent(self):
+        return self._build_agent()
+    
+    def _cached(self, object_type: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Record the properties a successful write returned (cache and index), then pass the result through."""
+        if result.get("success") and isinstance(result.get("details"), dict):
+            if self.cache:
+                self.cache.put(object_type, result.get("id"), result["details"])
+            # An empty email or domain drops the old mapping
+            if self.index and object_type == "contacts" and "email" in result["details"]:
+                self.index.record_contact(result.get("id"), result["details"]["email"])
+            if self.index and object_type == "companies" and "domain" in result["details"]:
+                self.index.record_company(result.get("id"), result["details"]["domain"])
+        return result
+    
+    def _changed_properties(self, object_type: str, object_id: str, properties: Dict[str, Any]):
+        """Properties an update actually needs to send; None when the snapshot already matches."""
+        if not (self.update_diffing and self.cache and object_id and properties):
+            return properties
+        try:
+            # The cached snapshot, or on a miss one read from HubSpot (and cached for the next update)
+            snapshot = self.get_object(object_type, object_id, list(properties))
+        except Exception as e:
+            logger.warning(f"Could not read {object_type} {object_id} to diff the update: {e}")
+            return properties
+        return self.cache.changes(snapshot, properties) or None
+    
+    def get_object(self, object_type: str, object_id: str, properties: List[str] = None) -> Dict[str, Any]:
+        """Current properties of a contact, company or deal, served from the cache when possible."""
+        if self.cache:
+            cached = self.cache.get(object_type, object_id, properties)
+            if cached is not None:
+                return cached
+        api = getattr(self.client.crm, object_type)
+        response = self.limiter.call(api.basic_api.get_by_id, object_id, properties=properties)
+        if self.cache:
+            self.cache.put(object_type, object_id, response.properties)
+        return response.properties or {}
+    
+    def _update_company(self, company_id: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+        """Update an existing company; create_company upserts through this for a known domain."""
+        changed = self._changed_properties("companies", company_id, properties)
+        if changed is None:
+            logger.info(f"Company {company_id} unchanged; update skipped")
+            return {"success": True, "id": company_id, "details": properties, "skipped": True}
+        if self.batch_writer:
+            result = self.batch_writer.update("companies", company_id, changed)
+            if result["success"]:
+                logger.info(f"Company updated: {result['id']}")
+            return self._cached("companies", result)
+        response = self.limiter.call(self.client.crm.companies.basic_api.update, company_id, {"properties": changed})
+        logger.info(f"Company updated: {company_id}")
+        return self._cached("companies", {"success": True, "id": company_id, "details": response.properties})
+    
+    def _define_tools(self) -> List:
+        @tool
+        def create_contact(payload: Dict[str, Any]) -> Dict[str, Any]:
+            """Create a new contact in HubSpot (updates the existing contact if the email is known)."""
+            try:
+                properties = payload.get('properties', {})
+                existing_id = self.index.contact_id_for(properties.get('email')) if self.index else None
+                if existing_id:
+                    logger.info(f"Contact {existing_id} already has this email; updating instead of creating")
+                    return {**update_contact.invoke({"payload": {"id": existing_id, "properties": properties}}), "upserted": True}
+                if self.batch_writer:
+                    result = self.batch_writer.create("contacts", properties)
+                else:
+                    try:
+                        contact_input = SimplePublicObjectInputForCreate(properties=properties)
+                        response = self.limiter.call(self.client.crm.contacts.basic_api.create, contact_input)
+                        result = {"success": True, "id": response.id, "details": response.properties}
+                    except Exception as e:
+                        result = {"success": False, "error": str(e)}
+                existing_id = None if result["success"] else existing_id_from_error(result.get("error"))
+                if existing_id and self.index:
+                    # The index missed this contact; learn it and update instead
+                    self.index.record_contact(existing_id, properties.get('email'))
+                    logger.info(f"Contact {existing_id} already has this email; updating instead of creating")
+                    return {**update_contact.invoke({"payload": {"id": existing_id, "properties": properties}}), "upserted": True}
+                if not result["success"]:
+                    logger.error(f"Create contact failed: {result.get('error')}")
+                    return result
+                logger.info(f"Contact created: {result['id']}")
+                return self._cached("contacts", result)
+            except Exception as e:
+                logger.error(f"Create contact failed: {str(e)}")
+                return {"success": False, "error": str(e)}
+        
+        @tool
+        def update_contact(payload: Dict[str, Any]) -> Dict[str, Any]:
+            """Update an existing contact."""
+            try:
+                contact_id = payload.get('id')
+                properties = payload.get('properties', {})
+                changed = self._changed_properties("contacts", contact_id, properties)
+                if changed is None:
+                    logger.info(f"Contact {contact_id} unchanged; update skipped")
+                    return {"success": True, "id": contact_id, "details": properties, "skipped": True}
+                properties = changed
+                if self.batch_writer:
+                    result = self.batch_writer.update("contacts", contact_id, properties)
+                    if result["success"]:
+                        logger.info(f"Contact updated: {result['id']}")
+                    return self._cached("contacts", result)
+                response = self.limiter.call(self.client.crm.contacts.basic_api.update, contact_id, {"properties": properties})
+                logger.info(f"Contact updated: {contact_id}")
+                return self._cached("contacts", {"success": True, "id": contact_id, "details": response.properties})
+            except Exception as e:
+                logger.error(f"Update contact failed: {str(e)}")
+                return {"success": False, "error": str(e)}
+        
+        @tool
+        def create_deal(payload: Dict[str, Any]) -> Dict[str, Any]:
+            """Create a new deal."""
+            try:
+                properties = payload.get('properties', {})
+                if self.batch_writer:
+                    result = self.batch_writer.create("deals", properties)
+                    if result["success"]:
+                        logger.info(f"Deal created: {result['id']}")
+                    return self._cached("deals", result)
+                deal_input = DealInputForCreate(properties=properties)
+                response = self.limiter.call(self.client.crm.deals.basic_api.create, deal_input)
+                logger.info(f"Deal created: {response.id}")
+                return self._cached("deals", {"success": True, "id": response.id, "details": response.properties})
+            except Exception as e:
+                logger.error(f"Create deal failed: {str(e)}")
+                return {"success": False, "error": str(e)}
+        
+        @tool
+        def update_deal(payload: Dict[str, Any]) -> Dict[str, Any]:
+            """Update an existing deal."""
+            try:
+                deal_id = payload.get('id')
+                properties = payload.get('properties', {})
+                changed = self._changed_properties("deals", deal_id, properties)
+                if changed is None:
+                    logger.info(f"Deal {deal_id} unchanged; update skipped")
+                    return {"success": True, "id": deal_id, "details": properties, "skipped": True}
+                properties = changed
+                if self.batch_writer:
+                    result = self.batch_writer.update("deals", deal_id, properties)
+                    if result["success"]:
+                        logger.info(f"Deal updated: {result['id']}")
+                    return self._cached("deals", result)
+                response = self.limiter.call(self.client.crm.deals.basic_api.update, deal_id, {"properties": properties})
+                logger.info(f"Deal updated: {deal_id}")
+                return self._cached("deals", {"success": True, "id": deal_id, "details": response.properties})
+            except Exception as e:
+                logger.error(f"Update deal failed: {str(e)}")
+                return {"success": False, "error": str(e)}
+        
+        @tool
+        def create_company(payload: Dict[str, Any]) -> Dict[str, Any]:
+            """Create a new company (updates the existing company if the domain is known)."""
+            try:
+                properties = payload.get('properties', {})
+                existing_id = self.index.company_id_for(properties.get('domain')) if self.index else None
+                if existing_id:
+                    logger.info(f"Company {existing_id} already has this domain; updating instead of creating")
+                    return {**self._update_company(existing_id, properties), "upserted": True}
+                if self.batch_writer:
+                    result = self.batch_writer.create("companies", properties)
+                    if result["success"]:
+                        logger.info(f"Company created: {result['id']}")
+                    return self._cached("companies", result)
+                company_input = CompanyInputForCreate(properties=properties)
+                response = self.limiter.call(self.client.crm.companies.basic_api.create, company_input)
+                logger.info(f"Company created: {response.id}")
+                return self._cached("companies", {"success": True, "id": response.id, "details": response.properties})
+            except Exception as e:
+                logger.error(f"Create company failed: {str(e)}")
+                return {"success": False, "error": str(e)}
+        
+        # Add more tools for edit_deal, etc., similarly
+        
+        return [create_contact, update_contact, create_deal, update_deal, create_company]
+    
+    def _build_agent(self):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain.agents import create_openai_tools_agent, AgentExecutor
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are a HubSpot CRM agent. Use tools to perform operations based on intent and payload."),
+            ("human", "{input}"),
+            ("placeholder", "{agent_scratchpad}"),
+        ])
+        agent = create_openai_tools_agent(self.llm, self.tools, prompt)
+        return AgentExecutor(agent=agent, tools=self.tools, verbose=True, handle_parsing_errors=True)
+    
+    def _direct_tool(self, intent: str, payload: Dict[str, Any]):
+        """Tool to call without the LLM, or None when the input is ambiguous and needs the agent."""
+        if self.dispatch_mode != "direct" or intent not in self.tool_map:
+            return None
+        if not isinstance(payload, dict) or not isinstance(payload.get('properties', {}), dict):
+            return None
+        if intent.startswith("update_") and not payload.get('id'):
+            return None
+        return self.tool_map[intent]
+    
+    def run(self, intent: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Run HubSpot agent with intent and payload."""
+        try:
+            tool = self._direct_tool(intent, payload)
+            if tool:
+                result = tool.invoke({"payload": payload})
+                logger.info(f"HubSpot direct {intent} result: {result}")
+                return result
+            input_data = f"Perform {intent} with payload: {payload}"
+            result = self.agent.invoke({"input": input_data})
+            logger.info(f"HubSpot result: {result}")
+            return result['output']
+        except Exception as e:
+            logger.error(f"HubSpot run failed: {str(e)}")
+            raise
+    
+    async def arun(self, intent: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of run; awaits the agent instead of blocking the event loop."""
+        try:
+            tool = self._direct_tool(intent, payload)
+            if tool:
+                result = await tool.ainvoke({"payload": payload})
+                logger.info(f"HubSpot direct {intent} result: {result}")
+                return result
+            input_data = f"Perform {intent} with payload: {payload}"
+            result = await self.agent.ainvoke({"input": input_data})
+            logger.info(f"HubSpot result: {result}")
+            return result['output']
+        except Exception as e:
+            logger.error(f"HubSpot run failed: {str(e)}")
             raise
\ No newline at end of file
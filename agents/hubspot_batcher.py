@@ -0,0 +1,174 @@
+# agents/hubspot_batcher.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional
+from hubspot.crm import contacts, companies, deals
+from utils import logger
+
+# HubSpot CRM batch endpoints accept at most 100 inputs per request
+MAX_INPUTS_PER_CALL = 100
+
+# SDK model modules per object type; the input classes have the same names in each
+_MODELS = {"contacts": contacts, "companies": companies, "deals": deals}
+
+class HubSpotBatchWriter:
+    """Micro-batches CRM creates and updates through the batch_api endpoints.
+
+    Each (object type, operation) pair has its own lane. A lane collects requests
+    for `window` seconds after the first one (or until 100 are queued) and sends
+    them in one call while the next batch gathers. Every caller's future resolves
+    with its own result, shaped like the single-object tools return.
+    """
+
+    def __init__(self, client, window: float = 0.05, max_batch: int = MAX_INPUTS_PER_CALL, limiter=None):
+        self.client = client
+        self.limiter = limiter
+        self.window = window
+        self.max_batch = min(max_batch, MAX_INPUTS_PER_CALL)
+        self._lanes: Dict[tuple, "queue.Queue[tuple]"] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.inputs = 0
+        self.fallbacks = 0
+
+    def submit(self, object_type: str, operation: str, properties: Dict[str, Any],
+               object_id: Optional[str] = None) -> Future:
+        """Queue one create or update; the future resolves to {"success": ..., ...}."""
+        if object_type not in _MODELS or operation not in ("create", "update"):
+            raise ValueError(f"Unsupported batch write: {operation} {object_type}")
+        future: Future = Future()
+        self._lane(object_type, operation).put((properties, object_id, future))
+        return future
+
+    def create(self, object_type: str, properties: Dict[str, Any], timeout: float = 60.0) -> Dict[str, Any]:
+        return self.submit(object_type, "create", properties).result(timeout=timeout)
+
+    def update(self, object_type: str, object_id: str, properties: Dict[str, Any],
+               timeout: float = 60.0) -> Dict[str, Any]:
+        return self.submit(object_type, "update", properties, str(object_id)).result(timeout=timeout)
+
+    def _lane(self, object_type: str, operation: str) -> "queue.Queue[tuple]":
+        key = (object_type, operation)
+        with self._lock:
+            if key not in self._lanes:
+                self._lanes[key] = queue.Queue()
+                threading.Thread(target=self._collect, args=(object_type, operation, self._lanes[key]),
+                                 name=f"hubspot-batch-{operation}-{object_type}", daemon=True).start()
+            return self._lanes[key]
+
+    def _collect(self, object_type: str, operation: str, lane: "queue.Queue[tuple]") -> None:
+        # Flushing on the collector thread keeps writes to one lane in submission order
+        while True:
+            batch = [lane.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(lane.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._flush(object_type, operation, batch)
+            except Exception as e:
+                logger.error(f"HubSpot batch {operation} {object_type} failed: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_result({"success": False, "error": str(e)})
+
+    def _call(self, fn, *args):
+        """Go through the shared rate limiter when one is configured."""
+        return self.limiter.call(fn, *args) if self.limiter else fn(*args)
+
+    def _flush(self, object_type: str, operation: str, batch: List[tuple]) -> None:
+        if operation == "create":
+            self._send(object_type, operation, batch)
+            return
+        # The batch update endpoint rejects repeated ids, so later writes to an id go in a later call
+        while batch:
+            seen, chunk, rest = set(), [], []
+            for item in batch:
+                (rest if item[1] in seen else chunk).append(item)
+                seen.add(item[1])
+            self._send(object_type, operation, chunk)
+            batch = rest
+
+    def _send(self, object_type: str, operation: str, batch: List[tuple]) -> None:
+        api = getattr(self.client.crm, object_type)
+        models = _MODELS[object_type]
+        with self._lock:
+            self.calls += 1
+            self.inputs += len(batch)
+        try:
+            if operation == "create":
+                inputs = [models.SimplePublicObjectBatchInputForCreate(properties=properties, object_write_trace_id=str(i))
+                          for i, (properties, _, _) in enumerate(batch)]
+                response = self._call(api.batch_api.create, models.BatchInputSimplePublicObjectBatchInputForCreate(inputs=inputs))
+            else:
+                inputs = [models.SimplePublicObjectBatchInput(id=object_id, properties=properties)
+                          for properties, object_id, _ in batch]
+                response = self._call(api.batch_api.update, models.BatchInputSimplePublicObjectBatchInput(inputs=inputs))
+        except Exception as e:
+            if getattr(e, "status", None) in (400, 409) and len(batch) > 1:
+                # One invalid input rejects the whole call; retry individually so the others still land
+                logger.warning(f"HubSpot batch {operation} {object_type} rejected ({e.status}); sending {len(batch)} inputs one by one")
+                self._send_individually(api, models, operation, batch)
+                return
+            logger.error(f"HubSpot batch {operation} {object_type} failed: {e}")
+            for _, _, future in batch:
+                future.set_result({"success": False, "error": str(e)})
+            return
+        self._resolve(operation, batch, response)
+        logger.info(f"HubSpot: batch {operation} of {len(batch)} {object_type}")
+
+    def _resolve(self, operation: str, batch: List[tuple], response) -> None:
+        results = list(response.results or [])
+        errors = list(getattr(response, "errors", None) or [])
+        if operation == "create":
+            by_key = {r.object_write_trace_id: r for r in results if r.object_write_trace_id is not None}
+            if not by_key and len(results) == len(batch):
+                by_key = {str(i): r for i, r in enumerate(results)}
+            keys = [str(i) for i in range(len(batch))]
+            context_key = "objectWriteTraceId"
+        else:
+            by_key = {str(r.id): r for r in results}
+            keys = [object_id for _, object_id, _ in batch]
+            context_key = "ids"
+        for key, (_, _, future) in zip(keys, batch):
+            result = by_key.get(key)
+            if result is not None:
+                future.set_result({"success": True, "id": result.id, "details": result.properties})
+                continue
+            error = next((e for e in errors if key in ((e.context or {}).get(context_key) or [])), None)
+            if error is not None:
+                message = error.message
+            else:
+                # Another item's error may have nothing to do with this one, so none is borrowed
+                message = "unmatched batch error" if errors else "missing from batch response"
+            future.set_result({"success": False, "error": message})
+
+    def _send_individually(self, api, models, operation: str, batch: List[tuple]) -> None:
+        with self._lock:
+            self.fallbacks += 1
+            self.calls += len(batch)
+        for properties, object_id, future in batch:
+            try:
+                if operation == "create":
+                    response = self._call(api.basic_api.create, models.SimplePublicObjectInputForCreate(properties=properties))
+                else:
+                    response = self._call(api.basic_api.update, object_id, models.SimplePublicObjectInput(properties=properties))
+                future.set_result({"success": True, "id": response.id, "details": response.properties})
+            except Exception as e:
+                future.set_result({"success": False, "error": str(e)})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "inputs": self.inputs,
+            "inputs_per_call": round(self.inputs / self.calls, 2) if self.calls else 0.0,
+            "fallbacks": self.fallbacks,
+            "queued": sum(lane.qsize() for lane in list(self._lanes.values())),
+        }
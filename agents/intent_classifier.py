@@ -0,0 +1,140 @@
+# agents/intent_classifier.py
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+from agents.intent_schema import ParsedQuery, to_intent_payload, SCHEMA_ERRORS
+
+_TOKEN = re.compile(r"[a-z]+")
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+# Regex slot fillers: property -> patterns whose first group is the value
+_SLOT_PATTERNS = {
+    "email": [r"([\w.+-]+@[\w-]+(?:\.[\w-]+)+)"],
+    "phone": [r"phone(?: number)?(?: to| of| is|:)?\s+(\+?[\d][\d\s().-]{5,}\d)"],
+    "amount": [r"(?:amount|worth|value)(?: of| to| is|:)?\s+\$?([\d,]+(?:\.\d+)?)", r"\$([\d,]+(?:\.\d+)?)"],
+    "dealstage": [r"(?:stage|dealstage)(?: to| is|:)?\s+([\w-]+)"],
+    "domain": [r"domain(?: to| is|:)?\s+((?:[\w-]+\.)+[a-z]{2,})"],
+    "dealname": [r"deal (?:named|called)\s+(.+?)(?:\s+(?:with|worth|for|and|at)\b|$)"],
+    "name": [r"company (?:named|called)\s+(.+?)(?:\s+(?:with|and|at)\b|$)"],
+    "jobtitle": [r"(?:job ?title|title)(?: to| is|:)?\s+(.+?)(?:\s+(?:with|and)\b|$)"],
+}
+_PERSON = re.compile(r"(?:contact|person) (?:for|named|called)\s+([A-Z][\w'-]+)(?:\s+([A-Z][\w'-]+))?")
+_RECORD_ID = re.compile(r"\b(?:id|ID|Id)\s*:?\s*(\d+)|\b(?:contact|deal|company)\s+#?(\d+)\b")
+# Webhook queries list changes as "<property> changed to <value>"
+_CHANGED = re.compile(r"(\w+) changed to ([^,]+)")
+
+def features(query: str) -> List[str]:
+    """Unigram and bigram tokens with emails and numbers collapsed to placeholders."""
+    text = _NUMBER.sub(" num ", _EMAIL.sub(" email ", query.lower()))
+    words = _TOKEN.findall(text)
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+def extract_properties(query: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """Record id and property values a query states, found by regex."""
+    properties: Dict[str, str] = {}
+    for name, patterns in _SLOT_PATTERNS.items():
+        for pattern in patterns:
+            match = re.search(pattern, query, flags=re.IGNORECASE)
+            if match:
+                value = match.group(1).strip().rstrip(".")
+                properties[name] = value.replace(",", "") if name == "amount" else value
+                break
+    person = _PERSON.search(query)
+    if person:
+        properties["firstname"] = person.group(1)
+        if person.group(2):
+            properties["lastname"] = person.group(2)
+    for name, value in _CHANGED.findall(query):
+        properties[name] = value.strip()
+    record = _RECORD_ID.search(query)
+    record_id = (record.group(1) or record.group(2)) if record else None
+    return record_id, properties
+
+class IntentClassifier:
+    """CPU-only intent classifier: TF-IDF features scored against one centroid per intent.
+
+    `parse` adds regex slot filling and returns {'intent', 'payload'} only when the
+    intent is confident and the payload validates against the orchestrator schema;
+    otherwise it returns None and the caller asks the LLM.
+    """
+
+    def __init__(self, idf: Optional[Dict[str, float]] = None, centroids: Optional[Dict[str, Dict[str, float]]] = None,
+                 threshold: float = 0.6, temperature: float = 0.1):
+        self.idf = idf or {}
+        self.centroids = centroids or {}
+        self.threshold = threshold
+        self.temperature = temperature
+
+    def _vector(self, query: str) -> Dict[str, float]:
+        counts = Counter(token for token in features(query) if token in self.idf)
+        vector = {token: count * self.idf[token] for token, count in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {token: v / norm for token, v in vector.items()}
+
+    def train(self, examples: List[Tuple[str, str]]) -> "IntentClassifier":
+        """Fit IDF weights and intent centroids from (query, intent) pairs."""
+        documents = [(set(features(query)), intent) for query, intent in examples]
+        df = Counter(token for tokens, _ in documents for token in tokens)
+        total = len(documents)
+        self.idf = {token: math.log((1 + total) / (1 + count)) + 1 for token, count in df.items()}
+        sums: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for query, intent in examples:
+            for token, value in self._vector(query).items():
+                sums[intent][token] += value
+        self.centroids = {}
+        for intent, vector in sums.items():
+            norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+            self.centroids[intent] = {token: v / norm for token, v in vector.items()}
+        return self
+
+    def predict(self, query: str) -> Tuple[Optional[str], float]:
+        """Best intent and its softmax confidence over cosine similarities."""
+        if not self.centroids:
+            return None, 0.0
+        vector = self._vector(query)
+        scores = {intent: sum(value * centroid.get(token, 0.0) for token, value in vector.items())
+                  for intent, centroid in self.centroids.items()}
+        best = max(scores, key=scores.get)
+        exp = {intent: math.exp((score - scores[best]) / self.temperature) for intent, score in scores.items()}
+        return best, exp[best] / sum(exp.values())
+
+    def parse(self, query: str) -> Optional[Dict[str, Any]]:
+        """{'intent', 'payload'} for a confident, complete parse; None to fall back to the LLM."""
+        intent, confidence = self.predict(query)
+        if intent is None or confidence < self.threshold:
+            return None
+        record_id, properties = extract_properties(query)
+        group = intent.split("_", 1)[1]
+        try:
+            return to_intent_payload(ParsedQuery(intent=intent, id=record_id, **{group: properties}))
+        except SCHEMA_ERRORS:
+            return None
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"idf": self.idf, "centroids": self.centroids, "threshold": self.threshold,
+                       "temperature": self.temperature}, f)
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "IntentClassifier":
+        with open(path) as f:
+            model = json.load(f)
+        return cls(model["idf"], model["centroids"],
+                   threshold if threshold is not None else model.get("threshold", 0.6),
+                   model.get("temperature", 0.1))
+
+def load_examples(path: str) -> List[Dict[str, Any]]:
+    """Logged orchestrator results (JSON lines of query, intent, payload)."""
+    examples = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("query") and record.get("intent"):
+                examples.append(record)
+    return examples
@@ -0,0 +1,76 @@
+# agents/intent_schema.py
+from typing import Dict, Any, List, Optional, Literal
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+# Intents the graph routes to HubSpot; each has a HubSpotAgent tool of the same name
+HUBSPOT_INTENTS = ("create_contact", "update_contact", "create_deal", "update_deal", "create_company")
+
+class _Schema(BaseModel):
+    # HubSpot takes every property as a string; accept numbers (ids, amounts) and convert them
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+# Properties the HubSpot tools accept per object type; anything else is left out of the schema
+class ContactProperties(_Schema):
+    email: Optional[str] = None
+    firstname: Optional[str] = None
+    lastname: Optional[str] = None
+    phone: Optional[str] = None
+    company: Optional[str] = None
+    jobtitle: Optional[str] = None
+    lifecyclestage: Optional[str] = None
+
+class DealProperties(_Schema):
+    dealname: Optional[str] = None
+    amount: Optional[str] = None
+    dealstage: Optional[str] = None
+    pipeline: Optional[str] = None
+    closedate: Optional[str] = Field(None, description="ISO 8601 date")
+
+class CompanyProperties(_Schema):
+    name: Optional[str] = None
+    domain: Optional[str] = None
+    industry: Optional[str] = None
+    phone: Optional[str] = None
+    city: Optional[str] = None
+
+class ParsedQuery(_Schema):
+    """Intent and payload extracted from one CRM instruction."""
+    intent: Literal[HUBSPOT_INTENTS] = Field(description="The CRM operation to perform")
+    id: Optional[str] = Field(None, description="HubSpot id of the record to update (update intents only)")
+    contact: Optional[ContactProperties] = Field(None, description="Properties for contact intents")
+    deal: Optional[DealProperties] = Field(None, description="Properties for deal intents")
+    company: Optional[CompanyProperties] = Field(None, description="Properties for company intents")
+
+# Which properties group each intent reads
+_GROUPS = {intent: intent.split("_", 1)[1] for intent in HUBSPOT_INTENTS}
+
+def to_intent_payload(parsed: ParsedQuery) -> Dict[str, Any]:
+    """Check the parse makes sense for its intent and shape it as {'intent', 'payload'} for the graph.
+
+    Raises ValueError when it does not (no properties, or an update without an id).
+    """
+    group = getattr(parsed, _GROUPS[parsed.intent])
+    properties = {name: value for name, value in (group.model_dump() if group else {}).items() if value is not None}
+    if not properties:
+        raise ValueError(f"{parsed.intent} needs at least one {_GROUPS[parsed.intent]} property")
+    payload: Dict[str, Any] = {"properties": properties}
+    if parsed.intent.startswith("update_"):
+        if not parsed.id:
+            raise ValueError(f"{parsed.intent} needs the id of the record to update")
+        payload["id"] = str(parsed.id)
+    return {"intent": parsed.intent, "payload": payload}
+
+def validate_output(output: Any) -> Dict[str, Any]:
+    """Validate a raw dict (or ParsedQuery) against the schema; raises ValueError/ValidationError."""
+    parsed = output if isinstance(output, ParsedQuery) else ParsedQuery.model_validate(output)
+    return to_intent_payload(parsed)
+
+class BatchItem(ParsedQuery):
+    """One parse in a batched answer, tagged with the number of the instruction it answers."""
+    index: int = Field(description="Number of the instruction this item answers")
+
+class ParsedBatch(_Schema):
+    """Parses for a numbered list of CRM instructions, one item per instruction."""
+    items: List[BatchItem] = Field(default_factory=list)
+
+SCHEMA_ERRORS = (ValidationError, ValueError)
@@ -0,0 +1,34 @@
+# agents/llm_usage.py
+from typing import Dict, Any, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from metrics import LLM_CALLS, LLM_TOKENS
+
+def usage_of(response: LLMResult) -> Dict[str, int]:
+    """Input and output tokens reported on the generated messages (usage_metadata)."""
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            for name in usage:
+                usage[name] += metadata.get(name, 0)
+    return usage
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """Counts Gemini calls and tokens into llm_calls_total and llm_tokens_total.
+
+    Attached to every chat model the agents build, so agent executors, structured
+    output and batch calls are all counted, whichever mode or fallback ran them.
+    """
+
+    def __init__(self, component: str):
+        self.component = component
+
+    def record(self, usage: Optional[Dict[str, Any]]) -> None:
+        usage = usage or {}
+        LLM_CALLS.inc(component=self.component)
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), component=self.component, direction="input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), component=self.component, direction="output")
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self.record(usage_of(response))
@@ -0,0 +1,92 @@
+# agents/mailjet_batcher.py
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List
+from utils import logger
+from metrics import external_call
+
+# Mailjet Send API v3.1 accepts at most 50 messages per request
+MAX_MESSAGES_PER_CALL = 50
+
+class MailjetBatcher:
+    """Micro-batches outgoing Mailjet messages into one v3.1 send call.
+
+    Messages submitted within `window` seconds of the first one (or until 50 are
+    queued) go out in a single request; each caller's future resolves with the
+    status Mailjet reported for its own message.
+    """
+
+    def __init__(self, client, window: float = 0.05, max_batch: int = MAX_MESSAGES_PER_CALL,
+                 max_in_flight: int = 4):
+        self.client = client
+        self.window = window
+        self.max_batch = min(max_batch, MAX_MESSAGES_PER_CALL)
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="mailjet-send")
+        self.calls = 0
+        self.messages = 0
+        self._lock = threading.Lock()  # counters are updated from the sender threads
+        self._thread = threading.Thread(target=self._collect, name="mailjet-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, message: Dict[str, Any]) -> Future:
+        """Queue one Messages entry; the future resolves to {"success": ..., ...}."""
+        future: Future = Future()
+        self._queue.put((message, future))
+        return future
+
+    def send(self, message: Dict[str, Any], timeout: float = 60.0) -> Dict[str, Any]:
+        """Queue a message and wait for its own result."""
+        return self.submit(message).result(timeout=timeout)
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch: List[tuple]) -> None:
+        with self._lock:
+            self.calls += 1
+            self.messages += len(batch)
+        try:
+            with external_call("mailjet", "send_batch"):
+                response = self.client.send.create(data={"Messages": [message for message, _ in batch]})
+            try:
+                statuses = response.json().get("Messages", [])
+            except Exception:
+                statuses = []
+            if len(statuses) != len(batch):
+                ok = response.status_code in (200, 201)
+                error = None if ok else f"Mailjet error: {response.status_code}"
+                statuses = [{"Status": "success" if ok else "error", "Errors": error}] * len(batch)
+        except Exception as e:
+            logger.error(f"Mailjet batch send failed: {e}")
+            statuses = [{"Status": "error", "Errors": str(e)}] * len(batch)
+        sent = sum(1 for status in statuses if status.get("Status") == "success")
+        logger.info(f"Mailjet: batch of {len(batch)} sent ({sent} accepted)")
+        for (_, future), status in zip(batch, statuses):
+            if status.get("Status") == "success":
+                future.set_result({"success": True})
+            else:
+                future.set_result({"success": False, "error": str(status.get("Errors"))})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls, messages = self.calls, self.messages
+        return {
+            "calls": calls,
+            "messages": messages,
+            "messages_per_call": round(messages / calls, 2) if calls else 0.0,
+            "queued": self._queue.qsize(),
+        }
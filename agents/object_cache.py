@@ -0,0 +1,212 @@
+# agents/object_cache.py
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+from utils import logger, shared_instance
+
+# Webhook subscription prefix -> CRM object type used by the SDK (crm.contacts, ...)
+WEBHOOK_OBJECT_TYPES = {"contact": "contacts", "company": "companies", "deal": "deals"}
+
+def _as_hubspot_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+class HubSpotObjectCache:
+    """Read-through cache of CRM object properties: an in-memory LRU with TTL, optionally backed by SQLite.
+
+    Entries are keyed by (object type, id) and filled from reads and from the
+    responses of creates and updates. Webhook events patch a changed property in
+    place or drop the entry, so a hit is at most `ttl` seconds old and usually current.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10000, path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.patched = 0
+        self.invalidated = 0
+        self.writes_skipped = 0
+        self.writes_partial = 0
+        self._served_age_total = 0.0
+        self._served_age_max = 0.0
+        self._memory: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS hubspot_object_cache (
+                    object_type TEXT NOT NULL,
+                    object_id TEXT NOT NULL,
+                    properties TEXT NOT NULL,
+                    as_of REAL NOT NULL,
+                    PRIMARY KEY (object_type, object_id)
+                )""")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HubSpotObjectCache":
+        path = None
+        if config.get("hubspot_cache_backend", "memory") == "sqlite":
+            path = config.get("hubspot_cache_db_path", config.get("queue_db_path", "hubspot_automation.db"))
+        return cls(
+            ttl=float(config.get("hubspot_cache_ttl", 300)),
+            max_entries=int(config.get("hubspot_cache_max_entries", 10000)),
+            path=path,
+        )
+
+    def _remember(self, key: tuple, properties: Dict[str, Any], as_of: float) -> None:
+        self._memory[key] = (properties, as_of)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _entry(self, key: tuple, now: float) -> Optional[tuple]:
+        """Unexpired (properties, as_of) for a key from either tier; caller holds the lock."""
+        entry = self._memory.get(key)
+        if entry is None and self._conn:
+            row = self._conn.execute(
+                "SELECT properties, as_of FROM hubspot_object_cache WHERE object_type = ? AND object_id = ?",
+                key).fetchone()
+            if row is not None:
+                entry = (json.loads(row[0]), row[1])
+                self._remember(key, *entry)
+        if entry is not None and now - entry[1] > self.ttl:
+            self._drop(key)
+            return None
+        return entry
+
+    def _drop(self, key: tuple) -> None:
+        self._memory.pop(key, None)
+        if self._conn:
+            self._conn.execute(
+                "DELETE FROM hubspot_object_cache WHERE object_type = ? AND object_id = ?", key)
+
+    def _store(self, key: tuple, properties: Dict[str, Any], as_of: float) -> None:
+        self._remember(key, properties, as_of)
+        if self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hubspot_object_cache (object_type, object_id, properties, as_of) "
+                "VALUES (?, ?, ?, ?)", (*key, json.dumps(properties, default=str), as_of))
+
+    def get(self, object_type: str, object_id: str, properties: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Cached properties of an object, or None if unknown, expired or missing a requested property."""
+        key = (object_type, str(object_id))
+        now = time.time()
+        with self._lock:
+            entry = self._entry(key, now)
+            if entry is None or (properties and any(name not in entry[0] for name in properties)):
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            age = max(now - entry[1], 0.0)
+            self._served_age_total += age
+            self._served_age_max = max(self._served_age_max, age)
+            return dict(entry[0])
+
+    def put(self, object_type: str, object_id: str, properties: Optional[Dict[str, Any]]) -> None:
+        """Record properties returned by HubSpot (read, create or update), merged over what is cached."""
+        if not object_id:
+            return
+        key = (object_type, str(object_id))
+        now = time.time()
+        with self._lock:
+            entry = self._entry(key, now)
+            merged = {**(entry[0] if entry else {}), **(properties or {})}
+            self._store(key, merged, now)
+
+    def diff(self, object_type: str, object_id: str, properties: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Requested properties that differ from the cached snapshot, or None when there is no snapshot.
+
+        HubSpot stores every property as a string, so values are compared as strings
+        (None as empty). An empty dict means the update would change nothing.
+        """
+        snapshot = self.get(object_type, object_id, list(properties))
+        if snapshot is None:
+            return None
+        return self.changes(snapshot, properties)
+
+    def changes(self, snapshot: Dict[str, Any], properties: Dict[str, Any]) -> Dict[str, Any]:
+        """Requested properties that differ from a snapshot already in hand; counted like diff."""
+        changed = {name: value for name, value in properties.items()
+                   if _as_hubspot_value(value) != _as_hubspot_value(snapshot.get(name))}
+        with self._lock:
+            if not changed:
+                self.writes_skipped += 1
+            elif len(changed) < len(properties):
+                self.writes_partial += 1
+        return changed
+
+    def invalidate(self, object_type: str, object_id: str) -> None:
+        with self._lock:
+            self._drop((object_type, str(object_id)))
+            self.invalidated += 1
+
+    def apply_event(self, event: Dict[str, Any]) -> None:
+        """Keep the cache in line with a HubSpot webhook event.
+
+        A propertyChange newer than the cached snapshot is patched in; deletions,
+        merges, restores and out-of-order changes drop the entry instead.
+        """
+        object_type, _, action = event.get('subscriptionType', '').partition('.')
+        object_type = WEBHOOK_OBJECT_TYPES.get(object_type)
+        object_id = event.get('objectId')
+        if not object_type or object_id is None or action == 'creation':
+            return
+        key = (object_type, str(object_id))
+        now = time.time()
+        with self._lock:
+            entry = self._entry(key, now)
+            if entry is None:
+                return
+            occurred_at = (event.get('occurredAt') or 0) / 1000.0
+            if action == 'propertyChange' and event.get('propertyName') and occurred_at >= entry[1]:
+                self._store(key, {**entry[0], event['propertyName']: event.get('propertyValue')}, min(occurred_at, now))
+                self.patched += 1
+            else:
+                self._drop(key)
+                self.invalidated += 1
+
+    def apply_events(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            try:
+                self.apply_event(event)
+            except Exception as e:
+                logger.error(f"Object cache update failed for event {event.get('eventId')}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit ratio and how old the served entries were."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "patched": self.patched,
+            "invalidated": self.invalidated,
+            "writes_skipped": self.writes_skipped,
+            "writes_partial": self.writes_partial,
+            "memory_entries": len(self._memory),
+            "mean_served_age_seconds": round(self._served_age_total / self.hits, 3) if self.hits else 0.0,
+            "max_served_age_seconds": round(self._served_age_max, 3),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+def get_object_cache(config: Dict[str, Any]) -> HubSpotObjectCache:
+    """Process-wide cache shared by every HubSpotAgent and the webhook handlers."""
+    key = (config.get("hubspot_api_key"), config.get("hubspot_cache_backend", "memory"))
+    return shared_instance("object_cache", key, lambda: HubSpotObjectCache.from_config(config))
@@ -1,70 +1,440 @@
-# agents/orchestrator.py
-from typing import Dict, Any, List
-from langchain_google_genai import ChatGoogleGenerativeAI  # New import
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.tools import tool
-from langchain.agents import create_openai_tools_agent, AgentExecutor  # Works with Gemini too
-from utils import logger, load_config
-
-class OrchestratorAgent:
-    """Global Orchestrator: Parses queries and delegates tasks."""
-    
-    def __init__(self, config: Dict[str, str]):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",  # Or "gemini-1.5-pro" for better reasoning
-            google_api_key=config['gemini_api_key'],
-            temperature=0.2
-        )
-        self.tools = self._define_tools()
-        self.agent = self._build_agent()
-    
-    def _define_tools(self) -> List:
-        @tool
-        def parse_query(query: str) -> Dict[str, Any]:
-            """Parse user query to extract intent and payload."""
-            # This is a placeholder; in reality, LLM calls this to generate structured output
-            # For industry: Use structured output mode for reliability
-            try:
-                # Simulate parsing (expand with actual logic or sub-LLM call)
-                if "create contact" in query.lower():
-                    intent = "create_contact"
-                    payload = {"properties": {"firstname": "John", "lastname": "Doe", "email": "metaisolpak@gmail.com"}}  # Extract dynamically
-                elif "update contact" in query.lower():
-                    intent = "update_contact"
-                    payload = {"id": "123", "properties": {"phone": "123-456-7890"}}
-                elif "create deal" in query.lower():
-                    intent = "create_deal"
-                    payload = {"properties": {"dealname": "New Deal", "amount": "1000"}}  # Extract dynamically
-                elif "update deal" in query.lower():
-                    intent = "update_deal"
-                    payload = {"id": "456", "properties": {"dealstage": "appointmentscheduled"}}
-                elif "create company" in query.lower():
-                    intent = "create_company"
-                    payload = {"properties": {"name": "New Company", "domain": "metaisol.com"}}
-                else:
-                    raise ValueError("Unknown intent")
-                return {"intent": intent, "payload": payload}
-            except Exception as e:
-                logger.error(f"Query parse error: {str(e)}")
-                raise
-        
-        return [parse_query]
-    
-    def _build_agent(self):
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are an orchestrator. Parse the query and use tools to prepare payload. Delegate to HubSpot for CRM, then Email for notification."),
-            ("human", "{input}"),
-            ("placeholder", "{agent_scratchpad}"),
-        ])
-        agent = create_openai_tools_agent(self.llm, self.tools, prompt)
-        return AgentExecutor(agent=agent, tools=self.tools, verbose=True, handle_parsing_errors=True)
-    
-    def run(self, query: str) -> Dict[str, Any]:
-        """Run orchestrator on query."""
-        try:
-            result = self.agent.invoke({"input": query})
-            logger.info(f"Orchestrator result: {result}")
-            return result['output']  # Returns {'intent': ..., 'payload': ...}
-        except Exception as e:
-            logger.error(f"Orchestrator run failed: {str(e)}")
+# agents/orchestrator.py
+from typing import Dict, Any, List, Optional
+import asyncio
+import copy
+import functools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.tools import tool
+from utils import logger, load_config, open_optional
+from metrics import PARSES
+from agents.llm_usage import LLMUsageCallback
+from agents.parse_cache import get_parse_cache
+from agents.intent_schema import ParsedQuery, ParsedBatch, to_intent_payload, SCHEMA_ERRORS
+from agents.intent_classifier import IntentClassifier
+
+STRUCTURED_PROMPT = (
+    "Extract the HubSpot CRM operation from the user's instruction. "
+    "Pick the intent, fill only the contact, deal or company properties that match it, "
+    "and include only values the instruction states. For update intents set id to the record id."
+)
+BATCH_PROMPT = STRUCTURED_PROMPT + (
+    " You are given several numbered instructions. Return one item per instruction "
+    "and set its index to the instruction's number."
+)
+# Rough size of one parsed item in the answer, counted against the batch token budget
+TOKENS_PER_ITEM = 80
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), used to size batches."""
+    return len(text) // 4 + 1
+
+class OrchestratorAgent:
+    """Global Orchestrator: Parses queries and delegates tasks."""
+    
+    def __init__(self, config: Dict[str, str]):
+        # The Gemini client, structured-output wrappers and AgentExecutor are built on first use
+        self.config = config
+        self.gemini_api_key = config['gemini_api_key']
+        # Reuses parses of same-shaped queries instead of calling the LLM (config: orchestrator_cache_enabled)
+        self.parse_cache = None
+        if str(config.get("orchestrator_cache_enabled", "true")).lower() in ("1", "true", "yes"):
+            self.parse_cache = open_optional("Orchestrator parse cache", lambda: get_parse_cache(config))
+        # "agent" runs the tool-calling AgentExecutor; "structured" makes one schema-constrained Gemini call
+        self.mode = config.get("orchestrator_mode", "agent").lower()
+        self.schema_retries = int(config.get("orchestrator_schema_retries", 2))
+        # run_many packs queries into one structured call (batch_llm) within an estimated token budget
+        self.batch_token_budget = int(config.get("orchestrator_batch_token_budget", 8000))
+        self.batch_max_size = int(config.get("orchestrator_batch_max_size", 50))
+        self.batch_concurrency = int(config.get("orchestrator_batch_concurrency", 4))
+        self.usage = {"queries": 0, "llm_calls": 0, "schema_retries": 0, "input_tokens": 0, "output_tokens": 0,
+                      "local_parses": 0, "local_fallbacks": 0, "batch_calls": 0, "batch_splits": 0}
+        self._usage_lock = threading.Lock()
+        # Local classifier tried before the LLM (config: orchestrator_classifier_path, _threshold)
+        self.classifier = self._load_classifier(config)
+        # LLM results appended here as JSON lines become the classifier's training data
+        self.log_path = config.get("orchestrator_log_path")
+        self._log_lock = threading.Lock()
+        self.tools = self._define_tools()
+    
+    @functools.cached_property
+    def llm(self):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",  # Or "gemini-1.5-pro" for better reasoning
+            google_api_key=self.gemini_api_key,
+            temperature=0.2,
+            callbacks=[LLMUsageCallback("orchestrator")]
+        )
+    
+    @functools.cached_property
+    def structured_llm(self):
+        return self.llm.with_structured_output(ParsedQuery, include_raw=True)
+    
+    @functools.cached_property
+    def batch_llm(self):
+        return self.llm.with_structured_output(ParsedBatch, include_raw=True)
+    
+    @functools.cached_property
+    def agent(self):
+        return self._build_agent()
+    
+    def _load_classifier(self, config: Dict[str, Any]) -> Optional[IntentClassifier]:
+        path = config.get("orchestrator_classifier_path")
+        if not path or not os.path.exists(path):
+            return None
+        threshold = config.get("orchestrator_classifier_threshold")
+        classifier = IntentClassifier.load(path, float(threshold) if threshold is not None else None)
+        logger.info(f"Loaded intent classifier from {path} (threshold {classifier.threshold})")
+        return classifier
+    
+    def _define_tools(self) -> List:
+        @tool
+        def parse_query(query: str) -> Dict[str, Any]:
+            """Parse user query to extract intent and payload."""
+            # This is a placeholder; in reality, LLM calls this to generate structured output
+            # For industry: Use structured output mode for reliability
+            try:
+                # Simulate parsing (expand with actual logic or sub-LLM call)
+                if "create contact" in query.lower():
+                    intent = "create_contact"
+                    payload = {"properties": {"firstname": "John", "lastname": "Doe", "email": "metaisolpak@gmail.com"}}  # Extract dynamically
+                elif "update contact" in query.lower():
+                    intent = "update_contact"
+                    payload = {"id": "123", "properties": {"phone": "123-456-7890"}}
+                elif "create deal" in query.lower():
+                    intent = "create_deal"
+                    payload = {"properties": {"dealname": "New Deal", "amount": "1000"}}  # Extract dynamically
+                elif "update deal" in query.lower():
+                    intent = "update_deal"
+                    payload = {"id": "456", "properties": {"dealstage": "appointmentscheduled"}}
+                elif "create company" in query.lower():
+                    intent = "create_company"
+                    payload = {"properties": {"name": "New Company", "domain": "metaisol.com"}}
+                else:
+                    raise ValueError("Unknown intent")
+                return {"intent": intent, "payload": payload}
+            except Exception as e:
+                logger.error(f"Query parse error: {str(e)}")
+                raise
+        
+        return [parse_query]
+    
+    def _build_agent(self):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain.agents import create_openai_tools_agent, AgentExecutor  # Works with Gemini too
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are an orchestrator. Parse the query and use tools to prepare payload. Delegate to HubSpot for CRM, then Email for notification."),
+            ("human", "{input}"),
+            ("placeholder", "{agent_scratchpad}"),
+        ])
+        agent = create_openai_tools_agent(self.llm, self.tools, prompt)
+        return AgentExecutor(agent=agent, tools=self.tools, verbose=True, handle_parsing_errors=True)
+    
+    def _count_call(self, response: Dict[str, Any], usage: Dict[str, int]) -> None:
+        usage_metadata = getattr(response.get("raw"), "usage_metadata", None) or {}
+        usage["llm_calls"] += 1
+        usage["input_tokens"] += usage_metadata.get("input_tokens", 0)
+        usage["output_tokens"] += usage_metadata.get("output_tokens", 0)
+    
+    def _check_structured(self, response: Dict[str, Any], usage: Dict[str, int]):
+        """Count the call's tokens and validate it; returns (result, None) or (None, schema error)."""
+        self._count_call(response, usage)
+        if response.get("parsing_error") is not None:
+            return None, response["parsing_error"]
+        if response.get("parsed") is None:
+            return None, ValueError("the answer was empty")
+        try:
+            return to_intent_payload(response["parsed"]), None
+        except SCHEMA_ERRORS as e:
+            return None, e
+    
+    def _retry_messages(self, messages: List, response: Dict[str, Any], error: Exception) -> List:
+        raw = response.get("raw")
+        return messages + [
+            ("ai", getattr(raw, "content", None) or str(response.get("parsed"))),
+            ("human", f"That answer does not fit the schema: {error}. Answer again with a corrected result."),
+        ]
+    
+    def _record_usage(self, query: str, usage: Dict[str, int], queries: int = 1, batch: bool = False) -> None:
+        logger.info(f"Orchestrator usage for '{query}': {usage}")
+        with self._usage_lock:
+            self.usage["queries"] += queries
+            if batch:
+                self.usage["batch_calls"] += usage["llm_calls"]
+            else:
+                self.usage["schema_retries"] += usage["llm_calls"] - 1
+            for name in ("llm_calls", "input_tokens", "output_tokens"):
+                self.usage[name] += usage[name]
+        PARSES.inc(queries, source="llm")  # llm_calls_total and llm_tokens_total come from LLMUsageCallback
+    
+    def _structured_parse(self, query: str) -> Dict[str, Any]:
+        """One structured-output call, repeated only when the answer violates the schema."""
+        messages = [("system", STRUCTURED_PROMPT), ("human", query)]
+        usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0}
+        try:
+            for attempt in range(self.schema_retries + 1):
+                response = self.structured_llm.invoke(messages)
+                result, error = self._check_structured(response, usage)
+                if result is not None:
+                    return result
+                logger.warning(f"Orchestrator output failed validation (attempt {attempt + 1}): {error}")
+                messages = self._retry_messages(messages, response, error)
+            raise ValueError(f"No valid parse after {usage['llm_calls']} attempts: {error}")
+        finally:
+            self._record_usage(query, usage)
+    
+    async def _astructured_parse(self, query: str) -> Dict[str, Any]:
+        """Async variant of _structured_parse."""
+        messages = [("system", STRUCTURED_PROMPT), ("human", query)]
+        usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0}
+        try:
+            for attempt in range(self.schema_retries + 1):
+                response = await self.structured_llm.ainvoke(messages)
+                result, error = self._check_structured(response, usage)
+                if result is not None:
+                    return result
+                logger.warning(f"Orchestrator output failed validation (attempt {attempt + 1}): {error}")
+                messages = self._retry_messages(messages, response, error)
+            raise ValueError(f"No valid parse after {usage['llm_calls']} attempts: {error}")
+        finally:
+            self._record_usage(query, usage)
+    
+    def _plan_batches(self, queries: List[str]) -> List[List[str]]:
+        """Group queries into batches that fit the token budget and size cap."""
+        batches: List[List[str]] = []
+        current: List[str] = []
+        tokens = estimate_tokens(BATCH_PROMPT)
+        for query in queries:
+            cost = estimate_tokens(query) + TOKENS_PER_ITEM
+            if current and (tokens + cost > self.batch_token_budget or len(current) >= self.batch_max_size):
+                batches.append(current)
+                current, tokens = [], estimate_tokens(BATCH_PROMPT)
+            current.append(query)
+            tokens += cost
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _batch_messages(self, queries: List[str]) -> List:
+        numbered = "\n".join(f"{i}. {query}" for i, query in enumerate(queries))
+        return [("system", BATCH_PROMPT), ("human", numbered)]
+    
+    def _check_batch(self, queries: List[str], response: Dict[str, Any], usage: Dict[str, int]) -> Dict[int, Dict[str, Any]]:
+        """Valid parses by position in the batch; missing and invalid items are left out."""
+        self._count_call(response, usage)
+        if response.get("parsing_error") is not None or response.get("parsed") is None:
+            logger.warning(f"Batch answer for {len(queries)} queries failed validation: {response.get('parsing_error')}")
+            return {}
+        results: Dict[int, Dict[str, Any]] = {}
+        for item in response["parsed"].items:
+            if 0 <= item.index < len(queries) and item.index not in results:
+                try:
+                    results[item.index] = to_intent_payload(item)
+                except SCHEMA_ERRORS as e:
+                    logger.warning(f"Batch item {item.index} failed validation: {e}")
+        return results
+    
+    def _retry_groups(self, queries: List[str], results: Dict[int, Dict[str, Any]]) -> List[List[int]]:
+        """Positions to ask again: the failed items together, or both halves when the whole batch failed."""
+        failed = [i for i in range(len(queries)) if i not in results]
+        if len(failed) < len(queries):
+            return [failed] if failed else []
+        with self._usage_lock:
+            self.usage["batch_splits"] += 1
+        half = len(failed) // 2
+        return [failed[:half], failed[half:]]
+    
+    def _parse_batch(self, queries: List[str]) -> List[Any]:
+        """One call for the batch; failed items are retried in smaller batches and finally one by one.
+
+        Returns a parse result or the Exception that stopped it for each query, in order.
+        """
+        if len(queries) == 1:
+            try:
+                return [self._structured_parse(queries[0])]
+            except Exception as e:
+                return [e]
+        usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0}
+        results: Dict[int, Dict[str, Any]] = {}
+        try:
+            results = self._check_batch(queries, self.batch_llm.invoke(self._batch_messages(queries)), usage)
+        except Exception as e:
+            logger.warning(f"Batch call for {len(queries)} queries failed: {e}")
+        finally:
+            self._record_usage(f"batch of {len(queries)}", usage, queries=len(results), batch=True)
+        output: List[Any] = [results.get(i) for i in range(len(queries))]
+        for group in self._retry_groups(queries, results):
+            for i, result in zip(group, self._parse_batch([queries[i] for i in group])):
+                output[i] = result
+        return output
+    
+    async def _aparse_batch(self, queries: List[str]) -> List[Any]:
+        """Async variant of _parse_batch; retried groups run concurrently."""
+        if len(queries) == 1:
+            try:
+                return [await self._astructured_parse(queries[0])]
+            except Exception as e:
+                return [e]
+        usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0}
+        results: Dict[int, Dict[str, Any]] = {}
+        try:
+            results = self._check_batch(queries, await self.batch_llm.ainvoke(self._batch_messages(queries)), usage)
+        except Exception as e:
+            logger.warning(f"Batch call for {len(queries)} queries failed: {e}")
+        finally:
+            self._record_usage(f"batch of {len(queries)}", usage, queries=len(results), batch=True)
+        output: List[Any] = [results.get(i) for i in range(len(queries))]
+        groups = self._retry_groups(queries, results)
+        retried = await asyncio.gather(*(self._aparse_batch([queries[i] for i in group]) for group in groups))
+        for group, group_results in zip(groups, retried):
+            for i, result in zip(group, group_results):
+                output[i] = result
+        return output
+    
+    def _prepare_many(self, queries: List[str]):
+        """Answer what the cache and classifier can; returns (results, {query: positions} left for the LLM)."""
+        results: List[Any] = [None] * len(queries)
+        pending: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            parsed = self._cached_parse(query)
+            if parsed is None:
+                parsed = self._local_parse(query)
+            if parsed is not None:
+                results[i] = parsed
+            else:
+                pending.setdefault(query, []).append(i)  # repeated queries are parsed once
+        return results, pending
+    
+    def _finish_many(self, results: List[Any], pending: Dict[str, List[int]], batches: List[List[str]],
+                     parsed: List[List[Any]]) -> List[Dict[str, Any]]:
+        """Hand each batch answer back to the positions that asked for it."""
+        for batch, outputs in zip(batches, parsed):
+            for query, output in zip(batch, outputs):
+                if isinstance(output, Exception):
+                    logger.error(f"Orchestrator could not parse '{query}': {output}")
+                    output = {"error": str(output)}
+                else:
+                    self._remember_parse(query, output)
+                    self._log_result(query, output)
+                for i in pending[query]:
+                    results[i] = copy.deepcopy(output)
+        return results
+    
+    def run_many(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """Parse many queries with as few LLM calls as possible, for bulk jobs.
+
+        Cached and locally classified queries are answered first. The rest are packed into
+        structured-output calls of at most orchestrator_batch_token_budget estimated tokens,
+        up to orchestrator_batch_concurrency at a time. Returns one result per query, in
+        order; a query that could not be parsed gets {'error': ...} instead.
+        """
+        results, pending = self._prepare_many(queries)
+        batches = self._plan_batches(list(pending))
+        if not batches:
+            return results
+        with ThreadPoolExecutor(max_workers=max(1, min(self.batch_concurrency, len(batches)))) as pool:
+            parsed = list(pool.map(self._parse_batch, batches))
+        return self._finish_many(results, pending, batches, parsed)
+    
+    async def arun_many(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """Async variant of run_many."""
+        results, pending = await asyncio.to_thread(self._prepare_many, queries)
+        batches = self._plan_batches(list(pending))
+        semaphore = asyncio.Semaphore(max(1, self.batch_concurrency))
+        
+        async def parse(batch: List[str]) -> List[Any]:
+            async with semaphore:
+                return await self._aparse_batch(batch)
+        
+        parsed = await asyncio.gather(*(parse(batch) for batch in batches))
+        return await asyncio.to_thread(self._finish_many, results, pending, batches, parsed)
+    
+    def usage_stats(self) -> Dict[str, Any]:
+        """LLM calls and tokens spent on structured parsing, in total and per query, plus local classifier use."""
+        with self._usage_lock:
+            usage = dict(self.usage)
+        queries = usage["queries"]
+        usage["llm_calls_per_query"] = round(usage["llm_calls"] / queries, 3) if queries else 0.0
+        usage["tokens_per_query"] = round((usage["input_tokens"] + usage["output_tokens"]) / queries, 1) if queries else 0.0
+        local = usage["local_parses"] + usage["local_fallbacks"]
+        usage["local_fallback_rate"] = round(usage["local_fallbacks"] / local, 4) if local else 0.0
+        return usage
+    
+    def _local_parse(self, query: str) -> Optional[Dict[str, Any]]:
+        """Classifier parse, or None when it is unsure and the LLM has to answer."""
+        if not self.classifier:
+            return None
+        parsed = self.classifier.parse(query)
+        with self._usage_lock:
+            self.usage["local_parses" if parsed is not None else "local_fallbacks"] += 1
+        if parsed is not None:
+            PARSES.inc(source="local")
+            logger.info(f"Orchestrator local parse: {parsed}")
+        return parsed
+    
+    def _log_result(self, query: str, output: Any) -> None:
+        if not self.log_path or not isinstance(output, dict) or not output.get('intent'):
+            return
+        line = json.dumps({"query": query, "intent": output['intent'], "payload": output.get('payload')})
+        with self._log_lock, open(self.log_path, "a") as f:
+            f.write(line + "\n")
+    
+    def _cached_parse(self, query: str):
+        if not self.parse_cache:
+            return None
+        parsed = self.parse_cache.get(query)
+        if parsed is not None:
+            PARSES.inc(source="cache")
+            logger.info(f"Orchestrator cache hit: {parsed}")
+        return parsed
+    
+    def _remember_parse(self, query: str, output: Any) -> None:
+        if self.parse_cache and isinstance(output, dict) and output.get('intent') and 'payload' in output:
+            self.parse_cache.put(query, output)
+    
+    def run(self, query: str) -> Dict[str, Any]:
+        """Run orchestrator on query."""
+        try:
+            cached = self._cached_parse(query)
+            if cached is not None:
+                return cached
+            local = self._local_parse(query)
+            if local is not None:
+                return local
+            if self.mode == "structured":
+                output = self._structured_parse(query)
+            else:
+                result = self.agent.invoke({"input": query})
+                output = result['output']  # Returns {'intent': ..., 'payload': ...}
+            logger.info(f"Orchestrator result: {output}")
+            self._remember_parse(query, output)
+            self._log_result(query, output)
+            return output
+        except Exception as e:
+            logger.error(f"Orchestrator run failed: {str(e)}")
+            raise
+    
+    async def arun(self, query: str) -> Dict[str, Any]:
+        """Async variant of run; awaits the agent instead of blocking the event loop."""
+        try:
+            cached = await asyncio.to_thread(self._cached_parse, query)
+            if cached is not None:
+                return cached
+            local = self._local_parse(query)
+            if local is not None:
+                return local
+            if self.mode == "structured":
+                output = await self._astructured_parse(query)
+            else:
+                result = await self.agent.ainvoke({"input": query})
+                output = result['output']
+            logger.info(f"Orchestrator result: {output}")
+            await asyncio.to_thread(self._remember_parse, query, output)
+            await asyncio.to_thread(self._log_result, query, output)
+            return output
+        except Exception as e:
+            logger.error(f"Orchestrator run failed: {str(e)}")
             raise
\ No newline at end of file
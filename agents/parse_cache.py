@@ -0,0 +1,129 @@
+# agents/parse_cache.py
+import re
+import threading
+from typing import Dict, Any, Optional, List, Tuple
+from utils import logger, shared_instance
+from ttl_store import TTLStore
+
+# Values masked out of a query before it is used as a cache key
+_SLOT_PATTERN = re.compile(r"(?P<email>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)|(?P<num>\d+(?:\.\d+)?)")
+_PLACEHOLDER = re.compile(r"<<(\w+)>>")
+
+class _Uncacheable(Exception):
+    """The parse result holds an email/number that is not one of the query's slots."""
+
+def normalize_query(query: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Mask emails and numbers: ('Update deal <<num_0>> ...', [('num_0', '123'), ...])."""
+    slots: List[Tuple[str, str]] = []
+    counts = {"email": 0, "num": 0}
+
+    def mask(match):
+        kind = match.lastgroup
+        name = f"{kind}_{counts[kind]}"
+        counts[kind] += 1
+        slots.append((name, match.group()))
+        return f"<<{name}>>"
+
+    key = " ".join(_SLOT_PATTERN.sub(mask, query).split())
+    return key, slots
+
+def _templatize(value: Any, slots: List[Tuple[str, str]]) -> Any:
+    """Replace slot values inside a parse result with <<name>> placeholders."""
+    by_value = {}
+    for name, slot in slots:
+        by_value.setdefault(slot, name)
+
+    def replace(match):
+        if match.group() not in by_value:
+            raise _Uncacheable(match.group())
+        return f"<<{by_value[match.group()]}>>"
+
+    if isinstance(value, dict):
+        return {k: _templatize(v, slots) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_templatize(v, slots) for v in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        if str(value) not in by_value:
+            raise _Uncacheable(str(value))
+        return {"__slot__": by_value[str(value)], "__type__": type(value).__name__}
+    if isinstance(value, str):
+        return _SLOT_PATTERN.sub(replace, value)
+    return value
+
+def _render(template: Any, values: Dict[str, str]) -> Any:
+    if isinstance(template, dict):
+        if "__slot__" in template:
+            return {"int": int, "float": float}[template["__type__"]](values[template["__slot__"]])
+        return {k: _render(v, values) for k, v in template.items()}
+    if isinstance(template, list):
+        return [_render(v, values) for v in template]
+    if isinstance(template, str):
+        return _PLACEHOLDER.sub(lambda m: values.get(m.group(1), m.group()), template)
+    return template
+
+class ParseCache:
+    """Caches orchestrator {intent, payload} results per normalized query, in a TTLStore.
+
+    Emails and numbers are masked out of the query, so every webhook query of the
+    same shape ("Process new contact with ID 123") shares one entry and gets the
+    stored payload back with its own values filled in. Results holding an email or
+    number that did not come from the query are never cached.
+    """
+
+    def __init__(self, path: str = "hubspot_automation.db", ttl: float = 86400.0, max_entries: int = 10000):
+        self.stored = 0
+        self.uncacheable = 0
+        self._lock = threading.Lock()
+        self._store = TTLStore(path, "orchestrator_parse_cache", column="template", ttl=ttl, max_entries=max_entries)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ParseCache":
+        return cls(
+            path=config.get("orchestrator_cache_db_path", config.get("queue_db_path", "hubspot_automation.db")),
+            ttl=float(config.get("orchestrator_cache_ttl", 86400)),
+            max_entries=int(config.get("orchestrator_cache_max_entries", 10000)),
+        )
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        """The cached parse for a query of the same shape, filled with this query's values; None on a miss."""
+        key, slots = normalize_query(query)
+        template = self._store.get(key)
+        return None if template is None else _render(template, dict(slots))
+
+    def put(self, query: str, result: Dict[str, Any]) -> bool:
+        """Store a parse result for the query's shape; returns False if it cannot be reused safely."""
+        key, slots = normalize_query(query)
+        try:
+            template = _templatize(result, slots)
+        except _Uncacheable as e:
+            with self._lock:
+                self.uncacheable += 1
+            logger.info(f"Parse result not cached: value {e} does not come from the query")
+            return False
+        self._store.put(key, template)
+        with self._lock:
+            self.stored += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits are LLM calls avoided."""
+        stats = self._store.stats()
+        return {
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_ratio": stats["hit_ratio"],
+            "llm_calls_avoided": stats["hits"],
+            "stored": self.stored,
+            "uncacheable": self.uncacheable,
+            "memory_entries": stats["memory_entries"],
+        }
+
+    def close(self) -> None:
+        self._store.close()
+
+def get_parse_cache(config: Dict[str, Any]) -> ParseCache:
+    """Process-wide parse cache shared by every OrchestratorAgent and the stats endpoint."""
+    path = config.get("orchestrator_cache_db_path", config.get("queue_db_path", "hubspot_automation.db"))
+    return shared_instance("parse_cache", path, lambda: ParseCache.from_config(config))
@@ -0,0 +1,246 @@
+# agents/rate_limiter.py
+import random
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Callable
+from utils import logger, shared_instance
+from metrics import external_call, RETRIES
+
+# Fraction of the limit HubSpot advertises that we actually use, leaving room for clock skew
+HEADROOM = 0.9
+
+def _header(headers, name: str) -> Optional[str]:
+    if not headers:
+        return None
+    for key, value in dict(headers).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), if present."""
+    value = _header(headers, "Retry-After")
+    if value is None:
+        return None
+    seconds = _number(value)
+    if seconds is None:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return max(seconds, 0.0)
+
+def operation_name(fn: Callable) -> str:
+    """Metrics label for an SDK method, e.g. "contacts.update" for basic_api.update, "contacts.batch_update" for batch_api."""
+    name = getattr(fn, "__name__", "call")
+    parts = type(getattr(fn, "__self__", None)).__module__.split(".")
+    if parts[-1] == "batch_api":
+        name = f"batch_{name}"
+    if "crm" in parts[:-1]:
+        return f"{parts[parts.index('crm') + 1]}.{name}"
+    return name
+
+def is_retryable(status: Optional[int]) -> bool:
+    """Only throttling and server errors are worth another attempt."""
+    return status is not None and (status == 429 or status >= 500)
+
+class HubSpotRateLimiter:
+    """Token bucket in front of every HubSpot API call.
+
+    `rate` tokens per second refill a bucket of `burst`; each call takes one.
+    X-HubSpot-RateLimit-* headers retune the rate to the portal's real limit and
+    clamp the bucket to what HubSpot says remains, and a 429 pauses every caller
+    for Retry-After. With `db_path` the bucket lives in SQLite so every process
+    (web workers and `python worker.py`) draws from the same budget.
+    """
+
+    def __init__(self, rate: float = 9.0, burst: int = 10, db_path: Optional[str] = None,
+                 name: str = "hubspot", max_attempts: int = 4, backoff_base: float = 0.5,
+                 backoff_max: float = 10.0):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._state = {"tokens": float(burst), "updated_at": time.time(), "rate": float(rate),
+                       "burst": float(burst), "paused_until": 0.0}
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        if db_path:
+            self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS hubspot_rate_limit ("
+                "name TEXT PRIMARY KEY, tokens REAL, updated_at REAL, rate REAL, burst REAL, paused_until REAL)"
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO hubspot_rate_limit VALUES (?, ?, ?, ?, ?, ?)",
+                (name, float(burst), time.time(), float(rate), float(burst), 0.0),
+            )
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HubSpotRateLimiter":
+        db_path = None
+        if config.get("hubspot_rate_limit_backend", "memory") == "sqlite":
+            db_path = config.get("hubspot_rate_limit_db_path", config.get("queue_db_path", "hubspot_automation.db"))
+        return cls(
+            rate=float(config.get("hubspot_rate_limit", 9)),
+            burst=int(config.get("hubspot_rate_burst", 10)),
+            db_path=db_path,
+            max_attempts=int(config.get("hubspot_max_attempts", 4)),
+        )
+
+    def _update(self, change: Callable[[Dict[str, float], float], Any]) -> Any:
+        """Apply `change(state, now)` atomically, in memory or in a SQLite write transaction."""
+        with self._lock:
+            now = time.time()
+            if not self.db_path:
+                return change(self._state, now)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at, rate, burst, paused_until FROM hubspot_rate_limit WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                state = dict(zip(("tokens", "updated_at", "rate", "burst", "paused_until"), row))
+                result = change(state, now)
+                self._conn.execute(
+                    "UPDATE hubspot_rate_limit SET tokens = ?, updated_at = ?, rate = ?, burst = ?, paused_until = ? "
+                    "WHERE name = ?",
+                    (state["tokens"], state["updated_at"], state["rate"], state["burst"], state["paused_until"], self.name),
+                )
+                self._conn.execute("COMMIT")
+                self._state = dict(state)
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _refill(state: Dict[str, float], now: float) -> None:
+        elapsed = max(now - state["updated_at"], 0.0)
+        state["tokens"] = min(state["burst"], state["tokens"] + elapsed * state["rate"])
+        state["updated_at"] = now
+
+    def _take(self, state: Dict[str, float], now: float) -> float:
+        """Take a token if one is available; otherwise return how long to wait."""
+        self._refill(state, now)
+        if state["paused_until"] > now:
+            return state["paused_until"] - now
+        if state["tokens"] >= 1:
+            state["tokens"] -= 1
+            return 0.0
+        return (1 - state["tokens"]) / state["rate"]
+
+    def acquire(self) -> float:
+        """Block until a request may be sent; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            wait = self._update(self._take)
+            if wait <= 0:
+                with self._lock:
+                    self.calls += 1
+                    self.waited_seconds += waited
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """Stop every caller sharing this bucket for `seconds` (after a 429)."""
+        def change(state, now):
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+            state["tokens"] = 0.0
+        self._update(change)
+
+    def observe(self, headers) -> None:
+        """Retune the bucket from HubSpot's X-HubSpot-RateLimit-* response headers."""
+        limit = _number(_header(headers, "X-HubSpot-RateLimit-Max"))
+        interval_ms = _number(_header(headers, "X-HubSpot-RateLimit-Interval-Milliseconds"))
+        remaining = _number(_header(headers, "X-HubSpot-RateLimit-Remaining"))
+        if limit is None and remaining is None:
+            return
+
+        def change(state, now):
+            self._refill(state, now)
+            if limit and interval_ms:
+                state["rate"] = limit * HEADROOM / (interval_ms / 1000.0)
+                state["burst"] = max(1.0, min(state["burst"], limit * HEADROOM))
+            if remaining is not None:
+                # Other clients on the portal spend from the same window; never hold more than it has left
+                reserve = limit * (1 - HEADROOM) if limit else 0.0
+                state["tokens"] = min(state["tokens"], max(remaining - reserve, 0.0))
+        self._update(change)
+
+    def _observe_response(self, fn: Callable) -> None:
+        # SDK API objects keep the raw response of their last call on api_client
+        response = getattr(getattr(getattr(fn, "__self__", None), "api_client", None), "last_response", None)
+        if response is not None:
+            try:
+                self.observe(response.getheaders())
+            except Exception:
+                pass
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Call a HubSpot SDK method under the limiter, retrying only on 429 and 5xx."""
+        operation = operation_name(fn)
+        for attempt in range(1, self.max_attempts + 1):
+            self.acquire()
+            try:
+                with external_call("hubspot", operation):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                status = getattr(e, "status", None)
+                headers = getattr(e, "headers", None)
+                self.observe(headers)
+                if not is_retryable(status) or attempt == self.max_attempts:
+                    raise
+                delay = retry_after_seconds(headers)
+                if delay is None:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                with self._lock:
+                    self.retries += 1
+                    if status == 429:
+                        self.throttled += 1
+                RETRIES.inc(component="hubspot")
+                if status == 429:
+                    logger.warning(f"HubSpot rate limit hit; pausing calls for {delay:.2f}s")
+                    self.pause(delay)
+                else:
+                    logger.warning(f"HubSpot returned {status}; retrying in {delay:.2f}s (attempt {attempt})")
+                    time.sleep(delay)
+                continue
+            self._observe_response(fn)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        state = self._update(lambda state, now: (self._refill(state, now), dict(state))[1])
+        return {
+            "rate": round(state["rate"], 3),
+            "burst": state["burst"],
+            "tokens": round(state["tokens"], 3),
+            "paused_for": round(max(state["paused_until"] - time.time(), 0.0), 3),
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+    def close(self) -> None:
+        if self.db_path:
+            self._conn.close()
+
+def get_rate_limiter(config: Dict[str, Any]) -> HubSpotRateLimiter:
+    """Process-wide limiter shared by every HubSpotAgent using the same API key."""
+    key = (config.get("hubspot_api_key"), config.get("hubspot_rate_limit_backend", "memory"))
+    return shared_instance("rate_limiter", key, lambda: HubSpotRateLimiter.from_config(config))
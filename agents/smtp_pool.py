@@ -0,0 +1,188 @@
+# agents/smtp_pool.py
+import smtplib
+import ssl
+import threading
+import time
+from email.message import EmailMessage
+from typing import Dict, Any, List, Optional, Callable
+from utils import logger
+
+class _PooledConnection:
+    """An authenticated SMTP session plus the bookkeeping the pool needs."""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+class SMTPConnectionPool:
+    """Thread-safe pool of long-lived, authenticated SMTP sessions.
+
+    Sessions are reused across messages (no TCP connect/STARTTLS/login per email),
+    health-checked with NOOP after sitting idle, evicted after `max_idle` seconds,
+    recycled after `max_messages`, and reconnected once on SMTPServerDisconnected.
+    """
+
+    def __init__(self, host: str, port: int = 587, username: Optional[str] = None, password: Optional[str] = None,
+                 security: str = "starttls", max_size: int = 4, max_idle: float = 60.0, max_messages: int = 100,
+                 health_check_after: float = 5.0, timeout: float = 30.0,
+                 connection_factory: Optional[Callable[[], smtplib.SMTP]] = None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self._factory = connection_factory or self.connect
+        self._idle: List[_PooledConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.reconnects = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "SMTPConnectionPool":
+        use_tls = str(config.get("smtp_use_tls", "true")).lower() in ("1", "true", "yes")
+        return cls(
+            host=config.get("smtp_host"),
+            port=int(config.get("smtp_port", 587)),
+            username=config.get("smtp_username"),
+            password=config.get("smtp_password"),
+            security=config.get("smtp_security", "starttls" if use_tls else "ssl"),
+            max_size=int(config.get("smtp_pool_size", 4)),
+            max_idle=float(config.get("smtp_pool_max_idle", 60)),
+            max_messages=int(config.get("smtp_pool_max_messages", 100)),
+        )
+
+    def connect(self) -> smtplib.SMTP:
+        """Open a new authenticated session outside the pool (caller closes it)."""
+        if self.security == "ssl":
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == "starttls":
+                server.starttls(context=ssl.create_default_context())
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        return server
+
+    def _new_connection(self) -> _PooledConnection:
+        conn = _PooledConnection(self._factory())
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _healthy(self, conn: _PooledConnection) -> bool:
+        now = time.monotonic()
+        if now - conn.last_used > self.max_idle:
+            return False
+        if now - conn.last_used > self.health_check_after:
+            try:
+                return conn.server.noop()[0] == 250
+            except Exception:
+                return False
+        return True
+
+    def _acquire(self) -> _PooledConnection:
+        self._slots.acquire()
+        try:
+            self.evict_idle()
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._new_connection()
+                healthy = self._healthy(conn)
+                with self._lock:
+                    if healthy:
+                        self.reused += 1
+                    else:
+                        self.evicted += 1
+                if healthy:
+                    return conn
+                conn.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: _PooledConnection, broken: bool = False) -> None:
+        try:
+            if broken or conn.messages_sent >= self.max_messages:
+                conn.close()
+            else:
+                conn.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def send_message(self, msg: EmailMessage) -> None:
+        """Send a message on a pooled session, reconnecting once if the server dropped it."""
+        conn = self._acquire()
+        try:
+            try:
+                conn.server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                with self._lock:
+                    self.reconnects += 1
+                logger.warning("SMTP session dropped by server; reconnecting")
+                conn.close()
+                conn = self._new_connection()
+                conn.server.send_message(msg)
+        except Exception:
+            self._release(conn, broken=True)
+            raise
+        conn.messages_sent += 1
+        self._release(conn)
+
+    def evict_idle(self) -> int:
+        """Close sessions idle longer than max_idle; returns how many were closed."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [c for c in self._idle if now - c.last_used > self.max_idle]
+            self._idle = [c for c in self._idle if c not in stale]
+            self.evicted += len(stale)
+        for conn in stale:
+            conn.close()
+        return len(stale)
+
+    def close(self) -> None:
+        """Close every idle session."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted,
+            "reconnects": self.reconnects,
+            "idle": len(self._idle),
+        }
+
+_pools: Dict[tuple, SMTPConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_smtp_pool(config: Dict[str, Any]) -> SMTPConnectionPool:
+    """Process-wide pool for the configured server, shared by every EmailAgent."""
+    key = (config.get("smtp_host"), int(config.get("smtp_port", 587)), config.get("smtp_username"))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SMTPConnectionPool.from_config(config)
+        return _pools[key]
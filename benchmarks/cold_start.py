@@ -0,0 +1,88 @@
+# benchmarks/cold_start.py
+"""Cold start of the webhook app: time to import it, the modules that cost most, and agent construction.
+
+Run from the repo root:
+    python -m benchmarks.cold_start --runs 5 --top 15 --output cold_start.json
+    python -m benchmarks.cold_start --module worker --warm-up
+
+Every run is a fresh interpreter (python -X importtime), as a serverless cold start
+is. Module costs are cumulative, so a package's figure includes whatever it imports.
+--warm-up also times graph.warm_up(), i.e. building the agents, which needs a
+loadable config (config.json or the GEMINI_API_KEY/HUBSPOT_API_KEY/SENDER_EMAIL env vars).
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, Any, List
+from benchmarks.common import summarize, write_results
+
+# Modules the probe imports itself after this stderr line are not part of the cold start
+_MARKER = "cold_start: imported"
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+result = {{"import": time.perf_counter() - start}}
+print({marker!r}, file=sys.stderr, flush=True)
+if {warm_up}:
+    import graph
+    start = time.perf_counter()
+    graph.warm_up()
+    result["warm_up"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """Cumulative import time in seconds per module from `python -X importtime` output, up to _MARKER."""
+    costs = {}
+    for line in stderr.splitlines():
+        if line == _MARKER:
+            break
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            costs[name.strip()] = int(cumulative) / 1e6
+        except ValueError:
+            continue
+    return costs
+
+def run_once(module: str, warm_up: bool) -> Dict[str, Any]:
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, warm_up=warm_up, marker=_MARKER)],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return {**json.loads(completed.stdout.strip().splitlines()[-1]), "modules": parse_importtime(completed.stderr)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold start of the app in fresh interpreters.")
+    parser.add_argument("--module", default="main", help="Module to import (main, worker, graph, ...).")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Report this many of the costliest modules.")
+    parser.add_argument("--warm-up", action="store_true", help="Also time building the agents (graph.warm_up).")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file.")
+    args = parser.parse_args()
+
+    runs = [run_once(args.module, args.warm_up) for _ in range(args.runs)]
+    modules: Dict[str, List[float]] = {}
+    for run in runs:
+        for name, seconds in run["modules"].items():
+            modules.setdefault(name, []).append(seconds)
+    costliest = sorted(modules.items(), key=lambda item: -sum(item[1]) / len(item[1]))[:args.top]
+    results: Dict[str, Any] = {
+        "import": summarize([run["import"] for run in runs]),
+        "modules": {name: round(1000 * sum(values) / len(values), 1) for name, values in costliest},
+    }
+    print(f"import {args.module}: p50={results['import']['p50_ms']}ms max={results['import']['max_ms']}ms "
+          f"({args.runs} runs)")
+    if args.warm_up:
+        results["warm_up"] = summarize([run["warm_up"] for run in runs])
+        print(f"graph.warm_up(): p50={results['warm_up']['p50_ms']}ms")
+    for name, ms in results["modules"].items():
+        print(f"{ms:>10.1f}ms  {name}")
+    if args.output:
+        write_results(args.output, "cold_start", {"module": args.module, "runs": args.runs, **results})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# benchmarks/common.py
+import json
+import math
+import platform
+import subprocess
+import time
+from typing import Dict, Any, List, Optional
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (pct in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(latencies: List[float], elapsed: Optional[float] = None) -> Dict[str, Any]:
+    """Latency distribution in milliseconds, plus throughput when the wall time is known."""
+    summary = {
+        "count": len(latencies),
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(1000 * percentile(latencies, 50), 3),
+        "p95_ms": round(1000 * percentile(latencies, 95), 3),
+        "p99_ms": round(1000 * percentile(latencies, 99), 3),
+        "max_ms": round(1000 * max(latencies), 3) if latencies else 0.0,
+    }
+    if elapsed:
+        summary["throughput_per_s"] = round(len(latencies) / elapsed, 2)
+    return summary
+
+def write_results(path: str, name: str, results: Dict[str, Any]) -> None:
+    """Write results as JSON tagged with the commit and host, so runs can be compared across commits."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    payload = {
+        "benchmark": name,
+        "commit": commit,
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
@@ -0,0 +1,237 @@
+# benchmarks/e2e.py
+"""End-to-end workflow latency and throughput, with every external service replaced by a local stand-in.
+
+Run from the repo root:
+    python -m benchmarks.e2e --targets graph webhook --requests 200 --concurrency 16 --output e2e.json
+
+Gemini is replaced by ScriptedLLM (--llm-latency), HubSpot by HubSpotEmulator
+(--hubspot-latency, and --hubspot-rate-limit requests per --hubspot-interval seconds
+before it answers 429). Email goes to a local SMTP sink or Mailjet stub (--email). No API
+keys are needed and nothing leaves the machine.
+
+"graph" calls build_graph() directly from --concurrency threads. "webhook" starts the
+FastAPI app under uvicorn and posts signed events to /webhook from --concurrency
+clients. The app runs with webhook_mode inline, so a response means the workflow has
+finished. Events mix contact, deal and company creations and property changes over
+--objects CRM objects.
+
+Per-node, external call and checkpoint breakdowns come from the metrics registry.
+Their percentiles are histogram bucket upper bounds, not exact values.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+from unittest.mock import patch
+import metrics
+from benchmarks.common import summarize, write_results
+from benchmarks.fakes import HubSpotEmulator, MailjetStub, SMTPSink, ScriptedLLM
+from agents.llm_usage import LLMUsageCallback
+from webhook_recorder import sign
+
+EVENT_TYPES = ("contact.creation", "contact.propertyChange", "deal.creation", "deal.propertyChange", "company.creation")
+WEBHOOK_SECRET = "benchmark-secret"
+
+def make_events(count: int, objects: int) -> List[Dict[str, Any]]:
+    """count webhook events cycling through EVENT_TYPES, spread over `objects` object ids."""
+    events = []
+    for i in range(count):
+        event = {"eventId": 100000 + i, "subscriptionType": EVENT_TYPES[i % len(EVENT_TYPES)],
+                 "objectId": 1 + i % objects, "occurredAt": 1700000000000 + i}
+        if event["subscriptionType"] == "contact.propertyChange":
+            event.update(propertyName="phone", propertyValue=f"555-{i % 10000:04d}")
+        elif event["subscriptionType"] == "deal.propertyChange":
+            event.update(propertyName="amount", propertyValue=str(1000 + i))
+        events.append(event)
+    return events
+
+def bench_config(args, tmp: str, hubspot: HubSpotEmulator, email_server) -> Dict[str, Any]:
+    config = {
+        "gemini_api_key": "benchmark",
+        "hubspot_api_key": "benchmark",
+        "hubspot_api_url": hubspot.url,
+        "sender_email": "automation@example.com",
+        "orchestrator_mode": "structured",
+        "orchestrator_cache_enabled": args.parse_cache,
+        "hubspot_dispatch_mode": "direct",
+        "hubspot_rate_limit": args.client_rate or args.hubspot_rate_limit / args.hubspot_interval,
+        "hubspot_rate_burst": args.hubspot_rate_limit,
+        "email_send_mode": "direct",
+        "checkpointer_backend": args.checkpointer,
+        "checkpointer_sqlite_path": f"{tmp}/checkpoints.db",
+        "webhook_mode": "inline",
+        "webhook_coalesce_window": args.coalesce_window,
+        "max_concurrent_workflows": args.concurrency,
+        "queue_db_path": f"{tmp}/automation.db",
+        "state_refs_db_path": f"{tmp}/refs.db",
+    }
+    if args.email == "smtp":
+        config.update(email_provider="smtp", smtp_host=email_server.host, smtp_port=email_server.port,
+                      smtp_security="none", smtp_username=None, smtp_password=None)
+    else:
+        config.update(email_provider="mailjet", mailjet_api_url=email_server.url,
+                      mailjet_api_key="benchmark", mailjet_api_secret="benchmark")
+    return config
+
+def _ms(seconds: float):
+    return None if seconds == float("inf") else round(1000 * seconds, 3)
+
+def _histogram(histogram: metrics.Histogram, **labels) -> Dict[str, Any]:
+    summary = histogram.summary(**labels)
+    return {"count": summary["count"], "mean_ms": _ms(summary["mean"]),
+            **{f"{name}_le_ms": _ms(summary[name]) for name in ("p50", "p95", "p99")}}
+
+def breakdown() -> Dict[str, Any]:
+    """What the metrics registry recorded during a run, per node, external call and checkpoint operation."""
+    return {
+        "nodes": {labels["node"]: _histogram(metrics.NODE_SECONDS, **labels)
+                  for labels in metrics.NODE_SECONDS.labelsets()},
+        "external_calls": {f"{labels['service']}.{labels['operation']}": {
+            **_histogram(metrics.EXTERNAL_SECONDS, **labels), "errors": metrics.EXTERNAL_ERRORS.value(**labels)}
+            for labels in metrics.EXTERNAL_SECONDS.labelsets()},
+        "checkpoints": {labels["operation"]: _histogram(metrics.CHECKPOINT_SECONDS, **labels)
+                        for labels in metrics.CHECKPOINT_SECONDS.labelsets()},
+        "llm_calls": metrics.LLM_CALLS.value(component="orchestrator"),
+        "retries": {labels["component"]: metrics.RETRIES.value(**labels) for labels in metrics.RETRIES.labelsets()},
+    }
+
+def run_graph(events: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    """Invoke the sync graph once per event from a thread pool."""
+    import graph
+    from webhooks import build_query, thread_id_for
+    workflow = graph.build_graph()
+    errors = 0
+    lock = threading.Lock()
+
+    def run_one(event: Dict[str, Any]) -> float:
+        nonlocal errors
+        state = {"query": build_query(event), "parsed_data": {}, "hubspot_result": {}, "email_result": {},
+                 "error": "", "messages": []}
+        start = time.perf_counter()
+        try:
+            final = workflow.invoke(state, {"configurable": {"thread_id": thread_id_for(event)}})
+            failed = bool(final.get("error"))
+        except Exception:
+            failed = True
+        if failed:
+            with lock:
+                errors += 1
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(run_one, events))
+    return {**summarize(latencies, time.perf_counter() - start), "errors": errors}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def run_webhook(events: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    """Serve the app with uvicorn and post every event to /webhook from `concurrency` clients."""
+    import httpx
+    import uvicorn
+    import main
+    os.environ["HUBSPOT_CLIENT_SECRET"] = WEBHOOK_SECRET
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    async def drive() -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        slots = asyncio.Semaphore(concurrency)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=300) as client:
+            async def post(event: Dict[str, Any]) -> float:
+                body = json.dumps(event).encode()
+                headers = {"Content-Type": "application/json", "X-HubSpot-Signature": sign(body, WEBHOOK_SECRET)}
+                async with slots:
+                    start = time.perf_counter()
+                    try:
+                        response = await client.post("/webhook", content=body, headers=headers)
+                        outcome = str(response.status_code)
+                        if response.status_code == 200:
+                            outcome = response.json().get("status", outcome)
+                    except httpx.HTTPError as e:
+                        outcome = type(e).__name__
+                    statuses[outcome] = statuses.get(outcome, 0) + 1
+                    return time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(post(event) for event in events))
+            elapsed = time.perf_counter() - start
+        return {**summarize(list(latencies), elapsed), "outcomes": statuses,
+                "errors": sum(count for outcome, count in statuses.items() if outcome != "success")}
+
+    try:
+        return asyncio.run(drive())
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the whole workflow against local stand-ins for its services.")
+    parser.add_argument("--targets", nargs="+", default=["graph", "webhook"], choices=["graph", "webhook"])
+    parser.add_argument("--requests", type=int, default=100, help="Events per target.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Workflows (graph) or clients (webhook) at once.")
+    parser.add_argument("--objects", type=int, default=50, help="Distinct CRM object ids the events refer to.")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds per scripted LLM call.")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="Extra uniform random seconds per LLM call.")
+    parser.add_argument("--hubspot-latency", type=float, default=0.05, help="Seconds the emulator waits per request.")
+    parser.add_argument("--hubspot-rate-limit", type=int, default=100, help="Emulator requests per interval before 429.")
+    parser.add_argument("--hubspot-interval", type=float, default=10.0, help="Emulator rate-limit window in seconds.")
+    parser.add_argument("--client-rate", type=float, help="hubspot_rate_limit for the agent (default: the emulator's).")
+    parser.add_argument("--email", default="mailjet", choices=["mailjet", "smtp"], help="Email stand-in (smtp needs aiosmtpd).")
+    parser.add_argument("--mailjet-latency", type=float, default=0.05, help="Seconds the Mailjet stub waits per call.")
+    parser.add_argument("--checkpointer", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--parse-cache", action="store_true", help="Keep the orchestrator parse cache on.")
+    parser.add_argument("--coalesce-window", type=float, default=0.0, help="webhook_coalesce_window for the app.")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file.")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.ExitStack() as stack:
+        hubspot = stack.enter_context(HubSpotEmulator(latency=args.hubspot_latency, rate_limit=args.hubspot_rate_limit,
+                                                      interval=args.hubspot_interval))
+        email_server = stack.enter_context(SMTPSink() if args.email == "smtp" else MailjetStub(latency=args.mailjet_latency))
+        config = bench_config(args, tmp, hubspot, email_server)
+        # graph.py binds utils.load_config when imported and builds its agents from it; they must see this config
+        stack.enter_context(patch("utils.load_config", return_value=config))
+        import graph
+        usage = LLMUsageCallback("orchestrator")
+        graph.orchestrator.structured_llm = ScriptedLLM(args.llm_latency, args.llm_jitter, usage_callback=usage)
+        graph.orchestrator.batch_llm = ScriptedLLM(args.llm_latency, args.llm_jitter, batch=True, usage_callback=usage)
+        for target in args.targets:
+            metrics.REGISTRY.clear()
+            requests_before, throttled_before = hubspot.requests, hubspot.throttled
+            events = make_events(args.requests, args.objects)
+            run = run_graph if target == "graph" else run_webhook
+            results[target] = r = run(events, args.concurrency)
+            r.update(breakdown())
+            r["hubspot_requests"] = hubspot.requests - requests_before
+            r["hubspot_throttled"] = hubspot.throttled - throttled_before
+            print(f"{target:>8}: p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms "
+                  f"({r['throughput_per_s']}/s, {r['errors']} errors, {r['hubspot_throttled']} HubSpot 429s)")
+            for node, n in r["nodes"].items():
+                print(f"{'':>10}{node:<14} mean={n['mean_ms']}ms p95<={n['p95_le_ms']}ms x{n['count']}")
+    if args.output:
+        write_results(args.output, "e2e", {
+            "requests": args.requests, "concurrency": args.concurrency, "objects": args.objects,
+            "llm_latency": args.llm_latency, "hubspot_latency": args.hubspot_latency,
+            "hubspot_rate_limit": args.hubspot_rate_limit, "hubspot_interval": args.hubspot_interval,
+            "email": args.email, "checkpointer": args.checkpointer, "targets": results,
+        })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# benchmarks/email_latency.py
+"""Per-email latency of EmailAgent in direct (template) mode versus agent (LLM) mode.
+
+Run from the repo root:
+    python -m benchmarks.email_latency --count 50 --modes direct agent
+    python -m benchmarks.email_latency --transport configured --output email.json
+
+--transport null replaces the provider call with a no-op so the numbers isolate
+rendering/LLM overhead; "configured" sends through the provider in config.json;
+"smtp-sink" sends over SMTP to a local aiosmtpd server and, with --smtp-pool both,
+compares pooled sessions with a new connection per email:
+    python -m benchmarks.email_latency --modes direct --transport smtp-sink --threads 8 --count 500
+
+"mailjet-stub" sends through the Mailjet client to a local v3.1 stub (--mailjet-latency
+models the API round trip) and, with --mailjet-batching both, compares one call per
+email with concurrent sends batched into one call:
+    python -m benchmarks.email_latency --modes direct --transport mailjet-stub --threads 32 --count 500
+
+Agent mode needs a real gemini_api_key.
+"""
+import argparse
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+from utils import load_config
+from agents.email_agent import EmailAgent
+from benchmarks.common import summarize, write_results
+from benchmarks.fakes import SMTPSink, MailjetStub
+
+SAMPLE_RESULT = {
+    "action": "create_contact",
+    "success": True,
+    "id": "12345",
+    "details": {"firstname": "John", "lastname": "Doe", "email": "john@example.com"},
+}
+
+def _null_send(to_email: str, subject: str, body: str, text_body: str = None) -> Dict[str, Any]:
+    return {"success": True}
+
+def run_mode(config: Dict[str, Any], mode: str, transport: str, count: int, to_email: str,
+             threads: int = 1) -> Dict[str, Any]:
+    agent = EmailAgent({**config, "email_send_mode": mode})
+    if transport == "null":
+        agent._send_via_smtp = _null_send
+        agent._send_via_mailjet = _null_send
+    failures = 0
+
+    def send_one(_) -> float:
+        nonlocal failures
+        t0 = time.perf_counter()
+        try:
+            result = agent.run(to_email, SAMPLE_RESULT)
+            if isinstance(result, dict) and result.get("success") is False:
+                failures += 1
+        except Exception:
+            failures += 1
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(send_one, range(count)))
+    return {**summarize(latencies, time.perf_counter() - start), "failures": failures}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-email latency of EmailAgent send modes.")
+    parser.add_argument("--count", type=int, default=20, help="Emails per mode.")
+    parser.add_argument("--modes", nargs="+", default=["direct", "agent"], choices=["direct", "agent"])
+    parser.add_argument("--transport", default="null", choices=["null", "configured", "smtp-sink", "mailjet-stub"])
+    parser.add_argument("--smtp-pool", default="both", choices=["on", "off", "both"],
+                        help="SMTP session pooling for smtp transports.")
+    parser.add_argument("--mailjet-batching", default="both", choices=["on", "off", "both"],
+                        help="Batch concurrent Mailjet sends for mailjet transports.")
+    parser.add_argument("--mailjet-latency", type=float, default=0.05,
+                        help="Seconds the Mailjet stub waits per API call.")
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent senders (sustained throughput).")
+    parser.add_argument("--to", default="benchmark@example.com", help="Recipient address.")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file.")
+    args = parser.parse_args()
+
+    config = load_config()
+    results = {}
+    with contextlib.ExitStack() as stack:
+        if args.transport == "smtp-sink":
+            sink = stack.enter_context(SMTPSink())
+            config = {**config, "email_provider": "smtp", "smtp_host": sink.host, "smtp_port": sink.port,
+                      "smtp_security": "none", "smtp_username": None, "smtp_password": None}
+        if args.transport == "mailjet-stub":
+            stub = stack.enter_context(MailjetStub(latency=args.mailjet_latency))
+            config = {**config, "email_provider": "mailjet", "mailjet_api_url": stub.url,
+                      "mailjet_api_key": "benchmark", "mailjet_api_secret": "benchmark"}
+        provider = config.get("email_provider", "smtp")
+        smtp = args.transport == "smtp-sink" or (args.transport == "configured" and provider == "smtp")
+        mailjet = args.transport == "mailjet-stub" or (args.transport == "configured" and provider == "mailjet")
+        if smtp:
+            setting, label = "smtp_pool_enabled", "pool"
+            values = {"on": ["true"], "off": ["false"], "both": ["false", "true"]}[args.smtp_pool]
+        elif mailjet:
+            setting, label = "mailjet_batching", "batch"
+            values = {"on": ["true"], "off": ["false"], "both": ["false", "true"]}[args.mailjet_batching]
+        else:
+            setting, label, values = None, None, [None]
+        for mode in args.modes:
+            for value in values:
+                run_config = config if value is None else {**config, setting: value}
+                name = mode if value is None else f"{mode}/{label}={'on' if value == 'true' else 'off'}"
+                calls_before = stub.requests if args.transport == "mailjet-stub" else 0
+                results[name] = r = run_mode(run_config, mode, args.transport, args.count, args.to, args.threads)
+                extra = ""
+                if args.transport == "mailjet-stub":
+                    r["api_calls"] = stub.requests - calls_before
+                    extra = f", {r['api_calls']} API calls"
+                print(f"{name:>18}: p50={r['p50_ms']}ms p95={r['p95_ms']}ms mean={r['mean_ms']}ms "
+                      f"({r['throughput_per_s']}/s, {r['failures']} failures{extra})")
+    if args.output:
+        write_results(args.output, "email_latency", {"transport": args.transport, "threads": args.threads,
+                                                     "modes": results})
+
+if __name__ == "__main__":
+    main()
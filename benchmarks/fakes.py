@@ -0,0 +1,347 @@
+# benchmarks/fakes.py
+"""Local stand-ins for external services, so benchmarks run offline."""
+import threading
+from typing import Optional
+
+class SMTPSink:
+    """Local SMTP server (aiosmtpd) that accepts and counts messages.
+
+    Usable as a context manager; `port` is chosen by the OS unless given.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError as e:
+            raise RuntimeError("SMTPSink needs aiosmtpd (pip install aiosmtpd)") from e
+        self.received = 0
+        self.sessions = 0
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler:
+            async def handle_EHLO(self, server, session, envelope, hostname, responses):
+                with sink._lock:
+                    sink.sessions += 1
+                session.host_name = hostname
+                return responses
+
+            async def handle_DATA(self, server, session, envelope):
+                with sink._lock:
+                    sink.received += 1
+                return "250 Message accepted"
+
+        if not port:
+            import socket
+            with socket.socket() as s:
+                s.bind((host, 0))
+                port = s.getsockname()[1]
+        self.host = host
+        self.port = port
+        self._controller = Controller(Handler(), hostname=host, port=port)
+
+    def __enter__(self) -> "SMTPSink":
+        self._controller.start()
+        return self
+
+    def __exit__(self, *exc) -> Optional[bool]:
+        self._controller.stop()
+        return None
+
+class MailjetStub:
+    """Local HTTP server answering Mailjet v3.1 /send calls with success for every message.
+
+    Counts API calls and messages so benchmarks can report messages per call;
+    `latency` adds a fixed delay per request to model the network round trip.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        import json
+        import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        self.requests = 0
+        self.messages = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                messages = json.loads(body or b"{}").get("Messages", [])
+                with stub._lock:
+                    stub.requests += 1
+                    stub.messages += len(messages)
+                if latency:
+                    time.sleep(latency)
+                payload = json.dumps({"Messages": [{"Status": "success"} for _ in messages]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self.url = f"http://{self.host}:{self.port}/"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "MailjetStub":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> Optional[bool]:
+        self._server.shutdown()
+        self._server.server_close()
+        return None
+
+class HubSpotEmulator:
+    """Local HTTP server emulating the CRM v3 object endpoints HubSpotAgent calls.
+
+    Serves create, update and get by id, plus batch create/update, for contacts,
+    deals and companies, keeping the objects in memory. Like HubSpot, it allows
+    `rate_limit` requests per `interval` seconds and answers 429 past that. Every
+    response carries the X-HubSpot-RateLimit-* headers. A contact created with a
+    known email gets 409 "Contact already exists. Existing ID: …". Updates to
+    unknown ids succeed unless `strict_ids` is set, since webhook ids point at
+    objects the emulator has never seen. `latency` adds a fixed delay per request.
+    Point the agent at `url` with the hubspot_api_url config key.
+    """
+
+    OBJECT_TYPES = ("contacts", "deals", "companies")
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, rate_limit: int = 100,
+                 interval: float = 10.0, strict_ids: bool = False):
+        import itertools
+        import json
+        import re
+        import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        self.requests = 0
+        self.throttled = 0
+        self.objects = {object_type: {} for object_type in self.OBJECT_TYPES}
+        self._emails = {}
+        self._ids = itertools.count(1001)
+        self._window = [time.monotonic(), 0]
+        self._lock = threading.Lock()
+        emulator = self
+        path_re = re.compile(r"^/crm/v3/objects/(contacts|deals|companies)(?:/(batch/create|batch/update|[^/?]+))?")
+        timestamp = "2026-01-01T00:00:00.000Z"
+
+        def stored(object_type, object_id, trace_id=None):
+            body = {"id": object_id, "properties": dict(emulator.objects[object_type][object_id]),
+                    "createdAt": timestamp, "updatedAt": timestamp, "archived": False}
+            if trace_id is not None:
+                body["objectWriteTraceId"] = trace_id
+            return body
+
+        def create(object_type, properties):
+            """(status, error message or object id); caller holds the lock."""
+            email = properties.get("email") if object_type == "contacts" else None
+            if email and email in emulator._emails:
+                return 409, f"Contact already exists. Existing ID: {emulator._emails[email]}"
+            object_id = str(next(emulator._ids))
+            emulator.objects[object_type][object_id] = dict(properties)
+            if email:
+                emulator._emails[email] = object_id
+            return 201, object_id
+
+        def update(object_type, object_id, properties):
+            objects = emulator.objects[object_type]
+            if object_id not in objects:
+                if strict_ids:
+                    return 404, f"Object not found. objectId are usually numeric. {object_id}"
+                objects[object_id] = {}
+            objects[object_id].update(properties)
+            if object_type == "contacts" and properties.get("email"):
+                emulator._emails[properties["email"]] = object_id
+            return 200, object_id
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status, payload, remaining):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("X-HubSpot-RateLimit-Max", str(rate_limit))
+                self.send_header("X-HubSpot-RateLimit-Remaining", str(remaining))
+                self.send_header("X-HubSpot-RateLimit-Interval-Milliseconds", str(int(interval * 1000)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, status, message, remaining, category="VALIDATION_ERROR"):
+                self._reply(status, {"status": "error", "message": message, "category": category}, remaining)
+
+            def _handle(self, method):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if latency:
+                    time.sleep(latency)
+                with emulator._lock:
+                    emulator.requests += 1
+                    now = time.monotonic()
+                    if now - emulator._window[0] >= interval:
+                        emulator._window = [now, 0]
+                    emulator._window[1] += 1
+                    remaining = max(rate_limit - emulator._window[1], 0)
+                    if emulator._window[1] > rate_limit:
+                        emulator.throttled += 1
+                        return self._error(429, "You have reached your secondly limit.", 0, "RATE_LIMITS")
+                    match = path_re.match(self.path)
+                    if not match:
+                        return self._error(404, f"No route for {method} {self.path}", remaining, "OBJECT_NOT_FOUND")
+                    object_type, rest = match.groups()
+                    request = json.loads(body or b"{}")
+                    if rest in ("batch/create", "batch/update") and method == "POST":
+                        results, errors = [], []
+                        for item in request.get("inputs", []):
+                            if rest == "batch/create":
+                                status, value = create(object_type, item.get("properties") or {})
+                            else:
+                                status, value = update(object_type, str(item.get("id")), item.get("properties") or {})
+                            if status == 409:
+                                # HubSpot rejects the whole batch when one input conflicts
+                                return self._error(409, value, remaining, "CONFLICT")
+                            if status >= 400:
+                                errors.append({"status": "error", "category": "OBJECT_NOT_FOUND", "message": value,
+                                               "context": {"ids": [str(item.get("id"))]}})
+                            else:
+                                results.append(stored(object_type, value, item.get("objectWriteTraceId")))
+                        payload = {"status": "COMPLETE", "results": results, "startedAt": timestamp,
+                                   "completedAt": timestamp}
+                        if errors:
+                            payload.update(errors=errors, numErrors=len(errors))
+                        return self._reply(207 if errors else 201 if rest == "batch/create" else 200, payload, remaining)
+                    if rest is None and method == "POST":
+                        status, value = create(object_type, request.get("properties") or {})
+                    elif rest and method == "PATCH":
+                        status, value = update(object_type, rest.split("?")[0], request.get("properties") or {})
+                    elif rest and method == "GET":
+                        object_id = rest.split("?")[0]
+                        status, value = (200, object_id) if object_id in emulator.objects[object_type] else (404, "Object not found")
+                    else:
+                        return self._error(405, f"{method} not supported on {self.path}", remaining)
+                    if status >= 400:
+                        return self._error(status, value, remaining, "CONFLICT" if status == 409 else "OBJECT_NOT_FOUND")
+                    return self._reply(status, stored(object_type, value), remaining)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self.url = f"http://{self.host}:{self.port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "HubSpotEmulator":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> Optional[bool]:
+        self._server.shutdown()
+        self._server.server_close()
+        return None
+
+def scripted_parse(query: str):
+    """A plausible ParsedQuery for a CRM instruction or webhook query, read from its text.
+
+    The object type comes from the words contact/deal/company, update versus create
+    from words like "update" or "changed", and properties from the local classifier's
+    slot filling. A create that states no properties gets a placeholder one, the way a
+    model fills the gap, so every query produces a valid parse.
+    """
+    import re
+    import zlib
+    from agents.intent_classifier import extract_properties
+    from agents.intent_schema import ParsedQuery, ContactProperties, DealProperties, CompanyProperties
+    text = query.lower()
+    group = "deal" if "deal" in text else "company" if "company" in text else "contact"
+    updating = re.search(r"\b(update|updated|change|changed|set)\b", text) is not None
+    record_id, properties = extract_properties(query)
+    if group == "company":
+        updating = False  # there is no update_company intent
+    fields = {"contact": ContactProperties, "deal": DealProperties, "company": CompanyProperties}[group].model_fields
+    properties = {name: value for name, value in properties.items() if name in fields}
+    if updating and not record_id:
+        updating = False
+    if not properties:
+        key = record_id or str(zlib.crc32(query.encode()) % 100000)
+        properties = {"contact": {"email": f"contact{key}@example.com"}, "deal": {"dealname": f"Deal {key}"},
+                      "company": {"name": f"Company {key}"}}[group]
+    return ParsedQuery(intent=f"{'update' if updating else 'create'}_{group}", id=record_id if updating else None,
+                       **{group: properties})
+
+class ScriptedLLM:
+    """Stand-in for the orchestrator's structured-output model (Gemini with include_raw=True).
+
+    Each call sleeps `latency` seconds, plus a uniform `jitter`, then answers with
+    {"raw", "parsed", "parsing_error"}. `parsed` comes from `script(query)`, which
+    defaults to scripted_parse. With batch=True it answers the numbered lists that
+    batch parsing sends, as a ParsedBatch. The raw message reports token usage
+    estimated from the prompt and answer lengths, and is passed to `usage_callback`
+    (an LLMUsageCallback) as the real model's callbacks would.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, script=None, batch: bool = False,
+                 usage_callback=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.script = script or scripted_parse
+        self.batch = batch
+        self.usage_callback = usage_callback
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _delay(self) -> float:
+        import random
+        return self.latency + random.uniform(0, self.jitter)
+
+    def _answer(self, messages) -> dict:
+        import re
+        from types import SimpleNamespace
+        from agents.intent_schema import ParsedBatch, BatchItem
+        with self._lock:
+            self.calls += 1
+        query = next(content for role, content in messages if role == "human")
+        if self.batch:
+            items = []
+            for line in query.splitlines():
+                match = re.match(r"(\d+)\. (.*)", line)
+                if match:
+                    parsed = self.script(match.group(2))
+                    items.append(BatchItem(index=int(match.group(1)), **parsed.model_dump()))
+            parsed = ParsedBatch(items=items)
+        else:
+            parsed = self.script(query)
+        content = parsed.model_dump_json(exclude_none=True)
+        prompt = sum(len(str(content)) for _, content in messages)
+        usage = {"input_tokens": prompt // 4 + 1, "output_tokens": len(content) // 4 + 1}
+        if self.usage_callback:
+            self.usage_callback.record(usage)
+        return {"raw": SimpleNamespace(content=content, usage_metadata=usage), "parsed": parsed, "parsing_error": None}
+
+    def invoke(self, messages, *args, **kwargs) -> dict:
+        import time
+        time.sleep(self._delay())
+        return self._answer(messages)
+
+    async def ainvoke(self, messages, *args, **kwargs) -> dict:
+        import asyncio
+        await asyncio.sleep(self._delay())
+        return self._answer(messages)
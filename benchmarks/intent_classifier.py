@@ -0,0 +1,64 @@
+# benchmarks/intent_classifier.py
+"""Offline evaluation of the local intent classifier on a held-out slice of logged orchestrator results.
+
+Run from the repo root:
+    python -m benchmarks.intent_classifier --log orchestrator_results.jsonl --holdout 0.2
+    python -m benchmarks.intent_classifier --log orchestrator_results.jsonl --thresholds 0.5 0.6 0.8 --output intent.json
+
+The classifier is trained on the rest of the log. For each threshold it reports the
+fallback rate (queries left to the LLM), intent accuracy and exact payload match on the
+queries it answered, and per-query latency of the local parse.
+"""
+import argparse
+import random
+import time
+from typing import Dict, Any, List
+from agents.intent_classifier import IntentClassifier, load_examples
+from benchmarks.common import summarize, write_results
+
+def evaluate(classifier: IntentClassifier, holdout: List[Dict[str, Any]]) -> Dict[str, Any]:
+    latencies = []
+    answered = correct_intent = correct_payload = 0
+    for example in holdout:
+        start = time.perf_counter()
+        parsed = classifier.parse(example["query"])
+        latencies.append(time.perf_counter() - start)
+        if parsed is None:
+            continue
+        answered += 1
+        correct_intent += parsed["intent"] == example["intent"]
+        correct_payload += parsed == {"intent": example["intent"], "payload": example.get("payload")}
+    result = summarize(latencies)
+    result.update({
+        "fallback_rate": round(1 - answered / len(holdout), 4) if holdout else 0.0,
+        "intent_accuracy": round(correct_intent / answered, 4) if answered else 0.0,
+        "payload_accuracy": round(correct_payload / answered, 4) if answered else 0.0,
+    })
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local intent classifier on a held-out set.")
+    parser.add_argument("--log", required=True, help="JSON-lines log of LLM parses (orchestrator_log_path).")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of the log held out for evaluation.")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6], help="Confidence thresholds to compare.")
+    parser.add_argument("--seed", type=int, default=0, help="Shuffle seed for the train/holdout split.")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file.")
+    args = parser.parse_args()
+
+    examples = load_examples(args.log)
+    random.Random(args.seed).shuffle(examples)
+    split = max(1, int(len(examples) * args.holdout))
+    holdout, train = examples[:split], examples[split:]
+    classifier = IntentClassifier().train([(e["query"], e["intent"]) for e in train])
+    results = {}
+    for threshold in args.thresholds:
+        classifier.threshold = threshold
+        results[str(threshold)] = r = evaluate(classifier, holdout)
+        print(f"threshold={threshold}: intent accuracy={r['intent_accuracy']} payload accuracy={r['payload_accuracy']} "
+              f"fallback rate={r['fallback_rate']} p50={r['p50_ms']}ms p99={r['p99_ms']}ms")
+    if args.output:
+        write_results(args.output, "intent_classifier", {"train": len(train), "holdout": len(holdout),
+                                                         "thresholds": results})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/state_size.py
+"""Checkpoint bytes and serialization time per workflow run, compact state versus the old representation.
+
+Run from the repo root:
+    python -m benchmarks.state_size --runs 20 --properties 40 --output state.json
+
+Every run reuses one thread, as webhook runs for the same object do. The agents are
+replaced with fakes, so only the graph and its checkpointer are measured.
+
+"legacy" reproduces the state before compaction. The history has no cap, each
+entry carries the node's full result, and hubspot_result holds the whole HubSpot
+object. Old nodes also returned the whole history for add_messages to merge by
+message id; that is not replayed here, so legacy numbers are a lower bound.
+"compact" is the current AgentState: a capped history of status entries, with
+details stored as references.
+"""
+import argparse
+import contextlib
+import tempfile
+import time
+from typing import Dict, Any
+from unittest.mock import patch
+from langgraph.checkpoint.memory import InMemorySaver
+import graph
+from benchmarks.common import write_results
+from state_refs import StateRefStore
+
+def _fake_agents(properties: int):
+    details = {f"property_{i}": f"value {i} " + "x" * 24 for i in range(properties)}
+    details["email"] = "john@example.com"
+    parsed = {"intent": "update_contact", "payload": {"id": "12345", "properties": {"phone": "555-0100"}}}
+    hubspot = {"success": True, "id": "12345", "details": details}
+    return [
+        patch.object(graph.orchestrator, "run", lambda query: parsed),
+        patch.object(graph.hubspot, "run", lambda intent, payload: hubspot),
+        patch.object(graph.email_agent, "run", lambda to_email, action_result: {"success": True}),
+    ]
+
+def run_variant(variant: str, runs: int, properties: int, refs_path: str) -> Dict[str, Any]:
+    saver = InMemorySaver()
+    with contextlib.ExitStack() as stack:
+        for patcher in _fake_agents(properties):
+            stack.enter_context(patcher)
+        if variant == "legacy":
+            stack.enter_context(patch.object(graph, "MAX_MESSAGES", 10 ** 9))
+            stack.enter_context(patch.object(graph, "state_refs", None))
+            stack.enter_context(patch.object(graph, "_message", lambda role, content: {"role": role, "content": content}))
+        else:
+            stack.enter_context(patch.object(graph, "state_refs", StateRefStore(refs_path)))
+        workflow = graph.build_graph(saver)
+        thread = {"configurable": {"thread_id": f"webhook-{variant}"}}
+        for _ in range(runs):
+            workflow.invoke({"query": "Process updated contact with ID 12345", "parsed_data": {}, "hubspot_result": {},
+                             "email_result": {}, "error": "", "messages": []}, thread)
+        final = workflow.get_state(thread).values
+    # Serialize every checkpoint of the thread the way a database checkpointer would store it
+    sizes, seconds = [], 0.0
+    for checkpoint in saver.list(thread):
+        start = time.perf_counter()
+        _, data = saver.serde.dumps_typed(checkpoint.checkpoint)
+        seconds += time.perf_counter() - start
+        sizes.append(len(data))
+    return {
+        "checkpoints": len(sizes),
+        "bytes_total": sum(sizes),
+        "bytes_per_run": round(sum(sizes) / runs),
+        "last_checkpoint_bytes": sizes[0] if sizes else 0,
+        "serialize_ms_per_run": round(1000 * seconds / runs, 3),
+        "messages_in_state": len(final.get("messages", [])),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure checkpoint size and serialization time per workflow run.")
+    parser.add_argument("--runs", type=int, default=10, help="Workflow runs on the same thread.")
+    parser.add_argument("--properties", type=int, default=40, help="Properties in the fake HubSpot object.")
+    parser.add_argument("--variants", nargs="+", default=["legacy", "compact"], choices=["legacy", "compact"])
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file.")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant in args.variants:
+            results[variant] = r = run_variant(variant, args.runs, args.properties, f"{tmp}/refs.db")
+            print(f"{variant:>8}: {r['bytes_per_run']} bytes/run, last checkpoint {r['last_checkpoint_bytes']} bytes, "
+                  f"{r['serialize_ms_per_run']}ms serialization/run, {r['messages_in_state']} messages")
+    if args.output:
+        write_results(args.output, "state_size", {"runs": args.runs, "properties": args.properties, "variants": results})
+
+if __name__ == "__main__":
+    main()
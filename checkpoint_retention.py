@@ -0,0 +1,186 @@
+# checkpoint_retention.py
+import asyncio
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+import psycopg
+from checkpointer import checkpointer_backend
+from utils import logger
+
+TABLES = ("checkpoints", "checkpoint_blobs", "checkpoint_writes")
+
+# One row per thread and namespace: checkpoint count and time of the newest checkpoint
+_THREADS_SQL = """
+    SELECT thread_id, checkpoint_ns, count(*) AS checkpoints,
+           max(extract(epoch FROM (checkpoint->>'ts')::timestamptz))::float8 AS last_ts
+    FROM checkpoints GROUP BY thread_id, checkpoint_ns"""
+
+_DELETE_THREADS_SQL = """
+    WITH w AS (DELETE FROM checkpoint_writes WHERE thread_id = ANY(%(threads)s) RETURNING 1),
+         b AS (DELETE FROM checkpoint_blobs WHERE thread_id = ANY(%(threads)s) RETURNING 1),
+         c AS (DELETE FROM checkpoints WHERE thread_id = ANY(%(threads)s) RETURNING 1)
+    SELECT (SELECT count(*) FROM c), (SELECT count(*) FROM w), (SELECT count(*) FROM b)"""
+
+# Drop all but the newest `keep` checkpoints per thread and namespace, with their pending writes
+_TRIM_SQL = """
+    WITH doomed AS (
+        SELECT thread_id, checkpoint_ns, checkpoint_id FROM (
+            SELECT thread_id, checkpoint_ns, checkpoint_id,
+                   row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+            FROM checkpoints WHERE thread_id = ANY(%(threads)s)) ranked
+        WHERE rn > %(keep)s
+    ), w AS (
+        DELETE FROM checkpoint_writes x USING doomed d
+        WHERE x.thread_id = d.thread_id AND x.checkpoint_ns = d.checkpoint_ns AND x.checkpoint_id = d.checkpoint_id
+        RETURNING 1
+    ), c AS (
+        DELETE FROM checkpoints x USING doomed d
+        WHERE x.thread_id = d.thread_id AND x.checkpoint_ns = d.checkpoint_ns AND x.checkpoint_id = d.checkpoint_id
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM c), (SELECT count(*) FROM w)"""
+
+# Channel values no remaining checkpoint of the thread points at
+_ORPHAN_BLOBS_SQL = """
+    DELETE FROM checkpoint_blobs b WHERE b.thread_id = ANY(%(threads)s) AND NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+          AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version)"""
+
+_STORAGE_SQL = """
+    SELECT relname, pg_total_relation_size(oid), greatest(reltuples, 0)::bigint
+    FROM pg_class WHERE relname = ANY(%s) AND relkind = 'r'"""
+
+def plan_retention(rows: List[Tuple[str, str, int, Optional[float]]], now: float, ttl: float = 0,
+                   compact_after: float = 0, max_per_thread: int = 0) -> Tuple[List[str], Dict[int, List[str]]]:
+    """Decide what to prune from (thread_id, checkpoint_ns, count, newest checkpoint epoch) rows.
+
+    Returns the threads to delete outright (idle for longer than ttl) and, per number
+    of checkpoints to keep, the threads to trim: idle for longer than compact_after
+    keeps only the final checkpoint, any other thread keeps max_per_thread.
+    A limit of 0 disables that rule.
+    """
+    threads: Dict[str, Dict[str, Any]] = {}
+    for thread_id, _, count, last_ts in rows:
+        thread = threads.setdefault(thread_id, {"last_ts": None, "most": 0})
+        if last_ts is not None and (thread["last_ts"] is None or last_ts > thread["last_ts"]):
+            thread["last_ts"] = last_ts
+        thread["most"] = max(thread["most"], count)
+    expired: List[str] = []
+    trims: Dict[int, List[str]] = {}
+    for thread_id, thread in threads.items():
+        idle = now - thread["last_ts"] if thread["last_ts"] is not None else None
+        if ttl and idle is not None and idle > ttl:
+            expired.append(thread_id)
+        elif compact_after and idle is not None and idle > compact_after and thread["most"] > 1:
+            trims.setdefault(1, []).append(thread_id)
+        elif max_per_thread and thread["most"] > max_per_thread:
+            trims.setdefault(max_per_thread, []).append(thread_id)
+    return expired, trims
+
+class CheckpointPruner:
+    """Applies checkpoint retention to the Postgres checkpointer tables.
+
+    Deletes run a few hundred threads per statement, each statement committing on its
+    own with a short pause in between, so the workflow's writes to the same tables are
+    never held up for long.
+    """
+
+    def __init__(self, db_uri: str, ttl: float = 7 * 86400, compact_after: float = 3600, max_per_thread: int = 20,
+                 batch_size: int = 200, pause: float = 0.1):
+        self.db_uri = db_uri
+        self.ttl = ttl
+        self.compact_after = compact_after
+        self.max_per_thread = max_per_thread
+        self.batch_size = batch_size
+        self.pause = pause
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "CheckpointPruner":
+        if checkpointer_backend(config) != "postgres":
+            raise ValueError("Checkpoint retention applies to the postgres checkpointer_backend only")
+        db_uri = config.get('neon_db_uri')
+        if not db_uri:
+            raise ValueError("Neon DB URI not found in config. Add 'neon_db_uri' to config.json.")
+        return cls(
+            db_uri,
+            ttl=float(config.get("checkpoint_ttl", 7 * 86400)),
+            compact_after=float(config.get("checkpoint_compact_after", 3600)),
+            max_per_thread=int(config.get("checkpoint_max_per_thread", 20)),
+            batch_size=int(config.get("checkpoint_prune_batch_size", 200)),
+            pause=float(config.get("checkpoint_prune_pause", 0.1)),
+        )
+
+    def _connect(self) -> psycopg.Connection:
+        return psycopg.connect(self.db_uri, autocommit=True, prepare_threshold=0)
+
+    @staticmethod
+    def _storage(conn: psycopg.Connection) -> Dict[str, Any]:
+        tables = {name: {"bytes": size, "rows_estimate": rows}
+                  for name, size, rows in conn.execute(_STORAGE_SQL, (list(TABLES),)).fetchall()}
+        return {"tables": tables, "total_bytes": sum(t["bytes"] for t in tables.values())}
+
+    def storage_report(self) -> Dict[str, Any]:
+        """On-disk size (with indexes and TOAST) and estimated rows of each checkpoint table."""
+        with self._connect() as conn:
+            return self._storage(conn)
+
+    def _batches(self, threads: List[str]):
+        for start in range(0, len(threads), self.batch_size):
+            if start:
+                time.sleep(self.pause)
+            yield threads[start:start + self.batch_size]
+
+    def prune(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Apply the TTL, compaction and per-thread limits; returns counts, storage and throughput."""
+        with self._lock, self._connect() as conn:
+            start = time.perf_counter()
+            before = self._storage(conn)
+            rows = conn.execute(_THREADS_SQL).fetchall()
+            expired, trims = plan_retention(rows, time.time(), self.ttl, self.compact_after, self.max_per_thread)
+            result = {
+                "threads": len({row[0] for row in rows}),
+                "threads_expired": len(expired),
+                "threads_trimmed": sum(len(threads) for threads in trims.values()),
+                "checkpoints_deleted": 0, "writes_deleted": 0, "blobs_deleted": 0, "statements": 0,
+                "dry_run": dry_run,
+            }
+            if not dry_run:
+                for batch in self._batches(expired):
+                    checkpoints, writes, blobs = conn.execute(_DELETE_THREADS_SQL, {"threads": batch}).fetchone()
+                    result["checkpoints_deleted"] += checkpoints
+                    result["writes_deleted"] += writes
+                    result["blobs_deleted"] += blobs
+                    result["statements"] += 1
+                for keep, threads in trims.items():
+                    for batch in self._batches(threads):
+                        checkpoints, writes = conn.execute(_TRIM_SQL, {"threads": batch, "keep": keep}).fetchone()
+                        result["blobs_deleted"] += conn.execute(_ORPHAN_BLOBS_SQL, {"threads": batch}).rowcount
+                        result["checkpoints_deleted"] += checkpoints
+                        result["writes_deleted"] += writes
+                        result["statements"] += 2
+            elapsed = time.perf_counter() - start
+            deleted = result["checkpoints_deleted"] + result["writes_deleted"] + result["blobs_deleted"]
+            result.update({
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_deleted_per_second": round(deleted / elapsed, 1) if elapsed else 0.0,
+                "storage_before": before,
+                "storage_after": self._storage(conn),
+            })
+        logger.info(f"Checkpoint prune: {result['threads_expired']} threads expired, {result['threads_trimmed']} trimmed, "
+                    f"{deleted} rows deleted in {result['elapsed_seconds']}s")
+        self.last_result = result
+        return result
+
+    async def run_periodically(self, interval: float) -> None:
+        """Prune every `interval` seconds until cancelled (run as a background task)."""
+        while True:
+            try:
+                await asyncio.to_thread(self.prune)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Checkpoint prune failed: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,209 @@
+# checkpointer.py
+import contextvars
+import functools
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, Any, AsyncIterator, Optional
+from utils import logger
+from metrics import CHECKPOINT_SECONDS
+
+# Savers, psycopg and its pool are imported by the backend that uses them (they add to cold starts)
+if TYPE_CHECKING:
+    from langgraph.checkpoint.base import BaseCheckpointSaver
+    from langgraph.checkpoint.postgres import PostgresSaver
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from psycopg_pool import ConnectionPool, AsyncConnectionPool
+
+BACKENDS = ("postgres", "sqlite", "memory")
+_LATEST_MIGRATION = "SELECT v FROM checkpoint_migrations ORDER BY v DESC LIMIT 1"
+
+def checkpointer_backend(config: Dict[str, Any]) -> str:
+    backend = config.get("checkpointer_backend", "postgres").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown checkpointer_backend '{backend}'; expected one of {', '.join(BACKENDS)}")
+    return backend
+
+def pool_size(config: Dict[str, Any]) -> int:
+    """Connections the workflow can use at once: one per queue worker (plus one spare), or per inline workflow."""
+    if "checkpointer_pool_size" in config:
+        return int(config["checkpointer_pool_size"])
+    if config.get("webhook_mode", "inline") == "queue":
+        return int(config.get("worker_concurrency", 4)) + 1
+    return int(config.get("max_concurrent_workflows", 32))
+
+def _db_uri(config: Dict[str, Any]) -> str:
+    db_uri = config.get('neon_db_uri')
+    if not db_uri:
+        raise ValueError("Neon DB URI not found in config. Add 'neon_db_uri' to config.json.")
+    return db_uri
+
+def _migrations_current(row: Optional[Dict[str, Any]], saver) -> bool:
+    return row is not None and row["v"] >= len(saver.MIGRATIONS) - 1
+
+def _setup(saver: "PostgresSaver", pool: "ConnectionPool") -> None:
+    """Run setup() only when checkpoint_migrations is missing or behind."""
+    from psycopg import errors
+    with pool.connection() as conn:
+        try:
+            row = conn.execute(_LATEST_MIGRATION).fetchone()
+        except errors.UndefinedTable:
+            row = None
+    if _migrations_current(row, saver):
+        logger.info("Checkpoint migrations are current; skipping setup.")
+        return
+    saver.setup()
+    logger.info("Checkpoint tables created/migrated.")
+
+async def _asetup(saver: "AsyncPostgresSaver", pool: "AsyncConnectionPool") -> None:
+    """Async variant of _setup."""
+    from psycopg import errors
+    async with pool.connection() as conn:
+        try:
+            row = await (await conn.execute(_LATEST_MIGRATION)).fetchone()
+        except errors.UndefinedTable:
+            row = None
+    if _migrations_current(row, saver):
+        logger.info("Checkpoint migrations are current; skipping setup.")
+        return
+    await saver.setup()
+    logger.info("Checkpoint tables created/migrated.")
+
+def _pool_kwargs(config: Dict[str, Any]) -> Dict[str, Any]:
+    from psycopg.rows import dict_row
+    size = pool_size(config)
+    return {
+        "min_size": min(size, int(config.get("checkpointer_pool_min_size", 1))),
+        "max_size": size,
+        "timeout": float(config.get("checkpointer_pool_timeout", 30)),
+        # What the Postgres savers expect of their connections; no prepared statements so Neon's pooler works
+        "kwargs": {"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+    }
+
+def _sqlite_path(config: Dict[str, Any]) -> str:
+    return config.get("checkpointer_sqlite_path", "checkpoints.db")
+
+# Saver methods timed into checkpoint_seconds, with their a-prefixed async variants
+_TIMED_METHODS = {"get_tuple": "read", "put": "write", "put_writes": "write"}
+# Set while a timed method runs, so a saver whose async method calls its sync one is timed once
+_timing = contextvars.ContextVar("checkpoint_timing", default=False)
+
+def _timed(method, operation: str):
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        if _timing.get():
+            return method(*args, **kwargs)
+        token = _timing.set(True)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            CHECKPOINT_SECONDS.observe(time.perf_counter() - start, operation=operation)
+            _timing.reset(token)
+    return timed
+
+def _atimed(method, operation: str):
+    @functools.wraps(method)
+    async def timed(*args, **kwargs):
+        if _timing.get():
+            return await method(*args, **kwargs)
+        token = _timing.set(True)
+        start = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            CHECKPOINT_SECONDS.observe(time.perf_counter() - start, operation=operation)
+            _timing.reset(token)
+    return timed
+
+def instrument(saver: "BaseCheckpointSaver") -> "BaseCheckpointSaver":
+    """Time the saver's reads and writes into checkpoint_seconds; patched on the instance."""
+    for name, operation in _TIMED_METHODS.items():
+        setattr(saver, name, _timed(getattr(saver, name), operation))
+        setattr(saver, f"a{name}", _atimed(getattr(saver, f"a{name}"), operation))
+    return saver
+
+class _Checkpointer:
+    """A saver and the pool or connection it owns."""
+
+    def __init__(self, saver: "BaseCheckpointSaver", resource=None):
+        self.saver = instrument(saver)
+        self.resource = resource
+
+    def close(self) -> None:
+        if self.resource is not None:
+            self.resource.close()
+
+def _open(config: Dict[str, Any]) -> _Checkpointer:
+    backend = checkpointer_backend(config)
+    if backend == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        return _Checkpointer(InMemorySaver())
+    if backend == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+        except ImportError as e:
+            raise RuntimeError("The sqlite checkpointer needs langgraph-checkpoint-sqlite") from e
+        conn = sqlite3.connect(_sqlite_path(config), check_same_thread=False)
+        return _Checkpointer(SqliteSaver(conn), conn)
+    from langgraph.checkpoint.postgres import PostgresSaver
+    from psycopg_pool import ConnectionPool
+    pool = ConnectionPool(_db_uri(config), open=True, **_pool_kwargs(config))
+    try:
+        saver = PostgresSaver(pool)
+        _setup(saver, pool)
+    except Exception:
+        pool.close()
+        raise
+    logger.info(f"Postgres checkpointer pool open (max {pool.max_size} connections).")
+    return _Checkpointer(saver, pool)
+
+_checkpointers: Dict[str, _Checkpointer] = {}
+_checkpointers_lock = threading.Lock()
+
+def _registry_key(config: Dict[str, Any]) -> str:
+    backend = checkpointer_backend(config)
+    if backend == "postgres":
+        return f"postgres:{config.get('neon_db_uri')}"
+    if backend == "sqlite":
+        return f"sqlite:{_sqlite_path(config)}"
+    return "memory"
+
+def get_checkpointer(config: Dict[str, Any]) -> "BaseCheckpointSaver":
+    """Process-wide sync checkpointer for checkpointer_backend; its pool stays open until close_checkpointers()."""
+    key = _registry_key(config)
+    with _checkpointers_lock:
+        if key not in _checkpointers:
+            _checkpointers[key] = _open(config)
+        return _checkpointers[key].saver
+
+def close_checkpointers() -> None:
+    with _checkpointers_lock:
+        for checkpointer in _checkpointers.values():
+            checkpointer.close()
+        _checkpointers.clear()
+
+@asynccontextmanager
+async def open_async_checkpointer(config: Dict[str, Any]) -> AsyncIterator["BaseCheckpointSaver"]:
+    """Async checkpointer for checkpointer_backend that stays open for the context (the app's lifetime)."""
+    backend = checkpointer_backend(config)
+    if backend == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        yield instrument(InMemorySaver())
+        return
+    if backend == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        except ImportError as e:
+            raise RuntimeError("The sqlite checkpointer needs langgraph-checkpoint-sqlite and aiosqlite") from e
+        async with AsyncSqliteSaver.from_conn_string(_sqlite_path(config)) as saver:
+            yield instrument(saver)
+        return
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from psycopg_pool import AsyncConnectionPool
+    async with AsyncConnectionPool(_db_uri(config), open=False, **_pool_kwargs(config)) as pool:
+        saver = AsyncPostgresSaver(pool)
+        await _asetup(saver, pool)
+        logger.info(f"Async Postgres checkpointer pool open (max {pool.max_size} connections).")
+        yield instrument(saver)
@@ -1,138 +1,321 @@
-from typing import TypedDict, Annotated, Dict, Any
-from langgraph.graph import StateGraph, START, END
-from langgraph.graph.message import add_messages
-from langgraph.checkpoint.postgres import PostgresSaver  # Use Neon PostgreSQL
-from utils import logger, load_config
-from agents.orchestrator import OrchestratorAgent
-from agents.hubspot_agent import HubSpotAgent
-from agents.email_agent import EmailAgent
-
-# State Schema
-class AgentState(TypedDict):
-    """Shared state for the multi-agent workflow."""
-    query: str
-    parsed_data: Dict[str, Any]
-    hubspot_result: Dict[str, Any]
-    email_result: Dict[str, Any]
-    messages: Annotated[list, add_messages]
-    error: str
-
-# Node Functions and Router
-config = load_config()
-orchestrator = OrchestratorAgent(config)
-hubspot = HubSpotAgent(config)
-email_agent = EmailAgent(config)
-
-def orchestrator_node(state: AgentState) -> AgentState:
-    """Run Orchestrator to parse query."""
-    try:
-        parsed = orchestrator.run(state['query'])
-        logger.info(f"Parsed data: {parsed}")
-        return {"parsed_data": parsed, "messages": state['messages'] + [{"role": "orchestrator", "content": parsed}]}
-    except Exception as e:
-        logger.error(f"Orchestrator node error: {str(e)}")
-        return {"error": str(e)}
-
-def hubspot_node(state: AgentState) -> AgentState:
-    """Run HubSpot based on parsed intent/payload."""
-    if not state.get('parsed_data'):
-        return {"error": "No parsed data available"}
-    try:
-        intent = state['parsed_data'].get('intent')
-        payload = state['parsed_data'].get('payload', {})
-        result = hubspot.run(intent, payload)
-        logger.info(f"HubSpot node result: {result}")
-        return {"hubspot_result": result, "messages": state['messages'] + [{"role": "hubspot", "content": result}]}
-    except Exception as e:
-        logger.error(f"HubSpot node error: {str(e)}")
-        return {"error": str(e)}
-
-def email_node(state: AgentState) -> AgentState:
-    """Run Email if HubSpot succeeded."""
-    if not state.get('hubspot_result', {}).get('success'):
-        return {"error": "HubSpot failed, skipping email"}
-    try:
-        # Extract email from the payload or use a default from config
-        to_email = state['parsed_data'].get('payload', {}).get('properties', {}).get('email')
-        if not to_email:
-            # Fallback to a default email from config or use a generic one
-            to_email = "user@example.com"  # In a real app, this should come from config
-        result = email_agent.run(to_email, state['hubspot_result'])
-        logger.info(f"Email node result: {result}")
-        return {"email_result": result, "messages": state['messages'] + [{"role": "email", "content": result}]}
-    except Exception as e:
-        logger.error(f"Email node error: {str(e)}")
-        return {"error": str(e)}
-
-def error_handler_node(state: AgentState) -> AgentState:
-    """Handle errors gracefully."""
-    error_msg = state.get('error', "Unknown error")
-    logger.warning(f"Error handled: {error_msg}")
-    return {"messages": state['messages'] + [{"role": "error", "content": error_msg}]}
-
-def router(state: AgentState) -> str:
-    """Decide next node based on state."""
-    if state.get('error'):
-        return "error_handler"
-    if state.get('parsed_data'):
-        intent = state['parsed_data'].get('intent', '')
-        if intent in ["create_contact", "update_contact", "create_deal", "update_deal", "create_company"]:
-            return "hubspot"
-        else:
-            return END
-    if state.get('hubspot_result', {}).get('success'):
-        return "email"
-    if state.get('email_result'):
-        return END
-    return "error_handler"
-
-# Build Graph with Neon PostgreSQL
-def build_graph() -> StateGraph:
-    """Build and compile the LangGraph workflow with Neon PostgreSQL persistence."""
-    graph_builder = StateGraph(state_schema=AgentState)
-    
-    # Add nodes
-    graph_builder.add_node("orchestrator", orchestrator_node)
-    graph_builder.add_node("hubspot", hubspot_node)
-    graph_builder.add_node("email", email_node)
-    graph_builder.add_node("error_handler", error_handler_node)
-    
-    # Edges
-    graph_builder.add_edge(START, "orchestrator")
-    
-    # Conditional edges from orchestrator
-    graph_builder.add_conditional_edges(
-        "orchestrator",
-        router,
-        {"hubspot": "hubspot", "error_handler": "error_handler", END: END}
-    )
-    
-    # From hubspot
-    graph_builder.add_conditional_edges(
-        "hubspot",
-        router,
-        {"email": "email", "error_handler": "error_handler", END: END}
-    )
-    
-    # From email to end
-    graph_builder.add_conditional_edges(
-        "email",
-        router,
-        {END: END, "error_handler": "error_handler"}
-    )
-    
-    # From error to end
-    graph_builder.add_edge("error_handler", END)
-    
-    # Persistence with Neon PostgreSQL
-    config = load_config()
-    db_uri = config.get('neon_db_uri')
-    if not db_uri:
-        raise ValueError("Neon DB URI not found in config. Add 'neon_db_uri' to config.json.")
-    
-    with PostgresSaver.from_conn_string(db_uri, pipeline=True) as checkpointer:
-        checkpointer.setup()  # Creates tables if needed
-        graph = graph_builder.compile(checkpointer=checkpointer)
-    
-    logger.info("Graph compiled with Neon PostgreSQL persistence.")
+import asyncio
+import functools
+import threading
+import time
+from collections import Counter
+from typing import TypedDict, Annotated, Dict, Any, List, Optional
+from langgraph.graph import StateGraph, START, END
+from utils import logger, load_config, open_optional
+from checkpointer import get_checkpointer
+from state_refs import get_state_ref_store
+from metrics import NODE_SECONDS, NODE_ERRORS, STARTUP_SECONDS
+from agents.intent_schema import HUBSPOT_INTENTS
+
+def append_messages(left: Optional[List[Dict[str, Any]]], right: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Reducer for AgentState.messages: nodes return only their new entries, which are appended.
+
+    Past state_max_messages entries, the oldest are folded into one leading summary
+    entry that counts them by role, so the history a checkpoint carries stays bounded.
+    """
+    entries = list(left or []) + list(right or [])
+    summary = entries.pop(0) if entries and entries[0].get("role") == "summary" else None
+    limit = max(1, (MAX_MESSAGES or int(_config().get("state_max_messages", 20))) - 1)
+    if len(entries) <= limit:
+        return ([summary] if summary else []) + entries
+    dropped, entries = entries[:-limit], entries[-limit:]
+    counts = Counter(summary["content"]["by_role"]) if summary else Counter()
+    counts.update(entry.get("role", "unknown") for entry in dropped)
+    summary = {"role": "summary", "content": {"dropped": sum(counts.values()), "by_role": dict(counts)}}
+    return [summary] + entries
+
+# State Schema
+class AgentState(TypedDict):
+    """Shared state for the multi-agent workflow.
+
+    hubspot_result fields of state_ref_min_bytes or more (the object's details) are
+    stored by state_refs and kept here as {"$ref": key}.
+    """
+    query: str
+    parsed_data: Dict[str, Any]
+    hubspot_result: Dict[str, Any]
+    email_result: Dict[str, Any]
+    messages: Annotated[list, append_messages]
+    error: str
+
+_UNSET = object()
+
+class _Lazy:
+    """Stand-in for a module-level object that is built by factory on first attribute access.
+
+    Importing this module stays cheap (no config, LangChain, HubSpot or Mailjet client
+    set-up); attribute reads, writes and deletes go to the built object, so
+    patch.object(graph.orchestrator, ...) works as it would on the agent itself.
+    """
+
+    def __init__(self, name: str, factory):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_target", _UNSET)
+
+    def _resolve(self) -> Any:
+        target = self._target
+        if target is _UNSET:
+            with self._lock:
+                target = self._target
+                if target is _UNSET:
+                    start = time.perf_counter()
+                    target = self._factory()
+                    elapsed = time.perf_counter() - start
+                    STARTUP_SECONDS.set(elapsed, phase=self._name)
+                    logger.info(f"Built {self._name} in {elapsed * 1000:.0f} ms")
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._resolve(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self._resolve(), name)
+
+    def __bool__(self) -> bool:
+        return bool(self._resolve())
+
+@functools.lru_cache(maxsize=None)
+def _config() -> Dict[str, Any]:
+    return load_config()
+
+def _orchestrator():
+    from agents.orchestrator import OrchestratorAgent
+    return OrchestratorAgent(_config())
+
+def _hubspot():
+    from agents.hubspot_agent import HubSpotAgent
+    return HubSpotAgent(_config())
+
+def _email_agent():
+    from agents.email_agent import EmailAgent
+    return EmailAgent(_config())
+
+def _state_refs():
+    # Opt-in: refs live in a local SQLite file, so every process that runs workflows must share it
+    if str(_config().get("state_refs_enabled", "false")).lower() not in ("1", "true", "yes"):
+        return None
+    return open_optional("State ref store", lambda: get_state_ref_store(_config()))
+
+# Node Functions and Router
+# Config and agents are built on first use (or all at once by warm_up), not when this module is imported
+MAX_MESSAGES: Optional[int] = None  # None: config state_max_messages
+state_refs = _Lazy("state_refs", _state_refs)
+orchestrator = _Lazy("orchestrator", _orchestrator)
+hubspot = _Lazy("hubspot", _hubspot)
+email_agent = _Lazy("email_agent", _email_agent)
+
+def warm_up() -> None:
+    """Build the agents and the state ref store now rather than in the first workflow run."""
+    for lazy in (state_refs, orchestrator, hubspot, email_agent):
+        lazy._resolve()
+
+def _message(role: str, content: Any) -> Dict[str, Any]:
+    """A history entry; result dicts are cut down to their status fields (the full result is in state)."""
+    if isinstance(content, dict):
+        content = {name: content[name] for name in ("intent", "success", "id", "error") if name in content}
+    return {"role": role, "content": content}
+
+def _compact(result: Any) -> Any:
+    return state_refs.compact(result) if state_refs and isinstance(result, dict) else result
+
+def _expand(result: Any) -> Any:
+    return state_refs.expand(result) if state_refs and isinstance(result, dict) else result
+
+def orchestrator_node(state: AgentState) -> AgentState:
+    """Run Orchestrator to parse query."""
+    try:
+        parsed = orchestrator.run(state['query'])
+        logger.info(f"Parsed data: {parsed}")
+        return {"parsed_data": parsed, "messages": [_message("orchestrator", parsed)]}
+    except Exception as e:
+        logger.error(f"Orchestrator node error: {str(e)}")
+        return {"error": str(e)}
+
+def hubspot_node(state: AgentState) -> AgentState:
+    """Run HubSpot based on parsed intent/payload."""
+    if not state.get('parsed_data'):
+        return {"error": "No parsed data available"}
+    try:
+        intent = state['parsed_data'].get('intent')
+        payload = state['parsed_data'].get('payload', {})
+        result = hubspot.run(intent, payload)
+        logger.info(f"HubSpot node result: {result}")
+        return {"hubspot_result": _compact(result), "messages": [_message("hubspot", result)]}
+    except Exception as e:
+        logger.error(f"HubSpot node error: {str(e)}")
+        return {"error": str(e)}
+
+def email_node(state: AgentState) -> AgentState:
+    """Run Email if HubSpot succeeded."""
+    if not state.get('hubspot_result', {}).get('success'):
+        return {"error": "HubSpot failed, skipping email"}
+    try:
+        # Extract email from the payload or use a default from config
+        to_email = state['parsed_data'].get('payload', {}).get('properties', {}).get('email')
+        if not to_email:
+            # Fallback to a default email from config or use a generic one
+            to_email = "user@example.com"  # In a real app, this should come from config
+        action_result = {"action": state['parsed_data'].get('intent'), **_expand(state['hubspot_result'])}
+        result = email_agent.run(to_email, action_result)
+        logger.info(f"Email node result: {result}")
+        return {"email_result": result, "messages": [_message("email", result)]}
+    except Exception as e:
+        logger.error(f"Email node error: {str(e)}")
+        return {"error": str(e)}
+
+def error_handler_node(state: AgentState) -> AgentState:
+    """Handle errors gracefully."""
+    error_msg = state.get('error', "Unknown error")
+    logger.warning(f"Error handled: {error_msg}")
+    return {"messages": [_message("error", error_msg)]}
+
+# Async node variants (used by build_async_graph so the event loop is never blocked)
+async def aorchestrator_node(state: AgentState) -> AgentState:
+    """Run Orchestrator to parse query (async)."""
+    try:
+        parsed = await orchestrator.arun(state['query'])
+        logger.info(f"Parsed data: {parsed}")
+        return {"parsed_data": parsed, "messages": [_message("orchestrator", parsed)]}
+    except Exception as e:
+        logger.error(f"Orchestrator node error: {str(e)}")
+        return {"error": str(e)}
+
+async def ahubspot_node(state: AgentState) -> AgentState:
+    """Run HubSpot based on parsed intent/payload (async)."""
+    if not state.get('parsed_data'):
+        return {"error": "No parsed data available"}
+    try:
+        intent = state['parsed_data'].get('intent')
+        payload = state['parsed_data'].get('payload', {})
+        result = await hubspot.arun(intent, payload)
+        logger.info(f"HubSpot node result: {result}")
+        return {"hubspot_result": await asyncio.to_thread(_compact, result), "messages": [_message("hubspot", result)]}
+    except Exception as e:
+        logger.error(f"HubSpot node error: {str(e)}")
+        return {"error": str(e)}
+
+async def aemail_node(state: AgentState) -> AgentState:
+    """Run Email if HubSpot succeeded (async)."""
+    if not state.get('hubspot_result', {}).get('success'):
+        return {"error": "HubSpot failed, skipping email"}
+    try:
+        to_email = state['parsed_data'].get('payload', {}).get('properties', {}).get('email')
+        if not to_email:
+            to_email = "user@example.com"  # In a real app, this should come from config
+        hubspot_result = await asyncio.to_thread(_expand, state['hubspot_result'])
+        action_result = {"action": state['parsed_data'].get('intent'), **hubspot_result}
+        result = await email_agent.arun(to_email, action_result)
+        logger.info(f"Email node result: {result}")
+        return {"email_result": result, "messages": [_message("email", result)]}
+    except Exception as e:
+        logger.error(f"Email node error: {str(e)}")
+        return {"error": str(e)}
+
+def router(state: AgentState) -> str:
+    """Decide next node based on state."""
+    if state.get('error'):
+        return "error_handler"
+    # Latest stage first: parsed_data stays set after the HubSpot and email steps
+    if state.get('email_result'):
+        return END
+    if state.get('hubspot_result'):
+        return "email"  # the email node turns a failed HubSpot result into an error
+    if state.get('parsed_data'):
+        intent = state['parsed_data'].get('intent', '')
+        if intent in HUBSPOT_INTENTS:
+            return "hubspot"
+        else:
+            return END
+    return "error_handler"
+
+def _timed(name: str, node):
+    """Wrap a node so its run time and error updates land in the node metrics."""
+    def record(start: float, update: Any) -> Any:
+        NODE_SECONDS.observe(time.perf_counter() - start, node=name)
+        if name != "error_handler" and isinstance(update, dict) and update.get("error"):
+            NODE_ERRORS.inc(node=name)
+        return update
+
+    if asyncio.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def timed_async(state: AgentState) -> AgentState:
+            start = time.perf_counter()
+            return record(start, await node(state))
+        return timed_async
+
+    @functools.wraps(node)
+    def timed(state: AgentState) -> AgentState:
+        start = time.perf_counter()
+        return record(start, node(state))
+    return timed
+
+# Build Graph with Neon PostgreSQL
+def _build_workflow(async_nodes: bool = False) -> StateGraph:
+    """Wire nodes and edges; async_nodes selects the coroutine node variants."""
+    graph_builder = StateGraph(state_schema=AgentState)
+    
+    # Add nodes (each timed into workflow_node_seconds)
+    if async_nodes:
+        nodes = {"orchestrator": aorchestrator_node, "hubspot": ahubspot_node, "email": aemail_node}
+    else:
+        nodes = {"orchestrator": orchestrator_node, "hubspot": hubspot_node, "email": email_node}
+    nodes["error_handler"] = error_handler_node
+    for name, node in nodes.items():
+        graph_builder.add_node(name, _timed(name, node))
+    
+    # Edges
+    graph_builder.add_edge(START, "orchestrator")
+    
+    # Conditional edges from orchestrator
+    graph_builder.add_conditional_edges(
+        "orchestrator",
+        router,
+        {"hubspot": "hubspot", "error_handler": "error_handler", END: END}
+    )
+    
+    # From hubspot
+    graph_builder.add_conditional_edges(
+        "hubspot",
+        router,
+        {"email": "email", "error_handler": "error_handler", END: END}
+    )
+    
+    # From email to end
+    graph_builder.add_conditional_edges(
+        "email",
+        router,
+        {END: END, "error_handler": "error_handler"}
+    )
+    
+    # From error to end
+    graph_builder.add_edge("error_handler", END)
+    return graph_builder
+
+def build_graph(checkpointer=None) -> StateGraph:
+    """Build and compile the LangGraph workflow.
+
+    Without a checkpointer, uses the process-wide one for checkpointer_backend
+    (pooled Neon PostgreSQL by default), which stays open after this returns.
+    """
+    graph_builder = _build_workflow()
+    if checkpointer is None:
+        checkpointer = get_checkpointer(load_config())
+    graph = graph_builder.compile(checkpointer=checkpointer)
+    logger.info(f"Graph compiled with {type(checkpointer).__name__} persistence.")
+    return graph
+
+def build_async_graph(checkpointer) -> StateGraph:
+    """Compile the workflow with async nodes; drive it with astream/ainvoke."""
+    graph = _build_workflow(async_nodes=True).compile(checkpointer=checkpointer)
+    logger.info("Async graph compiled.")
     return graph
\ No newline at end of file
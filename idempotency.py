@@ -0,0 +1,51 @@
+# idempotency.py
+from typing import Dict, Any, List, Optional
+from ttl_store import TTLStore
+
+class IdempotencyStore:
+    """Remembers processed webhook deliveries for `ttl` seconds (a TTLStore table).
+
+    HubSpot redelivers events on timeouts; a delivery whose key is already recorded
+    gets the recorded result back instead of a second orchestrator -> HubSpot -> email run.
+    """
+
+    def __init__(self, path: str = "hubspot_automation.db", ttl: float = 86400.0, max_entries: int = 10000):
+        self._store = TTLStore(path, "webhook_idempotency", column="record", ttl=ttl, max_entries=max_entries)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "IdempotencyStore":
+        return cls(
+            path=config.get("idempotency_db_path", config.get("queue_db_path", "hubspot_automation.db")),
+            ttl=float(config.get("idempotency_ttl", 86400)),
+            max_entries=int(config.get("idempotency_max_entries", 10000)),
+        )
+
+    @staticmethod
+    def key_for(event: Dict[str, Any]) -> str:
+        """Delivery key from HubSpot's eventId/objectId/occurredAt (stable across redeliveries)."""
+        return ":".join(str(event.get(field, "")) for field in
+                        ("subscriptionType", "eventId", "objectId", "occurredAt"))
+
+    @staticmethod
+    def keys_for(event: Dict[str, Any]) -> List[str]:
+        """Keys of every delivery an event stands for: all members of a coalesced burst, else its own."""
+        return event.get('idempotencyKeys') or [IdempotencyStore.key_for(event)]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the recorded result for a delivery key, or None if unseen or expired."""
+        return self._store.get(key)
+
+    def put(self, key: str, record: Dict[str, Any]) -> None:
+        """Record the outcome for a delivery key (overwrites an earlier marker such as 'queued')."""
+        self._store.put(key, record)
+
+    def prune(self) -> int:
+        """Drop expired records from the persistent tier; returns the number removed."""
+        return self._store.prune()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters."""
+        return self._store.stats()
+
+    def close(self) -> None:
+        self._store.close()
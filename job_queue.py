@@ -0,0 +1,179 @@
+# job_queue.py
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+from utils import logger
+
+class JobQueue:
+    """Durable SQLite-backed queue of webhook events with visibility timeouts and retry.
+
+    A claimed job stays invisible for `visibility_timeout` seconds; if the worker
+    neither acks nor fails it in that time (crash, redeploy) it becomes claimable again.
+    Workers call `extend` while a job runs, so a long workflow is not claimed twice.
+    """
+
+    def __init__(self, path: str = "hubspot_automation.db", visibility_timeout: float = 300.0,
+                 max_attempts: int = 5, retry_backoff: float = 5.0):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS webhook_jobs (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                last_error TEXT,
+                ordering_key TEXT
+            )""")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(webhook_jobs)")}
+        if "ordering_key" not in columns:
+            self._conn.execute("ALTER TABLE webhook_jobs ADD COLUMN ordering_key TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS webhook_jobs_ready_idx ON webhook_jobs(status, available_at)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS webhook_jobs_key_idx ON webhook_jobs(ordering_key, status)")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "JobQueue":
+        return cls(
+            path=config.get("queue_db_path", "hubspot_automation.db"),
+            visibility_timeout=float(config.get("queue_visibility_timeout", 300)),
+            max_attempts=int(config.get("queue_max_attempts", 5)),
+            retry_backoff=float(config.get("queue_retry_backoff", 5)),
+        )
+
+    def enqueue(self, payload: Dict[str, Any], ordering_key: Optional[str] = None) -> str:
+        """Persist an event and return its job id.
+
+        Jobs sharing an ordering_key are never run concurrently, so they complete in order.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO webhook_jobs (id, payload, status, attempts, available_at, created_at, updated_at, "
+                "ordering_key) VALUES (?, ?, 'queued', 0, ?, ?, ?, ?)",
+                (job_id, json.dumps(payload), now, now, now, ordering_key))
+        return job_id
+
+    def enqueue_many(self, payloads: List[Dict[str, Any]],
+                     ordering_keys: Optional[List[Optional[str]]] = None) -> List[str]:
+        """Persist a batch of events in one transaction and return their job ids."""
+        now = time.time()
+        keys = ordering_keys or [None] * len(payloads)
+        rows = [(uuid.uuid4().hex, json.dumps(payload), now, now, now, key) for payload, key in zip(payloads, keys)]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO webhook_jobs (id, payload, status, attempts, available_at, created_at, updated_at, "
+                    "ordering_key) VALUES (?, ?, 'queued', 0, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [row[0] for row in rows]
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Claim the oldest ready job (queued, or running with an expired visibility timeout).
+
+        Only the oldest unfinished job of an ordering_key is claimable: a later job for
+        the same object waits while an earlier one runs or waits out its retry backoff.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM webhook_jobs AS job WHERE status IN ('queued', 'running') AND available_at <= ? "
+                    "AND (ordering_key IS NULL OR NOT EXISTS ("
+                    "  SELECT 1 FROM webhook_jobs AS earlier WHERE earlier.ordering_key = job.ordering_key "
+                    "  AND earlier.status IN ('queued', 'running') "
+                    "  AND (earlier.created_at < job.created_at "
+                    "       OR (earlier.created_at = job.created_at AND earlier.rowid < job.rowid)))) "
+                    "ORDER BY created_at, rowid LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE webhook_jobs SET status = 'running', attempts = attempts + 1, "
+                    "available_at = ?, updated_at = ? WHERE id = ?",
+                    (now + self.visibility_timeout, now, row["id"]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {
+            "id": row["id"],
+            "payload": json.loads(row["payload"]),
+            "attempts": row["attempts"] + 1,
+            "lag": now - row["created_at"],
+        }
+
+    def extend(self, job_id: str) -> None:
+        """Push a running job's visibility timeout `visibility_timeout` seconds past now (a heartbeat)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE webhook_jobs SET available_at = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (now + self.visibility_timeout, now, job_id))
+
+    def ack(self, job_id: str) -> None:
+        """Mark a job as done."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE webhook_jobs SET status = 'done', updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def fail(self, job_id: str, error: str) -> bool:
+        """Schedule a retry with exponential backoff, or mark failed after max_attempts (returns True)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM webhook_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            if row["attempts"] >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE webhook_jobs SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, job_id))
+                logger.error(f"Job {job_id} failed permanently after {row['attempts']} attempts: {error}")
+                return True
+            else:
+                delay = self.retry_backoff * (2 ** (row["attempts"] - 1))
+                self._conn.execute(
+                    "UPDATE webhook_jobs SET status = 'queued', last_error = ?, available_at = ?, updated_at = ? "
+                    "WHERE id = ?", (error, now + delay, now, job_id))
+                logger.warning(f"Job {job_id} attempt {row['attempts']} failed, retrying in {delay:.1f}s: {error}")
+                return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and lag, for scaling workers."""
+        now = time.time()
+        with self._lock:
+            counts = {r["status"]: r["n"] for r in self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM webhook_jobs GROUP BY status")}
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) AS t FROM webhook_jobs WHERE status = 'queued'").fetchone()["t"]
+        return {
+            "depth": counts.get("queued", 0),
+            "in_flight": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_lag_seconds": round(now - oldest, 3) if oldest else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,123 +1,384 @@
-# webhook_server.py
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from utils import logger
-from graph import build_graph, AgentState
-import uvicorn
-import os
-import hmac
-import hashlib
-import base64
-from typing import Optional
-
-app = FastAPI()
-
-# Configure CORS (adjust origins in production)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Try to initialize graph; if failure keep running but mark graph None
-try:
-    graph = build_graph()
-except Exception as e:
-    logger.error(f"Graph initialization failed: {e}")
-    graph = None
-
-def _get_hubspot_client_secret() -> Optional[str]:
-    # Prefer environment variable (Vercel). Fallback to config.json if present.
-    return os.getenv("HUBSPOT_CLIENT_SECRET")
-
-async def verify_hubspot_signature(request: Request, secret: str) -> bool:
-    """
-    Verify HubSpot webhook signature.
-    HubSpot sends header 'X-HubSpot-Signature' which is HMAC-SHA256 of the raw body, base64-encoded.
-    """
-    try:
-        body = await request.body()  # bytes
-        signature_header = request.headers.get("X-HubSpot-Signature") or request.headers.get("x-hubspot-signature")
-        if not signature_header:
-            logger.warning("Missing HubSpot signature header")
-            return False
-        # Compute expected signature: base64(hmac_sha256(secret, body))
-        digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
-        expected_sig = base64.b64encode(digest).decode()
-        # Use compare_digest to avoid timing attacks
-        return hmac.compare_digest(expected_sig, signature_header)
-    except Exception as e:
-        logger.error(f"Signature verification error: {e}")
-        return False
-
-@app.get("/")
-async def root():
-    return {"status": "healthy", "service": "hubspot-automation"}
-
-# Keep existing /hubspot-webhook for backward compatibility
-@app.post("/hubspot-webhook")
-async def hubspot_webhook(request: Request):
-    # Delegates to common handler without signature enforcement (keeps old behavior)
-    data = await request.json()
-    logger.info(f"/hubspot-webhook received: {data}")
-    event_type = data.get('subscriptionType', '')
-    if event_type == 'contact.creation':
-        object_id = data.get('objectId')
-        query = f"Process new contact with ID {object_id}"
-        initial_state = {"query": query, "messages": []}
-        try:
-            if not graph:
-                raise RuntimeError("Graph not initialized")
-            for event in graph.stream(initial_state, {"configurable": {"thread_id": f"webhook-{object_id}"}}):
-                logger.info(f"Graph event: {event}")
-            final_state = graph.get_state({"configurable": {"thread_id": f"webhook-{object_id}"}}).values
-            logger.info(f"Graph result: {final_state}")
-            return {"status": "success", "result": final_state}
-        except Exception as e:
-            logger.error(f"Webhook processing failed: {str(e)}")
-            return {"status": "error", "message": str(e)}
-    return {"status": "ignored", "message": f"Event {event_type} not handled"}
-
-# New preferred /webhook route with signature verification
-@app.post("/webhook")
-async def hubspot_webhook_secure(request: Request):
-    secret = _get_hubspot_client_secret()
-    if not secret:
-        logger.error("HUBSPOT_CLIENT_SECRET not configured in environment")
-        raise HTTPException(status_code=500, detail="Webhook verification not configured")
-    # Verify signature first
-    if not await verify_hubspot_signature(request, secret):
-        logger.warning("Invalid HubSpot webhook signature")
-        raise HTTPException(status_code=401, detail="Invalid signature")
-    # Parse JSON after verification
-    data = await request.json()
-    logger.info(f"Verified webhook received: {data}")
-    event_type = data.get('subscriptionType', '')
-    if event_type == 'contact.creation':
-        object_id = data.get('objectId')
-        query = f"Process new contact with ID {object_id}"
-        initial_state = {"query": query, "messages": []}
-        try:
-            if not graph:
-                raise RuntimeError("Graph not initialized")
-            for event in graph.stream(initial_state, {"configurable": {"thread_id": f"webhook-{object_id}"}}):
-                logger.info(f"Graph event: {event}")
-            final_state = graph.get_state({"configurable": {"thread_id": f"webhook-{object_id}"}}).values
-            logger.info(f"Graph result: {final_state}")
-            return {"status": "success", "result": final_state}
-        except Exception as e:
-            logger.error(f"Webhook processing failed: {str(e)}")
-            return {"status": "error", "message": str(e)}
-    return {"status": "ignored", "message": f"Event {event_type} not handled"}
-
-@app.get("/health")
-async def health():
-    return {"status": "ok"}
-
-if __name__ == "__main__":
-    if os.getenv('VERCEL_ENV'):
-        logger.info("Running on Vercel")
-    else:
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+# webhook_server.py
+import time
+_IMPORT_STARTED = time.perf_counter()
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager, AsyncExitStack
+from utils import logger, load_config, open_optional
+from checkpointer import open_async_checkpointer
+from webhook_recorder import WebhookRecorder
+import metrics
+from job_queue import JobQueue
+from idempotency import IdempotencyStore
+from webhooks import (process_event, process_batch, parse_events, event_summary, object_key,
+                      EventCoalescer, HANDLED_EVENT_TYPES)
+from worker import WorkerPool
+from agents.object_cache import get_object_cache, HubSpotObjectCache
+from agents.crm_index import get_crm_index, CRMIndex
+from agents.parse_cache import get_parse_cache, ParseCache
+import asyncio
+import uvicorn
+import os
+import hmac
+import hashlib
+import base64
+from typing import TYPE_CHECKING, Optional, Dict, Any, List
+
+# graph (LangGraph and the agents) and the checkpoint pruner are imported when first needed
+if TYPE_CHECKING:
+    from checkpoint_retention import CheckpointPruner
+
+metrics.STARTUP_SECONDS.set(time.perf_counter() - _IMPORT_STARTED, phase="import")
+
+# Compiled async graph; set during startup, or by the first get_graph() with lazy_init.
+# If initialization fails keep running with graph None
+graph = None
+# With lazy_init the checkpointer is opened into the lifespan's exit stack on first use
+_lazy_stack: Optional[AsyncExitStack] = None
+_lazy_config: Optional[Dict[str, Any]] = None
+_graph_lock = asyncio.Lock()
+# Bounds the number of workflows in flight on this worker (config: max_concurrent_workflows)
+workflow_limiter = asyncio.Semaphore(32)
+# Durable queue behind /webhook when webhook_mode is "queue" (opt-in; the default runs inline)
+job_queue: Optional[JobQueue] = None
+# Short-circuits HubSpot redeliveries (config: idempotency_enabled)
+idempotency_store: Optional[IdempotencyStore] = None
+# Merge bursts of events per CRM object before they are queued or run (config: webhook_coalesce_window)
+queue_coalescer: Optional[EventCoalescer] = None
+inline_coalescer: Optional[EventCoalescer] = None
+# HubSpotAgent's object cache, patched or invalidated by incoming events (config: hubspot_cache_enabled)
+object_cache: Optional[HubSpotObjectCache] = None
+# Email/domain -> id index kept current from events (config: hubspot_index_enabled)
+crm_index: Optional[CRMIndex] = None
+# Orchestrator parse cache, for its stats endpoint (config: orchestrator_cache_enabled)
+parse_cache: Optional[ParseCache] = None
+# Background checkpoint retention (config: checkpoint_prune_interval)
+checkpoint_pruner: Optional["CheckpointPruner"] = None
+# Appends verified /webhook deliveries to a JSONL file for replay (config: webhook_record_path)
+webhook_recorder: Optional[WebhookRecorder] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Keep the async checkpointer open for the app lifetime and compile the graph on it."""
+    global graph, workflow_limiter, job_queue, idempotency_store, queue_coalescer, inline_coalescer, object_cache, crm_index, parse_cache
+    global checkpoint_pruner, webhook_recorder, _lazy_stack, _lazy_config, _graph_lock
+    pool = None
+    prune_task = None
+    started = time.perf_counter()
+    async with AsyncExitStack() as stack:
+        try:
+            config = load_config()
+            workflow_limiter = asyncio.Semaphore(int(config.get("max_concurrent_workflows", 32)))
+            if config.get("webhook_mode", "inline") == "queue":
+                job_queue = JobQueue.from_config(config)
+                stack.callback(job_queue.close)
+            # Optional stores: one that cannot be opened only turns its own feature off
+            if str(config.get("idempotency_enabled", "true")).lower() in ("1", "true", "yes"):
+                idempotency_store = open_optional("Idempotency store", lambda: IdempotencyStore.from_config(config))
+                if idempotency_store:
+                    stack.callback(idempotency_store.close)
+            if str(config.get("hubspot_cache_enabled", "true")).lower() in ("1", "true", "yes"):
+                object_cache = open_optional("HubSpot object cache", lambda: get_object_cache(config))
+            if str(config.get("hubspot_index_enabled", "true")).lower() in ("1", "true", "yes"):
+                crm_index = open_optional("CRM index", lambda: get_crm_index(config))
+            if str(config.get("orchestrator_cache_enabled", "true")).lower() in ("1", "true", "yes"):
+                parse_cache = open_optional("Orchestrator parse cache", lambda: get_parse_cache(config))
+            webhook_recorder = open_optional("Webhook recorder", lambda: WebhookRecorder.from_config(config))
+            if webhook_recorder:
+                stack.callback(webhook_recorder.close)
+            window = float(config.get("webhook_coalesce_window", 0))
+            if window > 0:
+                inline_coalescer = EventCoalescer(_process_event, window)
+                if job_queue:
+                    queue_coalescer = EventCoalescer(_enqueue_merged, window)
+            if str(config.get("lazy_init", "false")).lower() in ("1", "true", "yes"):
+                # Serverless cold starts: the checkpointer, graph and agents wait for the first workflow
+                _lazy_stack, _lazy_config = stack, config
+                _graph_lock = asyncio.Lock()
+            else:
+                checkpointer = await stack.enter_async_context(open_async_checkpointer(config))
+                graph = await _compile_graph(checkpointer)
+            prune_interval = float(config.get("checkpoint_prune_interval", 0))
+            if prune_interval > 0:
+                from checkpoint_retention import CheckpointPruner
+                checkpoint_pruner = CheckpointPruner.from_config(config)
+                prune_task = asyncio.create_task(checkpoint_pruner.run_periodically(prune_interval))
+            # Run workers in this process unless they are deployed separately (python worker.py)
+            if job_queue and str(config.get("queue_embedded_workers", "true")).lower() in ("1", "true", "yes"):
+                pool = WorkerPool(job_queue, _process_event, concurrency=int(config.get("worker_concurrency", 4)),
+                                  store=idempotency_store)
+                pool.start()
+        except Exception as e:
+            logger.error(f"Graph initialization failed: {e}")
+            graph = None
+        metrics.STARTUP_SECONDS.set(time.perf_counter() - started, phase="lifespan")
+        yield
+        if pool:
+            await pool.stop()
+        if prune_task:
+            prune_task.cancel()
+            await asyncio.gather(prune_task, return_exceptions=True)
+        graph = None
+        _lazy_stack = _lazy_config = None
+        job_queue = None
+        idempotency_store = None
+        queue_coalescer = inline_coalescer = None
+        object_cache = None
+        crm_index = None
+        parse_cache = None
+        checkpoint_pruner = None
+        webhook_recorder = None
+
+async def _compile_graph(checkpointer):
+    """Compile the async graph and build its agents (off the event loop; they load clients and models)."""
+    import graph as graph_module
+    compiled = graph_module.build_async_graph(checkpointer)
+    await asyncio.to_thread(graph_module.warm_up)
+    return compiled
+
+async def get_graph():
+    """The compiled graph; with lazy_init the first call opens the checkpointer and builds it."""
+    global graph
+    if graph is not None or _lazy_stack is None:
+        return graph
+    async with _graph_lock:
+        if graph is None and _lazy_stack is not None:
+            started = time.perf_counter()
+            try:
+                checkpointer = await _lazy_stack.enter_async_context(open_async_checkpointer(_lazy_config))
+                graph = await _compile_graph(checkpointer)
+            except Exception as e:
+                logger.error(f"Graph initialization failed: {e}")
+                return None
+            metrics.STARTUP_SECONDS.set(time.perf_counter() - started, phase="first_use")
+    return graph
+
+async def _process_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    return await process_event(await get_graph(), event, workflow_limiter, idempotency_store)
+
+app = FastAPI(lifespan=lifespan)
+
+# Configure CORS (adjust origins in production)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+def _get_hubspot_client_secret() -> Optional[str]:
+    # Prefer environment variable (Vercel). Fallback to config.json if present.
+    return os.getenv("HUBSPOT_CLIENT_SECRET")
+
+async def verify_hubspot_signature(request: Request, secret: str) -> bool:
+    """
+    Verify HubSpot webhook signature.
+    HubSpot sends header 'X-HubSpot-Signature' which is HMAC-SHA256 of the raw body, base64-encoded.
+    """
+    try:
+        body = await request.body()  # bytes
+        signature_header = request.headers.get("X-HubSpot-Signature") or request.headers.get("x-hubspot-signature")
+        if not signature_header:
+            logger.warning("Missing HubSpot signature header")
+            return False
+        # Compute expected signature: base64(hmac_sha256(secret, body))
+        digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+        expected_sig = base64.b64encode(digest).decode()
+        # Use compare_digest to avoid timing attacks
+        return hmac.compare_digest(expected_sig, signature_header)
+    except Exception as e:
+        logger.error(f"Signature verification error: {e}")
+        return False
+
+async def _enqueue_merged(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Queue one (possibly coalesced) event; jobs for the same object keep their order."""
+    job_id = await asyncio.to_thread(job_queue.enqueue, event, object_key(event))
+    return {"status": "queued", "job_id": job_id}
+
+async def _enqueue_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Persist new handled events for the worker pool in one transaction; report each event's outcome.
+
+    Deliveries already recorded by the idempotency store as queued or successful (or
+    repeated within the batch) are answered with the recorded result and not enqueued
+    again. Each job carries its deliveries' keys, so a worker can release them if the
+    job fails for good.
+    """
+    results: List[Dict[str, Any]] = []
+    pending = []
+    seen = set()
+    for event in events:
+        summary = event_summary(event)
+        if event.get('subscriptionType') not in HANDLED_EVENT_TYPES:
+            results.append({**summary, "status": "ignored",
+                            "message": f"Event {event.get('subscriptionType', '')} not handled"})
+            continue
+        key = IdempotencyStore.key_for(event)
+        record = await asyncio.to_thread(idempotency_store.get, key) if idempotency_store else None
+        if record and record.get("status") not in ("success", "queued"):
+            record = None  # the earlier job failed for good; queue the redelivery again
+        if record or key in seen:
+            results.append({**summary, **(record or {"status": "queued"}), "duplicate": True})
+            continue
+        seen.add(key)
+        result = {**summary, "status": "queued"}
+        results.append(result)
+        pending.append((key, {**event, "idempotencyKeys": [key]} if idempotency_store else event, result))
+    if pending:
+        if queue_coalescer:
+            outcomes = await asyncio.gather(*(queue_coalescer.submit(event) for _, event, _ in pending))
+            for (_, _, result), outcome in zip(pending, outcomes):
+                result.update(outcome)
+        else:
+            job_ids = await asyncio.to_thread(job_queue.enqueue_many, [event for _, event, _ in pending],
+                                              [object_key(event) for _, event, _ in pending])
+            for (_, _, result), job_id in zip(pending, job_ids):
+                result["job_id"] = job_id
+        if idempotency_store:
+            for key, _, result in pending:
+                if result.get("job_id"):
+                    await asyncio.to_thread(idempotency_store.put, key, {"status": "queued", "job_id": result["job_id"]})
+    return results
+
+async def _handle_webhook(data: Any, enqueue: bool, verified: bool = False):
+    """Dispatch a single event or a batch, either to the queue or inline.
+
+    Only signature-verified deliveries (verified) may update the object cache and the
+    CRM index: event values are written into them, so forged ones would poison later
+    reads and diffs, or point an email at another person's contact.
+    """
+    try:
+        events = parse_events(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if object_cache and verified:
+        # Every event (handled or not) tells us the cached copy of its object changed
+        await asyncio.to_thread(object_cache.apply_events, events)
+    if crm_index and verified:
+        await asyncio.to_thread(crm_index.apply_events, events)
+    if enqueue:
+        results = await _enqueue_events(events)
+        if isinstance(data, dict):
+            result = results[0]
+            if result["status"] in ("ignored", "error"):
+                return {"status": result["status"], "message": result["message"]}
+            if result.get("duplicate"):
+                return result
+            return JSONResponse(status_code=202, content={key: value for key, value in result.items()
+                                                          if key in ("status", "job_id", "coalesced")})
+        return JSONResponse(status_code=202, content={"status": "queued", "results": results})
+    if isinstance(data, dict):
+        if inline_coalescer and data.get('subscriptionType') in HANDLED_EVENT_TYPES:
+            return await inline_coalescer.submit(data)
+        return await _process_event(data)
+    return await process_batch(await get_graph(), events, workflow_limiter, idempotency_store, inline_coalescer)
+
+@app.get("/")
+async def root():
+    return {"status": "healthy", "service": "hubspot-automation"}
+
+# Keep existing /hubspot-webhook for backward compatibility
+@app.post("/hubspot-webhook")
+async def hubspot_webhook(request: Request):
+    # Delegates to common handler without signature enforcement (keeps old behavior)
+    data = await request.json()
+    logger.info(f"/hubspot-webhook received: {data}")
+    return await _handle_webhook(data, enqueue=False)
+
+# New preferred /webhook route with signature verification
+@app.post("/webhook")
+async def hubspot_webhook_secure(request: Request):
+    received_at = time.time()
+    secret = _get_hubspot_client_secret()
+    if not secret:
+        logger.error("HUBSPOT_CLIENT_SECRET not configured in environment")
+        raise HTTPException(status_code=500, detail="Webhook verification not configured")
+    # Verify signature first
+    if not await verify_hubspot_signature(request, secret):
+        logger.warning("Invalid HubSpot webhook signature")
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    if webhook_recorder:
+        await asyncio.to_thread(webhook_recorder.record, await request.body(), request.headers, "/webhook", received_at)
+    # Parse JSON after verification
+    data = await request.json()
+    logger.info(f"Verified webhook received: {data}")
+    return await _handle_webhook(data, enqueue=job_queue is not None, verified=True)
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/queue/stats")
+async def queue_stats():
+    """Queue depth and lag, for scaling workers."""
+    if not job_queue:
+        return {"status": "disabled"}
+    return await asyncio.to_thread(job_queue.stats)
+
+@app.get("/coalescer/stats")
+async def coalescer_stats():
+    """Events received versus workflow runs (or queued jobs) after coalescing."""
+    if not (queue_coalescer or inline_coalescer):
+        return {"status": "disabled"}
+    return {name: c.stats() for name, c in (("queue", queue_coalescer), ("inline", inline_coalescer)) if c}
+
+@app.get("/idempotency/stats")
+async def idempotency_stats():
+    """Hit and miss counters of the webhook deduplication layer."""
+    if not idempotency_store:
+        return {"status": "disabled"}
+    return idempotency_store.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit ratio and staleness of the HubSpot object cache."""
+    if not object_cache:
+        return {"status": "disabled"}
+    return object_cache.stats()
+
+@app.get("/index/stats")
+async def index_stats():
+    """Size and hit ratio of the email/domain -> id index."""
+    if not crm_index:
+        return {"status": "disabled"}
+    return await asyncio.to_thread(crm_index.stats)
+
+@app.get("/checkpoints/stats")
+async def checkpoints_stats():
+    """Size of the checkpoint tables and the outcome of the last prune."""
+    if not checkpoint_pruner:
+        return {"status": "disabled"}
+    storage = await asyncio.to_thread(checkpoint_pruner.storage_report)
+    return {"storage": storage, "last_prune": checkpoint_pruner.last_result}
+
+@app.get("/webhook/recording/stats")
+async def webhook_recording_stats():
+    """Deliveries recorded for replay (config: webhook_record_path)."""
+    if not webhook_recorder:
+        return {"status": "disabled"}
+    return webhook_recorder.stats()
+
+@app.get("/orchestrator/cache/stats")
+async def orchestrator_cache_stats():
+    """Parse cache hits, i.e. orchestrator LLM calls avoided."""
+    if not parse_cache:
+        return {"status": "disabled"}
+    return parse_cache.stats()
+
+@app.get("/orchestrator/usage")
+async def orchestrator_usage():
+    """LLM calls and tokens per query for the structured orchestrator mode."""
+    from graph import orchestrator
+    return {"mode": orchestrator.mode, **orchestrator.usage_stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Node, workflow, LLM, external call and checkpoint metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+if __name__ == "__main__":
+    if os.getenv('VERCEL_ENV'):
+        logger.info("Running on Vercel")
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,240 @@
+# metrics.py
+import abc
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Sequence, Tuple
+
+# Seconds; covers a cache hit (milliseconds) up to a slow LLM or HubSpot call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else f"{int(value)}"
+
+class _Metric(abc.ABC):
+    """A named metric with fixed label names; each label combination is one series."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self.clear()
+
+    @abc.abstractmethod
+    def _empty(self) -> Any:
+        """The value of a series that has not been updated yet."""
+
+    def _key(self, labels: Dict[str, Any]) -> tuple:
+        if len(labels) != len(self.labelnames) or any(name not in labels for name in self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        with self._lock:
+            series = dict(self._series)
+        for key, value in sorted(series.items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+    def labelsets(self) -> List[Dict[str, str]]:
+        """Label values of every series recorded so far."""
+        with self._lock:
+            keys = sorted(self._series)
+        return [dict(zip(self.labelnames, key)) for key in keys]
+
+    def clear(self) -> None:
+        # A metric without labels has its one series from the start, so it is exported as zero
+        with self._lock:
+            self._series: Dict[tuple, Any] = {} if self.labelnames else {(): self._empty()}
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _empty(self) -> float:
+        return 0.0
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0.0)
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = float(value)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(_Metric):
+    """Observations counted into fixed upper-bound buckets, plus their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _empty(self) -> list:
+        # Per-bucket counts (the last one is +Inf), sum, count; made cumulative when rendered
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = self._empty()
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def summary(self, **labels) -> Dict[str, float]:
+        """Count, mean and p50/p95/p99 of a series; percentiles are bucket upper bounds."""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            counts, total, count = (list(series[0]), series[1], series[2]) if series else ([], 0.0, 0)
+        result = {"count": count, "mean": total / count if count else 0.0}
+        for pct in (50, 95, 99):
+            rank, seen = pct / 100 * count, 0
+            result[f"p{pct}"] = 0.0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                seen += bucket_count
+                if count and seen >= rank:
+                    result[f"p{pct}"] = bound
+                    break
+        return result
+
+    def samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+class Registry:
+    """The metrics of a process, rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """Reset every series (the metrics stay registered); meant for tests."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+REGISTRY = Registry()
+
+def render() -> str:
+    return REGISTRY.render()
+
+# Workflow
+WORKFLOWS_IN_FLIGHT = REGISTRY.register(Gauge("workflows_in_flight", "Workflow runs executing right now."))
+WORKFLOWS = REGISTRY.register(Counter("workflows_total", "Finished workflow runs by outcome.", ["status"]))
+WORKFLOW_SECONDS = REGISTRY.register(Histogram("workflow_seconds", "Wall time of a whole workflow run."))
+NODE_SECONDS = REGISTRY.register(Histogram("workflow_node_seconds", "Time spent in each graph node.", ["node"]))
+NODE_ERRORS = REGISTRY.register(Counter("workflow_node_errors_total", "Graph node runs that set an error.", ["node"]))
+CHECKPOINT_SECONDS = REGISTRY.register(Histogram(
+    "checkpoint_seconds", "Checkpointer reads (get_tuple) and writes (put, put_writes).", ["operation"]))
+
+# Startup: module imports, lifespan set-up and each lazily built agent
+STARTUP_SECONDS = REGISTRY.register(Gauge("startup_seconds", "Time spent starting up, by phase.", ["phase"]))
+
+# Orchestrator
+PARSES = REGISTRY.register(Counter(
+    "orchestrator_parses_total", "Queries handled by the parse cache, the local classifier or the LLM.", ["source"]))
+LLM_CALLS = REGISTRY.register(Counter("llm_calls_total", "Gemini calls.", ["component"]))
+LLM_TOKENS = REGISTRY.register(Counter("llm_tokens_total", "Gemini tokens.", ["component", "direction"]))
+
+# External services
+EXTERNAL_SECONDS = REGISTRY.register(Histogram(
+    "external_call_seconds", "Latency of HubSpot, Mailjet and SMTP calls.", ["service", "operation"]))
+EXTERNAL_ERRORS = REGISTRY.register(Counter(
+    "external_call_errors_total", "HubSpot, Mailjet and SMTP calls that raised.",
+    ["service", "operation"]))
+RETRIES = REGISTRY.register(Counter("retries_total", "Retried attempts by component.", ["component"]))
+
+@contextmanager
+def external_call(service: str, operation: str):
+    """Time a call to an external service; a raised exception also counts as an error."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_ERRORS.inc(service=service, operation=operation)
+        raise
+    finally:
+        EXTERNAL_SECONDS.observe(time.perf_counter() - start, service=service, operation=operation)
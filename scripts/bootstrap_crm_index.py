@@ -0,0 +1,25 @@
+import argparse
+from hubspot import HubSpot
+from utils import load_config, logger
+from agents.crm_index import CRMIndex
+from agents.rate_limiter import get_rate_limiter
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the local email/domain -> HubSpot id index from a paged export.")
+    parser.add_argument("--page-size", type=int, default=100, help="Objects per page (HubSpot maximum is 100).")
+    parser.add_argument("--db", help="SQLite file for the index (default: hubspot_index_db_path or queue_db_path).")
+    args = parser.parse_args()
+
+    config = load_config()  # reads config.json or env
+    if args.db:
+        config["hubspot_index_db_path"] = args.db
+    client = HubSpot(api_key=config.get("hubspot_api_key"))
+    index = CRMIndex.from_config(config)
+    try:
+        counts = index.bootstrap(client, limiter=get_rate_limiter(config), page_size=args.page_size)
+        logger.info(f"Index bootstrap finished: {counts}; {index.stats()}")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
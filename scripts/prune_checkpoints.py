@@ -0,0 +1,27 @@
+import argparse
+import json
+from utils import load_config
+from checkpoint_retention import CheckpointPruner
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply checkpoint retention to the Postgres checkpointer tables.")
+    parser.add_argument("--ttl", type=float, help="Delete threads idle for this many seconds (0 disables).")
+    parser.add_argument("--compact-after", type=float,
+                        help="Keep only the final checkpoint of threads idle for this many seconds (0 disables).")
+    parser.add_argument("--max-per-thread", type=int, help="Checkpoints kept per thread (0 disables).")
+    parser.add_argument("--batch-size", type=int, help="Threads per delete statement.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be pruned without deleting.")
+    parser.add_argument("--report", action="store_true", help="Only print the storage size of the checkpoint tables.")
+    args = parser.parse_args()
+
+    config = load_config()  # reads config.json or env
+    for option, key in (("ttl", "checkpoint_ttl"), ("compact_after", "checkpoint_compact_after"),
+                        ("max_per_thread", "checkpoint_max_per_thread"), ("batch_size", "checkpoint_prune_batch_size")):
+        if getattr(args, option) is not None:
+            config[key] = getattr(args, option)
+    pruner = CheckpointPruner.from_config(config)
+    result = pruner.storage_report() if args.report else pruner.prune(dry_run=args.dry_run)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
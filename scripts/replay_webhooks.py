@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Any, List
+import httpx
+from benchmarks.common import summarize, write_results
+from webhook_recorder import read_recording, sign
+
+def schedule(records: List[Dict[str, Any]], mode: str, speed: float = 1.0, rate: float = 10.0) -> List[float]:
+    """Send offsets in seconds from the start: as recorded, recorded gaps divided by speed, or a fixed rate."""
+    if mode == "fixed":
+        return [i / rate for i in range(len(records))]
+    start = records[0]["ts"] if records else 0.0
+    factor = 1.0 if mode == "original" else 1.0 / speed
+    return [max(record["ts"] - start, 0.0) * factor for record in records]
+
+async def replay(records: List[Dict[str, Any]], offsets: List[float], target: str, secret: str,
+                 concurrency: int, timeout: float) -> Dict[str, Any]:
+    """Send every record at its offset (at most `concurrency` in flight); latency and outcome per request."""
+    latencies: Dict[str, List[float]] = {}
+    lags: List[float] = []
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+
+        async def send(record: Dict[str, Any], offset: float) -> None:
+            await asyncio.sleep(max(offset - (time.perf_counter() - start), 0.0))
+            async with slots:
+                # How far behind the schedule this send is (the target or the concurrency cap holding it up)
+                lags.append(max(time.perf_counter() - start - offset, 0.0))
+                body = record["body"].encode("utf-8")
+                headers = {"Content-Type": record.get("headers", {}).get("content-type", "application/json"),
+                           "X-HubSpot-Signature": sign(body, secret)}
+                sent = time.perf_counter()
+                try:
+                    response = await client.post(target, content=body, headers=headers)
+                    outcome = str(response.status_code)
+                except httpx.HTTPError as e:
+                    outcome = type(e).__name__
+                latencies.setdefault(outcome, []).append(time.perf_counter() - sent)
+
+        await asyncio.gather(*(send(record, offset) for record, offset in zip(records, offsets)))
+        elapsed = time.perf_counter() - start
+    everything = [latency for values in latencies.values() for latency in values]
+    errors = sum(len(values) for outcome, values in latencies.items() if not outcome.startswith("2"))
+    return {
+        **summarize(everything, elapsed),
+        "errors": errors,
+        "error_rate": round(errors / len(everything), 4) if everything else 0.0,
+        "by_outcome": {outcome: summarize(values) for outcome, values in sorted(latencies.items())},
+        "schedule_lag": summarize(lags),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Resend recorded HubSpot webhook deliveries against a target.")
+    parser.add_argument("recording", help="JSONL file written by webhook_record_path.")
+    parser.add_argument("--target", default="http://localhost:8000/webhook", help="URL to post deliveries to.")
+    parser.add_argument("--mode", default="original", choices=["original", "scaled", "fixed"],
+                        help="original: recorded timing; scaled: recorded gaps divided by --speed; fixed: --rate per second.")
+    parser.add_argument("--speed", type=float, default=2.0, help="Speed-up factor for --mode scaled.")
+    parser.add_argument("--rate", type=float, default=10.0, help="Deliveries per second for --mode fixed.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight at most.")
+    parser.add_argument("--limit", type=int, help="Replay only the first N deliveries.")
+    parser.add_argument("--secret", help="Client secret to sign with (default: HUBSPOT_CLIENT_SECRET).")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file.")
+    args = parser.parse_args()
+
+    secret = args.secret or os.getenv("HUBSPOT_CLIENT_SECRET")
+    if not secret:
+        parser.error("a signing secret is required (--secret or HUBSPOT_CLIENT_SECRET)")
+    records = list(read_recording(args.recording))[:args.limit]
+    offsets = schedule(records, args.mode, args.speed, args.rate)
+    print(f"Replaying {len(records)} deliveries over {offsets[-1] if offsets else 0:.1f}s to {args.target}")
+    result = asyncio.run(replay(records, offsets, args.target, secret, args.concurrency, args.timeout))
+    print(json.dumps(result, indent=2))
+    if args.output:
+        write_results(args.output, "replay_webhooks", {"recording": args.recording, "target": args.target,
+                                                       "mode": args.mode, "speed": args.speed, "rate": args.rate,
+                                                       "result": result})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import argparse
+from utils import load_config, logger
+from agents.intent_classifier import IntentClassifier, load_examples
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local intent classifier from logged orchestrator results.")
+    parser.add_argument("--log", help="JSON-lines log of LLM parses (default: orchestrator_log_path).")
+    parser.add_argument("--output", help="Model file to write (default: orchestrator_classifier_path).")
+    parser.add_argument("--threshold", type=float, default=0.6,
+                        help="Confidence below which queries fall back to the LLM.")
+    args = parser.parse_args()
+
+    config = load_config()  # reads config.json or env
+    log_path = args.log or config.get("orchestrator_log_path")
+    output = args.output or config.get("orchestrator_classifier_path", "intent_classifier.json")
+    if not log_path:
+        parser.error("no --log given and orchestrator_log_path is not set")
+    examples = load_examples(log_path)
+    classifier = IntentClassifier(threshold=args.threshold)
+    classifier.train([(e["query"], e["intent"]) for e in examples])
+    classifier.save(output)
+    logger.info(f"Trained intent classifier on {len(examples)} queries "
+                f"({len(classifier.centroids)} intents, {len(classifier.idf)} features) -> {output}")
+
+if __name__ == "__main__":
+    main()
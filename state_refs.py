@@ -0,0 +1,99 @@
+# state_refs.py
+import hashlib
+import json
+import threading
+from typing import Dict, Any, Optional
+from utils import shared_instance
+from ttl_store import TTLStore
+
+REF_KEY = "$ref"
+
+class StateRefError(Exception):
+    """A {"$ref": key} in workflow state whose value is not in this store (expired or written elsewhere)."""
+
+class StateRefStore:
+    """Keeps large workflow results out of checkpoints, in a TTLStore.
+
+    `compact` swaps each large field of a result for {"$ref": key}, with the value stored
+    once under the hash of its JSON; `expand` puts the values back. Checkpoints then
+    carry a short key instead of a full HubSpot object on every step.
+    """
+
+    def __init__(self, path: str = "hubspot_automation.db", ttl: float = 7 * 86400.0, min_bytes: int = 512,
+                 max_entries: int = 10000):
+        self.min_bytes = min_bytes
+        self.stored = 0
+        self.bytes_stored = 0
+        self._lock = threading.Lock()
+        self._store = TTLStore(path, "workflow_state_refs", ttl=ttl, max_entries=max_entries)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "StateRefStore":
+        return cls(
+            path=config.get("state_refs_db_path", config.get("queue_db_path", "hubspot_automation.db")),
+            ttl=float(config.get("state_refs_ttl", config.get("checkpoint_ttl", 7 * 86400))),
+            min_bytes=int(config.get("state_ref_min_bytes", 512)),
+            max_entries=int(config.get("state_refs_max_entries", 10000)),
+        )
+
+    def put(self, value: Any) -> str:
+        """Store a JSON-serializable value; returns its content hash."""
+        encoded = json.dumps(value, sort_keys=True, default=str)
+        key = hashlib.sha256(encoded.encode()).hexdigest()[:32]
+        self._store.put(key, value, encoded)
+        with self._lock:
+            self.stored += 1
+            self.bytes_stored += len(encoded)
+        return key
+
+    def get(self, key: str) -> Optional[Any]:
+        """The stored value, or None if unknown or expired."""
+        return self._store.get(key)
+
+    def compact(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of result with every dict/list field of min_bytes or more replaced by a reference."""
+        compacted = {}
+        for name, value in result.items():
+            if isinstance(value, (dict, list)) and len(json.dumps(value, default=str)) >= self.min_bytes:
+                value = {REF_KEY: self.put(value)}
+            compacted[name] = value
+        return compacted
+
+    def expand(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of result with references resolved; raises StateRefError if one cannot be resolved."""
+        expanded = {}
+        for name, value in result.items():
+            if is_ref(value):
+                stored = self.get(value[REF_KEY])
+                if stored is None:
+                    raise StateRefError(
+                        f"State reference {value[REF_KEY]} for '{name}' is missing or expired; every process "
+                        f"running workflows on these checkpoints must share state_refs_db_path")
+                value = stored
+            expanded[name] = value
+        return expanded
+
+    def prune(self) -> int:
+        """Drop expired values from the persistent tier; returns the number removed."""
+        return self._store.prune()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._store.stats()
+        return {
+            "stored": self.stored,
+            "bytes_stored": self.bytes_stored,
+            "resolved": stats["hits"],
+            "missing": stats["misses"],
+            "memory_entries": stats["memory_entries"],
+        }
+
+    def close(self) -> None:
+        self._store.close()
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and REF_KEY in value
+
+def get_state_ref_store(config: Dict[str, Any]) -> StateRefStore:
+    """Process-wide store shared by the graph nodes and whoever reads final states."""
+    path = config.get("state_refs_db_path", config.get("queue_db_path", "hubspot_automation.db"))
+    return shared_instance("state_refs", path, lambda: StateRefStore.from_config(config))
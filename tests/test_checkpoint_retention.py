@@ -0,0 +1,73 @@
+# tests/test_checkpoint_retention.py
+import pytest
+from unittest.mock import patch, MagicMock
+from checkpoint_retention import CheckpointPruner, plan_retention
+
+NOW = 1_000_000.0
+
+def test_plan_retention():
+    rows = [
+        ("webhook-old", "", 3, NOW - 10 * 86400),       # idle past the TTL
+        ("webhook-idle", "", 4, NOW - 7200),            # idle past compact_after
+        ("webhook-busy", "", 30, NOW - 5),              # over the per-thread limit
+        ("webhook-busy", "sub", 2, NOW - 5),
+        ("webhook-fresh", "", 3, NOW - 5),
+    ]
+    expired, trims = plan_retention(rows, NOW, ttl=7 * 86400, compact_after=3600, max_per_thread=20)
+    assert expired == ["webhook-old"]
+    assert trims == {1: ["webhook-idle"], 20: ["webhook-busy"]}
+
+def test_plan_retention_rules_can_be_disabled():
+    rows = [("webhook-old", "", 3, NOW - 10 * 86400)]
+    assert plan_retention(rows, NOW) == ([], {})
+
+def fake_connection(rows):
+    conn = MagicMock()
+    conn.__enter__.return_value = conn
+
+    def execute(sql, params=None):
+        result = MagicMock()
+        if "pg_class" in sql:
+            result.fetchall.return_value = [("checkpoints", 8192, 10)]
+        elif "GROUP BY thread_id" in sql:
+            result.fetchall.return_value = rows
+        elif "row_number()" in sql:
+            result.fetchone.return_value = (2 * len(params["threads"]), 1)
+        elif "NOT EXISTS" in sql:
+            result.rowcount = 3
+        else:
+            result.fetchone.return_value = (5 * len(params["threads"]), 0, 4)
+        return result
+
+    conn.execute.side_effect = execute
+    return conn
+
+@patch('checkpoint_retention.time.sleep')
+@patch('checkpoint_retention.psycopg.connect')
+def test_prune_deletes_in_batches(mock_connect, mock_sleep):
+    rows = [(f"webhook-{i}", "", 3, 0.0) for i in range(5)] + [("webhook-new", "", 25, None)]
+    mock_connect.return_value = conn = fake_connection(rows)
+    pruner = CheckpointPruner("postgresql://test", ttl=60, max_per_thread=20, batch_size=2, pause=0.01)
+    result = pruner.prune()
+    assert result["threads_expired"] == 5
+    assert result["threads_trimmed"] == 1
+    assert result["checkpoints_deleted"] == 5 * 5 + 2
+    assert result["blobs_deleted"] == 3 * 4 + 3
+    delete_batches = [c.args[1]["threads"] for c in conn.execute.call_args_list
+                      if c.args[0].lstrip().startswith("WITH w")]
+    assert [len(b) for b in delete_batches] == [2, 2, 1]
+    assert mock_sleep.call_count == 2
+    assert result["storage_after"]["total_bytes"] == 8192
+    assert pruner.last_result is result
+
+@patch('checkpoint_retention.psycopg.connect')
+def test_dry_run_deletes_nothing(mock_connect):
+    mock_connect.return_value = conn = fake_connection([("webhook-1", "", 3, 0.0)])
+    result = CheckpointPruner("postgresql://test", ttl=60).prune(dry_run=True)
+    assert result["threads_expired"] == 1
+    assert result["checkpoints_deleted"] == 0
+    assert not any("DELETE" in c.args[0] for c in conn.execute.call_args_list)
+
+def test_from_config_needs_postgres():
+    with pytest.raises(ValueError, match="postgres"):
+        CheckpointPruner.from_config({"checkpointer_backend": "memory"})
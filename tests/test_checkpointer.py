@@ -0,0 +1,61 @@
+# tests/test_checkpointer.py
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from langgraph.checkpoint.memory import InMemorySaver
+from psycopg import errors
+import checkpointer
+from checkpointer import get_checkpointer, close_checkpointers, open_async_checkpointer, pool_size
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    close_checkpointers()
+    yield
+    close_checkpointers()
+
+def test_memory_backend_is_shared():
+    saver = get_checkpointer({"checkpointer_backend": "memory"})
+    assert isinstance(saver, InMemorySaver)
+    assert get_checkpointer({"checkpointer_backend": "memory"}) is saver
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown checkpointer_backend"):
+        get_checkpointer({"checkpointer_backend": "redis"})
+
+def test_postgres_needs_db_uri():
+    with pytest.raises(ValueError, match="Neon DB URI not found in config"):
+        get_checkpointer({})
+
+def test_pool_is_sized_to_concurrency():
+    assert pool_size({"webhook_mode": "queue", "worker_concurrency": 8}) == 9
+    assert pool_size({"max_concurrent_workflows": 16}) == 16
+    assert pool_size({"checkpointer_pool_size": 3, "webhook_mode": "queue", "worker_concurrency": 8}) == 3
+
+def fake_pool(row=None, missing_table=False):
+    conn = MagicMock()
+    if missing_table:
+        conn.execute.side_effect = errors.UndefinedTable("checkpoint_migrations")
+    else:
+        conn.execute.return_value.fetchone.return_value = row
+    pool = MagicMock()
+    pool.connection.return_value.__enter__.return_value = conn
+    return pool
+
+def test_setup_skipped_once_migrations_are_recorded():
+    saver = MagicMock(MIGRATIONS=["m0", "m1", "m2"])
+    checkpointer._setup(saver, fake_pool({"v": 2}))
+    saver.setup.assert_not_called()
+    checkpointer._setup(saver, fake_pool({"v": 1}))
+    checkpointer._setup(saver, fake_pool(missing_table=True))
+    assert saver.setup.call_count == 2
+
+def test_async_memory_backend():
+    async def scenario():
+        async with open_async_checkpointer({"checkpointer_backend": "memory"}) as saver:
+            return saver
+    assert isinstance(asyncio.run(scenario()), InMemorySaver)
+
+def test_sqlite_backend(tmp_path):
+    pytest.importorskip("langgraph.checkpoint.sqlite")
+    saver = get_checkpointer({"checkpointer_backend": "sqlite", "checkpointer_sqlite_path": str(tmp_path / "cp.db")})
+    assert type(saver).__name__ == "SqliteSaver"
@@ -0,0 +1,78 @@
+# tests/test_crm_index.py
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock
+import pytest
+from agents.crm_index import CRMIndex, existing_id_from_error, normalize_domain
+
+@pytest.fixture
+def index(tmp_path):
+    index = CRMIndex(str(tmp_path / "index.db"))
+    yield index
+    index.close()
+
+def test_lookup_is_case_insensitive(index):
+    index.record_contact("1", "John@Example.com ")
+    assert index.contact_id_for("john@example.com") == "1"
+    assert index.contact_id_for("jane@example.com") is None
+    assert index.contact_id_for(None) is None
+
+def test_email_change_replaces_old_mapping(index):
+    index.record_contact("1", "old@example.com")
+    index.apply_event({"subscriptionType": "contact.propertyChange", "objectId": 1,
+                       "propertyName": "email", "propertyValue": "new@example.com"})
+    assert index.contact_id_for("old@example.com") is None
+    assert index.contact_id_for("new@example.com") == "1"
+
+def test_cleared_email_drops_the_mapping(index):
+    index.record_contact("1", "old@example.com")
+    index.apply_event({"subscriptionType": "contact.propertyChange", "objectId": 1,
+                       "propertyName": "email", "propertyValue": ""})
+    assert index.contact_id_for("old@example.com") is None
+
+def test_deletion_and_merge_events_remove_entries(index):
+    index.record_contacts([("1", "a@example.com"), ("2", "b@example.com"), ("3", "c@example.com")])
+    index.apply_event({"subscriptionType": "contact.deletion", "objectId": 1})
+    index.apply_event({"subscriptionType": "contact.merge", "objectId": 2, "primaryObjectId": 2,
+                       "mergedObjectIds": [2, 3]})
+    assert index.contact_id_for("a@example.com") is None
+    assert index.contact_id_for("b@example.com") == "2"
+    assert index.contact_id_for("c@example.com") is None
+
+def test_company_domains_are_normalized(index):
+    index.record_company("7", "https://www.Example.com/about")
+    assert normalize_domain("example.com") == "example.com"
+    assert index.company_id_for("example.com") == "7"
+
+def test_bootstrap_pages_through_every_object(index):
+    def pages(prop, objects):
+        def get_page(limit, properties, archived, after=None):
+            start = int(after or 0)
+            chunk = objects[start:start + limit]
+            nxt = SimpleNamespace(after=str(start + limit)) if start + limit < len(objects) else None
+            return SimpleNamespace(results=[SimpleNamespace(id=oid, properties={prop: value}) for oid, value in chunk],
+                                   paging=SimpleNamespace(next=nxt) if nxt else None)
+        return SimpleNamespace(basic_api=SimpleNamespace(get_page=get_page))
+    contacts = [(str(i), f"user{i}@example.com") for i in range(250)]
+    client = SimpleNamespace(crm=SimpleNamespace(contacts=pages("email", contacts),
+                                                 companies=pages("domain", [("9", "example.com")])))
+    assert index.bootstrap(client, page_size=100) == {"contacts": 250, "companies": 1}
+    assert index.contact_id_for("user249@example.com") == "249"
+    assert index.stats()["contacts"] == 250
+
+def test_existing_id_is_read_from_conflict_message():
+    error = 'HTTP response body: {"status":"error","message":"Contact already exists. Existing ID: 51","category":"CONFLICT"}'
+    assert existing_id_from_error(error) == "51"
+    assert existing_id_from_error("boom") is None
+
+def test_unverified_events_cannot_remap_emails(index):
+    import main
+    index.record_contact("7", "victim@example.com")
+    forged = {"subscriptionType": "contact.propertyChange", "objectId": 99,
+              "propertyName": "email", "propertyValue": "victim@example.com"}
+    with patch.object(main, "crm_index", index), patch.object(main, "object_cache", None), \
+         patch.object(main, "inline_coalescer", None), patch("main._process_event", new_callable=AsyncMock):
+        asyncio.run(main._handle_webhook(forged, enqueue=False))
+        assert index.contact_id_for("victim@example.com") == "7"
+        asyncio.run(main._handle_webhook(forged, enqueue=False, verified=True))
+    assert index.contact_id_for("victim@example.com") == "99"
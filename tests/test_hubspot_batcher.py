@@ -0,0 +1,108 @@
+# tests/test_hubspot_batcher.py
+from concurrent.futures import wait
+from types import SimpleNamespace
+from agents.hubspot_batcher import HubSpotBatchWriter, MAX_INPUTS_PER_CALL
+
+class FakeApiException(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class FakeBatchApi:
+    """Records batch calls and answers like the CRM batch endpoints."""
+
+    def __init__(self, reject_emails=(), error_ids=(), error_context=True):
+        self.calls = []
+        self.reject_emails = set(reject_emails)
+        self.error_ids = set(error_ids)
+        self.error_context = error_context
+
+    def create(self, batch_input):
+        self.calls.append(("create", batch_input.inputs))
+        if any(i.properties.get("email") in self.reject_emails for i in batch_input.inputs):
+            raise FakeApiException(409, "Contact already exists")
+        results = [SimpleNamespace(id=f"new-{i.object_write_trace_id}", properties=i.properties,
+                                   object_write_trace_id=i.object_write_trace_id)
+                   for i in reversed(batch_input.inputs)]  # HubSpot does not promise input order
+        return SimpleNamespace(results=results, errors=None)
+
+    def update(self, batch_input):
+        self.calls.append(("update", batch_input.inputs))
+        results = [SimpleNamespace(id=i.id, properties=i.properties, object_write_trace_id=None)
+                   for i in batch_input.inputs if i.id not in self.error_ids]
+        errors = [SimpleNamespace(message=f"Object {i.id} not found",
+                                  context={"ids": [i.id]} if self.error_context else None)
+                  for i in batch_input.inputs if i.id in self.error_ids]
+        return SimpleNamespace(results=results, errors=errors)
+
+class FakeBasicApi:
+    def __init__(self, reject_emails=()):
+        self.calls = 0
+        self.reject_emails = set(reject_emails)
+
+    def create(self, object_input):
+        self.calls += 1
+        if object_input.properties.get("email") in self.reject_emails:
+            raise FakeApiException(409, "Contact already exists")
+        return SimpleNamespace(id=f"basic-{self.calls}", properties=object_input.properties)
+
+def make_client(**kwargs):
+    reject = kwargs.pop("reject_emails", ())
+    contacts = SimpleNamespace(batch_api=FakeBatchApi(reject_emails=reject, **kwargs),
+                               basic_api=FakeBasicApi(reject_emails=reject))
+    return SimpleNamespace(crm=SimpleNamespace(contacts=contacts, deals=contacts, companies=contacts))
+
+def test_concurrent_creates_share_one_call_and_get_their_own_ids():
+    client = make_client()
+    writer = HubSpotBatchWriter(client, window=0.2)
+    futures = [writer.submit("contacts", "create", {"email": f"user{i}@example.com"}) for i in range(5)]
+    wait(futures, timeout=5)
+    assert len(client.crm.contacts.batch_api.calls) == 1
+    for i, future in enumerate(futures):
+        result = future.result()
+        assert result["success"] is True
+        assert result["details"]["email"] == f"user{i}@example.com"
+
+def test_update_errors_resolve_only_the_failing_caller():
+    client = make_client(error_ids={"2"})
+    writer = HubSpotBatchWriter(client, window=0.2)
+    futures = {oid: writer.submit("contacts", "update", {"phone": "1"}, oid) for oid in ("1", "2", "3")}
+    wait(futures.values(), timeout=5)
+    assert futures["1"].result()["success"] is True
+    assert futures["3"].result()["id"] == "3"
+    assert futures["2"].result() == {"success": False, "error": "Object 2 not found"}
+
+def test_errors_without_context_are_not_pinned_on_other_items():
+    client = make_client(error_ids={"2", "3"}, error_context=False)
+    writer = HubSpotBatchWriter(client, window=0.2)
+    futures = {oid: writer.submit("contacts", "update", {"phone": "1"}, oid) for oid in ("1", "2", "3")}
+    wait(futures.values(), timeout=5)
+    assert futures["1"].result()["success"] is True
+    assert futures["3"].result() == {"success": False, "error": "unmatched batch error"}
+
+def test_repeated_ids_go_in_separate_calls_in_order():
+    client = make_client()
+    writer = HubSpotBatchWriter(client, window=0.2)
+    first = writer.submit("contacts", "update", {"phone": "1"}, "7")
+    second = writer.submit("contacts", "update", {"phone": "2"}, "7")
+    wait([first, second], timeout=5)
+    calls = client.crm.contacts.batch_api.calls
+    assert [[i.properties["phone"] for i in inputs] for _, inputs in calls] == [["1"], ["2"]]
+
+def test_batches_are_capped_at_api_limit():
+    client = make_client()
+    writer = HubSpotBatchWriter(client, window=0.5, max_batch=1000)
+    futures = [writer.submit("contacts", "create", {"email": f"u{i}@example.com"}) for i in range(MAX_INPUTS_PER_CALL + 5)]
+    wait(futures, timeout=5)
+    assert all(f.result()["success"] for f in futures)
+    assert max(len(inputs) for _, inputs in client.crm.contacts.batch_api.calls) == MAX_INPUTS_PER_CALL
+
+def test_rejected_batch_falls_back_to_single_creates():
+    client = make_client(reject_emails={"dupe@example.com"})
+    writer = HubSpotBatchWriter(client, window=0.2)
+    ok = writer.submit("contacts", "create", {"email": "new@example.com"})
+    dupe = writer.submit("contacts", "create", {"email": "dupe@example.com"})
+    wait([ok, dupe], timeout=5)
+    assert ok.result()["success"] is True
+    assert dupe.result() == {"success": False, "error": "Contact already exists"}
+    assert writer.stats()["fallbacks"] == 1
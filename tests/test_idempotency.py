@@ -0,0 +1,58 @@
+# tests/test_idempotency.py
+import asyncio
+import pytest
+from unittest.mock import patch
+from idempotency import IdempotencyStore
+
+@pytest.fixture
+def store(tmp_path):
+    s = IdempotencyStore(path=str(tmp_path / "idem.db"), ttl=60, max_entries=2)
+    yield s
+    s.close()
+
+def test_key_uses_event_id_object_id_and_occurred_at():
+    event = {"subscriptionType": "contact.creation", "eventId": 1, "objectId": 2, "occurredAt": 3}
+    assert IdempotencyStore.key_for(event) == "contact.creation:1:2:3"
+
+def test_put_get_counts_hits_and_misses(store):
+    assert store.get("k") is None
+    store.put("k", {"status": "success"})
+    assert store.get("k") == {"status": "success"}
+    stats = store.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_evicted_entries_are_served_from_sqlite(store):
+    for key in ("a", "b", "c"):
+        store.put(key, {"status": "success", "key": key})
+    assert store.stats()["memory_entries"] == 2
+    assert store.get("a") == {"status": "success", "key": "a"}
+
+def test_records_survive_restart(tmp_path):
+    path = str(tmp_path / "idem.db")
+    first = IdempotencyStore(path=path)
+    first.put("k", {"status": "success"})
+    first.close()
+    second = IdempotencyStore(path=path)
+    assert second.get("k") == {"status": "success"}
+    second.close()
+
+def test_expired_records_are_misses(tmp_path):
+    s = IdempotencyStore(path=str(tmp_path / "idem.db"), ttl=0)
+    s.put("k", {"status": "success"})
+    assert s.get("k") is None
+    s.close()
+
+def test_store_that_cannot_be_opened_only_disables_deduplication(tmp_path):
+    import main
+    config = {"idempotency_db_path": str(tmp_path / "missing" / "idem.db"), "lazy_init": True,
+              "hubspot_cache_enabled": False, "hubspot_index_enabled": False, "orchestrator_cache_enabled": False}
+
+    async def run():
+        with patch.object(main, "load_config", return_value=config):
+            async with main.lifespan(main.app):
+                return main.idempotency_store, main._lazy_stack is not None
+
+    store, graph_pending = asyncio.run(run())
+    assert store is None
+    assert graph_pending  # the workflow still starts on the first event
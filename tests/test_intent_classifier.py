@@ -0,0 +1,43 @@
+# tests/test_intent_classifier.py
+from agents.intent_classifier import IntentClassifier, extract_properties, load_examples
+
+TRAINING = [
+    ("Create a new contact for John Doe with email john@example.com", "create_contact"),
+    ("Create a new contact for Jane Roe with email jane@example.com", "create_contact"),
+    ("Update contact with ID 123 to have phone number 123-456-7890", "update_contact"),
+    ("Update contact with ID 77 to have phone number 555-010-2000", "update_contact"),
+    ("Create a new deal named New Deal with amount 1000", "create_deal"),
+    ("Update deal with ID 456 to stage appointmentscheduled", "update_deal"),
+    ("Create a new company named New Company with domain example.com", "create_company"),
+]
+
+def test_extract_properties():
+    assert extract_properties("Create a new contact for John Doe with email john@example.com") == (
+        None, {"email": "john@example.com", "firstname": "John", "lastname": "Doe"})
+    assert extract_properties("Update deal with ID 456 to stage closedwon") == ("456", {"dealstage": "closedwon"})
+    assert extract_properties("Process updated contact with ID 5: phone changed to 555-1234") == ("5", {"phone": "555-1234"})
+
+def test_confident_query_is_parsed_locally():
+    classifier = IntentClassifier().train(TRAINING)
+    assert classifier.parse("Update deal with ID 9 to stage closedwon") == {
+        "intent": "update_deal", "payload": {"id": "9", "properties": {"dealstage": "closedwon"}}}
+    assert classifier.parse("Create a new company named Acme with domain acme.io") == {
+        "intent": "create_company", "payload": {"properties": {"name": "Acme", "domain": "acme.io"}}}
+
+def test_unsure_or_incomplete_query_falls_back():
+    classifier = IntentClassifier().train(TRAINING)
+    assert classifier.parse("What's the weather like today?") is None
+    assert classifier.parse("Update contact to have phone number 555-010-2000") is None  # no id
+
+def test_save_and_load(tmp_path):
+    classifier = IntentClassifier(threshold=0.7).train(TRAINING)
+    classifier.save(str(tmp_path / "model.json"))
+    loaded = IntentClassifier.load(str(tmp_path / "model.json"))
+    assert loaded.threshold == 0.7
+    assert loaded.predict("Update deal with ID 1 to stage closedwon") == classifier.predict("Update deal with ID 1 to stage closedwon")
+    assert IntentClassifier.load(str(tmp_path / "model.json"), threshold=0.9).threshold == 0.9
+
+def test_load_examples_skips_blank_lines(tmp_path):
+    path = tmp_path / "log.jsonl"
+    path.write_text('{"query": "Update deal 1", "intent": "update_deal", "payload": {}}\n\n')
+    assert [e["intent"] for e in load_examples(str(path))] == ["update_deal"]
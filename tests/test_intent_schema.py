@@ -0,0 +1,22 @@
+# tests/test_intent_schema.py
+import pytest
+from agents.intent_schema import validate_output, SCHEMA_ERRORS
+
+def test_create_contact_keeps_only_stated_properties():
+    result = validate_output({"intent": "create_contact",
+                              "contact": {"firstname": "John", "email": "john@example.com", "phone": None}})
+    assert result == {"intent": "create_contact",
+                      "payload": {"properties": {"firstname": "John", "email": "john@example.com"}}}
+
+def test_update_carries_the_record_id():
+    result = validate_output({"intent": "update_deal", "id": 456, "deal": {"dealstage": "closedwon"}})
+    assert result == {"intent": "update_deal", "payload": {"id": "456", "properties": {"dealstage": "closedwon"}}}
+
+@pytest.mark.parametrize("output", [
+    {"intent": "delete_contact", "contact": {"email": "a@example.com"}},  # unknown intent
+    {"intent": "update_contact", "contact": {"phone": "1"}},  # update without id
+    {"intent": "create_deal", "contact": {"email": "a@example.com"}},  # properties for the wrong object
+])
+def test_schema_violations_are_rejected(output):
+    with pytest.raises(SCHEMA_ERRORS):
+        validate_output(output)
@@ -0,0 +1,152 @@
+# tests/test_job_queue.py
+import asyncio
+import time
+import pytest
+from unittest.mock import patch
+from idempotency import IdempotencyStore
+from job_queue import JobQueue
+from worker import WorkerPool
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(path=str(tmp_path / "queue.db"), visibility_timeout=60, max_attempts=2, retry_backoff=0)
+    yield q
+    q.close()
+
+def test_enqueue_claim_ack(queue):
+    job_id = queue.enqueue({"subscriptionType": "contact.creation", "objectId": 1})
+    job = queue.claim()
+    assert job['id'] == job_id
+    assert job['payload']['objectId'] == 1
+    assert job['attempts'] == 1
+    assert queue.claim() is None  # invisible while running
+    queue.ack(job_id)
+    stats = queue.stats()
+    assert stats['depth'] == 0
+    assert stats['done'] == 1
+
+def test_enqueue_many_is_ordered(queue):
+    ids = queue.enqueue_many([{"objectId": i} for i in range(3)])
+    assert len(ids) == 3
+    assert queue.stats()['depth'] == 3
+    assert queue.claim()['id'] == ids[0]
+
+def test_ordering_key_serializes_jobs_for_one_object(queue):
+    first = queue.enqueue({"objectId": 1}, ordering_key="contact:1")
+    queue.enqueue({"objectId": 1}, ordering_key="contact:1")
+    other = queue.enqueue({"objectId": 2}, ordering_key="contact:2")
+    assert queue.claim()['id'] == first
+    assert queue.claim()['id'] == other  # contact:1 is busy, so its second job waits
+    assert queue.claim() is None
+    queue.ack(first)
+    assert queue.claim()['payload'] == {"objectId": 1}
+
+def test_retrying_job_blocks_later_jobs_for_its_object(tmp_path):
+    q = JobQueue(path=str(tmp_path / "queue.db"), visibility_timeout=60, max_attempts=3, retry_backoff=60)
+    first = q.enqueue({"objectId": 1, "n": 1}, ordering_key="contact:1")
+    q.enqueue({"objectId": 1, "n": 2}, ordering_key="contact:1")
+    assert q.claim()['id'] == first
+    q.fail(first, "HubSpot 503")  # queued again, due in a minute
+    assert q.claim() is None  # the newer event must not overtake it
+    q.close()
+
+def test_extend_keeps_running_job_invisible(tmp_path):
+    q = JobQueue(path=str(tmp_path / "queue.db"), visibility_timeout=0.2)
+    job_id = q.enqueue({"objectId": 1})
+    assert q.claim()['id'] == job_id
+    time.sleep(0.15)
+    q.extend(job_id)
+    time.sleep(0.1)  # past the first timeout, not the extended one
+    assert q.claim() is None
+    q.ack(job_id)
+    q.extend(job_id)  # no effect once the job is done
+    assert q.stats()['done'] == 1
+    q.close()
+
+def test_visibility_timeout_makes_job_claimable_again(tmp_path):
+    q = JobQueue(path=str(tmp_path / "queue.db"), visibility_timeout=0)
+    job_id = q.enqueue({"objectId": 1})
+    assert q.claim()['id'] == job_id
+    again = q.claim()
+    assert again['id'] == job_id
+    assert again['attempts'] == 2
+    q.close()
+
+def test_fail_retries_then_marks_failed(queue):
+    job_id = queue.enqueue({"objectId": 1})
+    queue.claim()
+    queue.fail(job_id, "boom")
+    assert queue.stats()['depth'] == 1
+    queue.claim()
+    queue.fail(job_id, "boom again")
+    stats = queue.stats()
+    assert stats['depth'] == 0
+    assert stats['failed'] == 1
+
+def test_worker_pool_processes_jobs(queue):
+    for i in range(3):
+        queue.enqueue({"objectId": i})
+    seen = []
+
+    async def handler(event):
+        seen.append(event['objectId'])
+        return {"status": "success"}
+
+    async def run():
+        pool = WorkerPool(queue, handler, concurrency=2, poll_interval=0.01)
+        pool.start()
+        while queue.stats()['done'] < 3:
+            await asyncio.sleep(0.01)
+        await pool.stop()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert sorted(seen) == [0, 1, 2]
+
+def test_worker_heartbeat_outlives_visibility_timeout(tmp_path):
+    q = JobQueue(path=str(tmp_path / "queue.db"), visibility_timeout=0.1)
+    q.enqueue({"objectId": 1})
+    runs = []
+
+    async def handler(event):
+        runs.append(event['objectId'])
+        await asyncio.sleep(0.4)  # four visibility timeouts
+        return {"status": "success"}
+
+    async def run():
+        pool = WorkerPool(q, handler, concurrency=2, poll_interval=0.01)
+        pool.start()
+        while q.stats()['done'] < 1:
+            await asyncio.sleep(0.01)
+        await pool.stop()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert runs == [1]
+    q.close()
+
+def test_redelivery_is_queued_again_after_permanent_failure(tmp_path):
+    import main
+    queue = JobQueue(path=str(tmp_path / "queue.db"), max_attempts=1)
+    store = IdempotencyStore(path=str(tmp_path / "idem.db"))
+    event = {"subscriptionType": "contact.creation", "eventId": 1, "objectId": 7, "occurredAt": 3}
+
+    async def handler(event):
+        return {"status": "error", "message": "HubSpot down"}
+
+    async def run():
+        with patch.object(main, "job_queue", queue), patch.object(main, "idempotency_store", store), \
+             patch.object(main, "queue_coalescer", None):
+            first = await main._enqueue_events([event])
+            assert (await main._enqueue_events([event]))[0]["duplicate"]  # still queued
+            pool = WorkerPool(queue, handler, poll_interval=0.01, store=store)
+            pool.start()
+            while queue.stats()['failed'] < 1:
+                await asyncio.sleep(0.01)
+            await pool.stop()
+            return first, await main._enqueue_events([event])
+
+    first, again = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert store.get(IdempotencyStore.key_for(event))["status"] == "queued"  # the new job's marker
+    assert again[0]["status"] == "queued" and not again[0].get("duplicate")
+    assert again[0]["job_id"] != first[0]["job_id"]
+    queue.close()
+    store.close()
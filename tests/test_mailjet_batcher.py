@@ -0,0 +1,71 @@
+# tests/test_mailjet_batcher.py
+import threading
+from concurrent.futures import wait
+from agents.mailjet_batcher import MailjetBatcher, MAX_MESSAGES_PER_CALL
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+class FakeSend:
+    """Stands in for Client.send; records each call's Messages list."""
+
+    def __init__(self, fail_emails=()):
+        self.calls = []
+        self.fail_emails = set(fail_emails)
+        self._lock = threading.Lock()
+
+    def create(self, data):
+        messages = data["Messages"]
+        with self._lock:
+            self.calls.append(messages)
+        statuses = [{"Status": "error", "Errors": ["invalid recipient"]}
+                    if m["To"][0]["Email"] in self.fail_emails else {"Status": "success"} for m in messages]
+        return FakeResponse(400 if self.fail_emails else 200, {"Messages": statuses})
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        self.send = FakeSend(**kwargs)
+
+def message(email):
+    return {"To": [{"Email": email}], "Subject": "s", "HTMLPart": "b"}
+
+def test_concurrent_messages_share_one_call():
+    client = FakeClient()
+    batcher = MailjetBatcher(client, window=0.2)
+    futures = [batcher.submit(message(f"user{i}@example.com")) for i in range(5)]
+    wait(futures, timeout=5)
+    assert [f.result() for f in futures] == [{"success": True}] * 5
+    assert len(client.send.calls) == 1
+    assert len(client.send.calls[0]) == 5
+    assert batcher.stats()["messages_per_call"] == 5.0
+
+def test_per_message_errors_reach_their_own_caller():
+    client = FakeClient(fail_emails={"bad@example.com"})
+    batcher = MailjetBatcher(client, window=0.2)
+    good = batcher.submit(message("good@example.com"))
+    bad = batcher.submit(message("bad@example.com"))
+    assert good.result(timeout=5) == {"success": True}
+    result = bad.result(timeout=5)
+    assert result["success"] is False
+    assert "invalid recipient" in result["error"]
+
+def test_batches_are_capped_at_api_limit():
+    client = FakeClient()
+    batcher = MailjetBatcher(client, window=0.5, max_batch=500)
+    futures = [batcher.submit(message(f"user{i}@example.com")) for i in range(MAX_MESSAGES_PER_CALL + 10)]
+    wait(futures, timeout=5)
+    assert all(f.result()["success"] for f in futures)
+    assert max(len(call) for call in client.send.calls) == MAX_MESSAGES_PER_CALL
+    assert sum(len(call) for call in client.send.calls) == MAX_MESSAGES_PER_CALL + 10
+
+def test_client_failure_fails_whole_batch():
+    client = FakeClient()
+    client.send.create = lambda data: (_ for _ in ()).throw(ConnectionError("down"))
+    batcher = MailjetBatcher(client, window=0.05)
+    result = batcher.send(message("user@example.com"), timeout=5)
+    assert result == {"success": False, "error": "down"}
@@ -0,0 +1,70 @@
+# tests/test_metrics.py
+import asyncio
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry, external_call
+from checkpointer import instrument
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.REGISTRY.clear()
+    yield
+    metrics.REGISTRY.clear()
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    calls = registry.register(Counter("calls_total", "Calls.", ["service"]))
+    in_flight = registry.register(Gauge("in_flight", "Running now."))
+    calls.inc(service="hubspot")
+    calls.inc(2, service="hubspot")
+    with in_flight.track_inprogress():
+        assert in_flight.value() == 1
+    text = registry.render()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{service="hubspot"} 3' in text
+    assert "in_flight 0" in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ["node"], buckets=(0.1, 1.0)))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        latency.observe(value, node="hubspot")
+    text = registry.render()
+    assert 'latency_seconds_bucket{node="hubspot",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{node="hubspot",le="1"} 3' in text
+    assert 'latency_seconds_bucket{node="hubspot",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{node="hubspot"} 4' in text
+    assert 'latency_seconds_sum{node="hubspot"} 4.25' in text
+
+def test_labels_are_checked_and_escaped():
+    registry = Registry()
+    calls = registry.register(Counter("calls_total", "Calls.", ["service"]))
+    with pytest.raises(ValueError):
+        calls.inc(node="hubspot")
+    calls.inc(service='say "hi"\n')
+    assert 'calls_total{service="say \\"hi\\"\\n"} 1' in registry.render()
+    assert registry.register(Counter("calls_total", "Calls.", ["service"])) is calls
+    with pytest.raises(ValueError, match="already registered"):
+        registry.register(Gauge("calls_total", "Calls."))
+
+def test_metric_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric("bare", "No series type.")
+
+def test_external_call_counts_errors():
+    with pytest.raises(RuntimeError):
+        with external_call("smtp", "send"):
+            raise RuntimeError("connection refused")
+    with external_call("smtp", "send"):
+        pass
+    assert metrics.EXTERNAL_SECONDS.count(service="smtp", operation="send") == 2
+    assert metrics.EXTERNAL_ERRORS.value(service="smtp", operation="send") == 1
+
+def test_instrumented_saver_times_reads_and_writes_once():
+    saver = instrument(InMemorySaver())
+    config = {"configurable": {"thread_id": "t1"}}
+    saver.get_tuple(config)
+    asyncio.run(saver.aget_tuple(config))  # InMemorySaver's async read calls its sync one
+    assert metrics.CHECKPOINT_SECONDS.count(operation="read") == 2
+    assert metrics.CHECKPOINT_SECONDS.count(operation="write") == 0
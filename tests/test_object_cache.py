@@ -0,0 +1,86 @@
+# tests/test_object_cache.py
+import asyncio
+import time
+from unittest.mock import patch, AsyncMock
+from agents.object_cache import HubSpotObjectCache
+
+def change(object_id, name, value, occurred_at=None, event_type="contact.propertyChange"):
+    return {"subscriptionType": event_type, "objectId": object_id, "propertyName": name,
+            "propertyValue": value, "occurredAt": occurred_at or int(time.time() * 1000) + 1000}
+
+def test_read_through_hit_and_miss():
+    cache = HubSpotObjectCache()
+    assert cache.get("contacts", "1") is None
+    cache.put("contacts", "1", {"email": "a@example.com"})
+    assert cache.get("contacts", "1") == {"email": "a@example.com"}
+    assert cache.get("contacts", "1", ["email", "phone"]) is None  # phone never fetched
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+def test_writes_merge_over_cached_properties():
+    cache = HubSpotObjectCache()
+    cache.put("deals", "9", {"dealname": "Big", "amount": "10"})
+    cache.put("deals", "9", {"amount": "20"})
+    assert cache.get("deals", "9") == {"dealname": "Big", "amount": "20"}
+
+def test_entries_expire_after_ttl():
+    cache = HubSpotObjectCache(ttl=0.05)
+    cache.put("contacts", "1", {"email": "a@example.com"})
+    time.sleep(0.1)
+    assert cache.get("contacts", "1") is None
+
+def test_lru_evicts_oldest():
+    cache = HubSpotObjectCache(max_entries=2)
+    for object_id in ("1", "2", "3"):
+        cache.put("contacts", object_id, {"n": object_id})
+    assert cache.get("contacts", "1") is None
+    assert cache.get("contacts", "3") == {"n": "3"}
+
+def test_property_change_event_patches_entry():
+    cache = HubSpotObjectCache()
+    cache.put("contacts", "1", {"email": "a@example.com", "phone": "1"})
+    cache.apply_event(change(1, "phone", "2"))
+    assert cache.get("contacts", "1") == {"email": "a@example.com", "phone": "2"}
+    assert cache.stats()["patched"] == 1
+
+def test_stale_or_deletion_events_invalidate():
+    cache = HubSpotObjectCache()
+    cache.put("contacts", "1", {"phone": "1"})
+    cache.apply_event(change(1, "phone", "0", occurred_at=1000))  # older than the cached snapshot
+    assert cache.get("contacts", "1") is None
+    cache.put("deals", "5", {"amount": "1"})
+    cache.apply_event({"subscriptionType": "deal.deletion", "objectId": 5})
+    assert cache.get("deals", "5") is None
+    assert cache.stats()["invalidated"] == 2
+
+def test_sqlite_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = HubSpotObjectCache(path=path)
+    second = HubSpotObjectCache(path=path)
+    first.put("companies", "7", {"domain": "example.com"})
+    assert second.get("companies", "7") == {"domain": "example.com"}
+    first.invalidate("companies", "7")
+    second._memory.clear()
+    assert second.get("companies", "7") is None
+    first.close()
+    second.close()
+
+def test_diff_returns_only_changed_properties():
+    cache = HubSpotObjectCache()
+    cache.put("contacts", "1", {"phone": "1", "email": "a@example.com", "vip": "true"})
+    assert cache.diff("contacts", "1", {"phone": "1", "vip": True}) == {}
+    assert cache.diff("contacts", "1", {"phone": "2", "email": "a@example.com"}) == {"phone": "2"}
+    assert cache.diff("contacts", "2", {"phone": "1"}) is None  # no snapshot, send everything
+    stats = cache.stats()
+    assert (stats["writes_skipped"], stats["writes_partial"]) == (1, 1)
+
+def test_only_verified_deliveries_update_the_cache():
+    import main
+    cache = HubSpotObjectCache()
+    cache.put("contacts", "1", {"phone": "1"})
+    with patch.object(main, "object_cache", cache), patch.object(main, "crm_index", None), \
+         patch.object(main, "inline_coalescer", None), patch("main._process_event", new_callable=AsyncMock):
+        asyncio.run(main._handle_webhook(change(1, "phone", "forged"), enqueue=False))
+        assert cache.get("contacts", "1") == {"phone": "1"}
+        asyncio.run(main._handle_webhook(change(1, "phone", "2"), enqueue=False, verified=True))
+    assert cache.get("contacts", "1") == {"phone": "2"}
@@ -1,52 +1,181 @@
-# tests/test_orchestrator.py
-import pytest
-from unittest.mock import patch
-from agents.orchestrator import OrchestratorAgent
-from utils import load_config
-
-@pytest.fixture
-def config():
-    return load_config()
-
-@pytest.fixture
-def orchestrator(config):
-    return OrchestratorAgent(config)
-
-@patch('langchain.agents.AgentExecutor.invoke')
-def test_orchestrator_create_contact(mock_invoke, orchestrator):
-    mock_invoke.return_value = {'output': {'intent': 'create_contact', 'payload': {'properties': {'firstname': 'John', 'lastname': 'Doe', 'email': 'john@example.com'}}}}
-    result = orchestrator.run("Create a new contact for John Doe with email john@example.com")
-    assert result['intent'] == 'create_contact'
-    assert 'properties' in result['payload']
-
-@patch('langchain.agents.AgentExecutor.invoke')
-def test_orchestrator_update_contact(mock_invoke, orchestrator):
-    mock_invoke.return_value = {'output': {'intent': 'update_contact', 'payload': {'id': '123', 'properties': {'phone': '123-456-7890'}}}}
-    result = orchestrator.run("Update contact with ID 123 to have phone number 123-456-7890")
-    assert result['intent'] == 'update_contact'
-    assert 'id' in result['payload']
-
-@patch('langchain.agents.AgentExecutor.invoke')
-def test_orchestrator_create_deal(mock_invoke, orchestrator):
-    mock_invoke.return_value = {'output': {'intent': 'create_deal', 'payload': {'properties': {'dealname': 'New Deal', 'amount': '1000'}}}}
-    result = orchestrator.run("Create a new deal named New Deal with amount 1000")
-    assert result['intent'] == 'create_deal'
-    assert 'properties' in result['payload']
-
-@patch('langchain.agents.AgentExecutor.invoke')
-def test_orchestrator_update_deal(mock_invoke, orchestrator):
-    mock_invoke.return_value = {'output': {'intent': 'update_deal', 'payload': {'id': '456', 'properties': {'dealstage': 'appointmentscheduled'}}}}
-    result = orchestrator.run("Update deal with ID 456 to stage appointmentscheduled")
-    assert result['intent'] == 'update_deal'
-    assert 'id' in result['payload']
-
-@patch('langchain.agents.AgentExecutor.invoke')
-def test_orchestrator_create_company(mock_invoke, orchestrator):
-    mock_invoke.return_value = {'output': {'intent': 'create_company', 'payload': {'properties': {'name': 'New Company', 'domain': 'example.com'}}}}
-    result = orchestrator.run("Create a new company named New Company with domain example.com")
-    assert result['intent'] == 'create_company'
-    assert 'properties' in result['payload']
-
-def test_orchestrator_error(orchestrator):
-    with pytest.raises(Exception):
-        orchestrator.run("")  # Empty query
\ No newline at end of file
+# tests/test_orchestrator.py
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+import metrics
+from agents.orchestrator import OrchestratorAgent
+from agents.intent_schema import ParsedQuery
+from utils import load_config
+
+@pytest.fixture
+def config(tmp_path):
+    # Fresh parse cache per test so results never leak between runs
+    return {**load_config(), "orchestrator_cache_db_path": str(tmp_path / "parse_cache.db")}
+
+@pytest.fixture
+def orchestrator(config):
+    return OrchestratorAgent(config)
+
+@patch('langchain.agents.AgentExecutor.invoke')
+def test_orchestrator_create_contact(mock_invoke, orchestrator):
+    mock_invoke.return_value = {'output': {'intent': 'create_contact', 'payload': {'properties': {'firstname': 'John', 'lastname': 'Doe', 'email': 'john@example.com'}}}}
+    result = orchestrator.run("Create a new contact for John Doe with email john@example.com")
+    assert result['intent'] == 'create_contact'
+    assert 'properties' in result['payload']
+
+@patch('langchain.agents.AgentExecutor.invoke')
+def test_orchestrator_update_contact(mock_invoke, orchestrator):
+    mock_invoke.return_value = {'output': {'intent': 'update_contact', 'payload': {'id': '123', 'properties': {'phone': '123-456-7890'}}}}
+    result = orchestrator.run("Update contact with ID 123 to have phone number 123-456-7890")
+    assert result['intent'] == 'update_contact'
+    assert 'id' in result['payload']
+
+@patch('langchain.agents.AgentExecutor.invoke')
+def test_orchestrator_create_deal(mock_invoke, orchestrator):
+    mock_invoke.return_value = {'output': {'intent': 'create_deal', 'payload': {'properties': {'dealname': 'New Deal', 'amount': '1000'}}}}
+    result = orchestrator.run("Create a new deal named New Deal with amount 1000")
+    assert result['intent'] == 'create_deal'
+    assert 'properties' in result['payload']
+
+@patch('langchain.agents.AgentExecutor.invoke')
+def test_orchestrator_update_deal(mock_invoke, orchestrator):
+    mock_invoke.return_value = {'output': {'intent': 'update_deal', 'payload': {'id': '456', 'properties': {'dealstage': 'appointmentscheduled'}}}}
+    result = orchestrator.run("Update deal with ID 456 to stage appointmentscheduled")
+    assert result['intent'] == 'update_deal'
+    assert 'id' in result['payload']
+
+@patch('langchain.agents.AgentExecutor.invoke')
+def test_orchestrator_create_company(mock_invoke, orchestrator):
+    mock_invoke.return_value = {'output': {'intent': 'create_company', 'payload': {'properties': {'name': 'New Company', 'domain': 'example.com'}}}}
+    result = orchestrator.run("Create a new company named New Company with domain example.com")
+    assert result['intent'] == 'create_company'
+    assert 'properties' in result['payload']
+
+@patch('langchain.agents.AgentExecutor.invoke')
+def test_same_shape_query_is_served_from_cache(mock_invoke, orchestrator):
+    mock_invoke.return_value = {'output': {'intent': 'update_contact', 'payload': {'id': '123', 'properties': {}}}}
+    orchestrator.run("Process updated contact with ID 123")
+    result = orchestrator.run("Process updated contact with ID 789")
+    assert result == {'intent': 'update_contact', 'payload': {'id': '789', 'properties': {}}}
+    mock_invoke.assert_called_once()
+
+def test_agent_mode_llm_calls_are_counted(config):
+    """Gemini usage reaches llm_calls_total and llm_tokens_total through the model's callback."""
+    metrics.REGISTRY.clear()
+    orchestrator = OrchestratorAgent({**config, "orchestrator_mode": "agent", "orchestrator_cache_enabled": False})
+
+    def fake_gemini(callbacks, **kwargs):
+        usage = {"input_tokens": 50, "output_tokens": 5, "total_tokens": 55}
+        return GenericFakeChatModel(messages=iter([AIMessage(content="{}", usage_metadata=usage)]), callbacks=callbacks)
+
+    def run_agent(inputs):
+        orchestrator.llm.invoke(inputs["input"])  # the executor's tool-calling turn
+        return {'output': {'intent': 'create_company', 'payload': {'properties': {'name': 'Acme'}}}}
+
+    with patch('langchain_google_genai.ChatGoogleGenerativeAI', side_effect=fake_gemini), \
+         patch('langchain.agents.AgentExecutor.invoke', side_effect=run_agent):
+        assert orchestrator.run("Create a company named Acme")['intent'] == 'create_company'
+    assert metrics.LLM_CALLS.value(component="orchestrator") == 1
+    assert metrics.LLM_TOKENS.value(component="orchestrator", direction="input") == 50
+    assert metrics.LLM_TOKENS.value(component="orchestrator", direction="output") == 5
+
+def structured_response(parsed, input_tokens=100, output_tokens=20):
+    raw = SimpleNamespace(content="{}", usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens})
+    return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+def test_structured_mode_makes_one_call(config):
+    orchestrator = OrchestratorAgent({**config, "orchestrator_mode": "structured"})
+    orchestrator.structured_llm = MagicMock()
+    orchestrator.structured_llm.invoke.return_value = structured_response(
+        ParsedQuery(intent="update_deal", id="456", deal={"dealstage": "closedwon"}))
+    result = orchestrator.run("Update deal 456 to closed won")
+    assert result == {"intent": "update_deal", "payload": {"id": "456", "properties": {"dealstage": "closedwon"}}}
+    assert orchestrator.usage_stats()["llm_calls"] == 1
+    assert orchestrator.usage_stats()["input_tokens"] == 100
+
+def test_structured_mode_retries_only_schema_violations(config):
+    orchestrator = OrchestratorAgent({**config, "orchestrator_mode": "structured", "orchestrator_cache_enabled": False})
+    orchestrator.structured_llm = MagicMock()
+    orchestrator.structured_llm.invoke.side_effect = [
+        structured_response(ParsedQuery(intent="update_contact", contact={"phone": "1"})),  # missing id
+        structured_response(ParsedQuery(intent="update_contact", id="5", contact={"phone": "1"})),
+    ]
+    assert orchestrator.run("Update contact 5 phone 1")["payload"]["id"] == "5"
+    assert orchestrator.usage_stats()["schema_retries"] == 1
+
+    orchestrator.structured_llm.invoke.side_effect = RuntimeError("quota exceeded")
+    with pytest.raises(RuntimeError):
+        orchestrator.run("Update contact 6 phone 2")
+    assert orchestrator.structured_llm.invoke.call_count == 3
+
+def test_orchestrator_error(orchestrator):
+    with pytest.raises(Exception):
+        orchestrator.run("")  # Empty query
+
+def test_local_classifier_answers_before_the_llm(config, tmp_path):
+    from agents.intent_classifier import IntentClassifier
+    IntentClassifier().train([
+        ("Update deal with ID 456 to stage appointmentscheduled", "update_deal"),
+        ("Create a new company named New Company with domain example.com", "create_company"),
+    ]).save(str(tmp_path / "model.json"))
+    orchestrator = OrchestratorAgent({**config, "orchestrator_mode": "structured", "orchestrator_cache_enabled": False,
+                                      "orchestrator_classifier_path": str(tmp_path / "model.json"),
+                                      "orchestrator_log_path": str(tmp_path / "log.jsonl")})
+    orchestrator.structured_llm = MagicMock()
+    assert orchestrator.run("Update deal with ID 9 to stage closedwon")["payload"] == {"id": "9", "properties": {"dealstage": "closedwon"}}
+    orchestrator.structured_llm.invoke.assert_not_called()
+
+    orchestrator.structured_llm.invoke.return_value = structured_response(
+        ParsedQuery(intent="create_contact", contact={"email": "a@b.com"}))
+    orchestrator.run("Please add a@b.com to the CRM")
+    assert orchestrator.usage_stats()["local_fallbacks"] == 1
+    assert '"intent": "create_contact"' in (tmp_path / "log.jsonl").read_text()
+
+def batch_answer(messages, skip=()):
+    """Fake batched answer: an update_deal item for every numbered instruction not in skip."""
+    from agents.intent_schema import ParsedBatch
+    lines = messages[-1][1].splitlines()
+    items = [{"index": i, "intent": "update_deal", "id": line.split()[-1], "deal": {"dealstage": "closedwon"}}
+             for i, line in enumerate(lines) if i not in skip]
+    return structured_response(ParsedBatch(items=items))
+
+def test_run_many_packs_queries_into_one_call(config):
+    orchestrator = OrchestratorAgent({**config, "orchestrator_cache_enabled": False})
+    orchestrator.batch_llm = MagicMock()
+    orchestrator.batch_llm.invoke.side_effect = batch_answer
+    queries = [f"Close deal {n}" for n in (1, 2, 3, 2)]
+    results = orchestrator.run_many(queries)
+    assert [r["payload"]["id"] for r in results] == ["1", "2", "3", "2"]
+    orchestrator.batch_llm.invoke.assert_called_once()  # the repeated query is asked once
+    assert orchestrator.usage_stats()["batch_calls"] == 1
+
+def test_run_many_retries_failed_items(config):
+    orchestrator = OrchestratorAgent({**config, "orchestrator_cache_enabled": False})
+    orchestrator.batch_llm = MagicMock()
+    calls = []
+
+    def answer(messages):
+        calls.append(len(messages[-1][1].splitlines()))
+        if len(calls) == 1:
+            raise RuntimeError("truncated")
+        return batch_answer(messages, skip={1})
+
+    orchestrator.batch_llm.invoke.side_effect = answer
+    orchestrator.structured_llm = MagicMock()
+    orchestrator.structured_llm.invoke.side_effect = [
+        structured_response(ParsedQuery(intent="update_deal", id="2", deal={"dealstage": "closedwon"})),
+        RuntimeError("quota exceeded"),
+    ]
+    results = orchestrator.run_many([f"Close deal {n}" for n in range(1, 5)])
+    assert calls == [4, 2, 2]  # halved after the failed call
+    assert [r.get("payload", {}).get("id") for r in results[:3]] == ["1", "2", "3"]  # "2" answered on its own
+    assert results[3] == {"error": "quota exceeded"}
+    assert orchestrator.usage_stats()["batch_splits"] == 1
+
+def test_run_many_respects_token_budget(config):
+    orchestrator = OrchestratorAgent({**config, "orchestrator_batch_token_budget": 500})
+    batches = orchestrator._plan_batches([f"Close deal {n}" for n in range(10)])
+    assert len(batches) > 1
+    assert sum(len(b) for b in batches) == 10
@@ -0,0 +1,49 @@
+# tests/test_parse_cache.py
+import time
+from agents.parse_cache import ParseCache, normalize_query
+
+def make_cache(tmp_path, **kwargs):
+    return ParseCache(str(tmp_path / "parse.db"), **kwargs)
+
+def test_normalize_masks_ids_emails_and_numbers():
+    key, slots = normalize_query("Update  contact 42 email to jane@example.com")
+    assert key == "Update contact <<num_0>> email to <<email_0>>"
+    assert slots == [("num_0", "42"), ("email_0", "jane@example.com")]
+
+def test_same_shape_query_reuses_template_with_new_values(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get("Process new contact with ID 123") is None
+    cache.put("Process new contact with ID 123", {"intent": "update_contact", "payload": {"id": "123", "properties": {}}})
+    assert cache.get("Process new contact with ID 456") == {"intent": "update_contact",
+                                                            "payload": {"id": "456", "properties": {}}}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["llm_calls_avoided"]) == (1, 1, 1)
+
+def test_numeric_values_keep_their_type(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("Create deal worth 1000", {"intent": "create_deal", "payload": {"properties": {"amount": 1000}}})
+    assert cache.get("Create deal worth 2500")["payload"]["properties"]["amount"] == 2500
+
+def test_results_with_values_not_in_query_are_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    stored = cache.put("Create a contact for John", {"intent": "create_contact",
+                                                     "payload": {"properties": {"email": "john@example.com"}}})
+    assert stored is False
+    assert cache.get("Create a contact for John") is None
+    assert cache.stats()["uncacheable"] == 1
+
+def test_entries_persist_across_instances_and_expire(tmp_path):
+    cache = make_cache(tmp_path, ttl=0.1)
+    cache.put("Update deal 1", {"intent": "update_deal", "payload": {"id": "1"}})
+    cache.close()
+    reopened = make_cache(tmp_path, ttl=0.1)
+    assert reopened.get("Update deal 7") == {"intent": "update_deal", "payload": {"id": "7"}}
+    time.sleep(0.15)
+    assert reopened.get("Update deal 7") is None
+    reopened.close()
+
+def test_lru_evicts_oldest_in_memory(tmp_path):
+    cache = make_cache(tmp_path, max_entries=1)
+    cache.put("Create deal 1", {"intent": "create_deal", "payload": {}})
+    cache.put("Update deal 1", {"intent": "update_deal", "payload": {}})
+    assert list(cache._store._memory) == ["Update deal <<num_0>>"]
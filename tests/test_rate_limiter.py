@@ -0,0 +1,88 @@
+# tests/test_rate_limiter.py
+import time
+import pytest
+from hubspot import HubSpot
+from agents.rate_limiter import HubSpotRateLimiter, retry_after_seconds, is_retryable, operation_name
+
+class FakeApiException(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.headers = headers
+
+class Flaky:
+    """Raises the queued exceptions in order, then succeeds."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+def test_bucket_waits_once_burst_is_spent():
+    limiter = HubSpotRateLimiter(rate=20, burst=2)
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.04
+
+def test_429_honours_retry_after_then_succeeds():
+    limiter = HubSpotRateLimiter(rate=100, burst=10)
+    fn = Flaky(FakeApiException(429, {"Retry-After": "0.1"}))
+    start = time.monotonic()
+    assert limiter.call(fn) == "ok"
+    assert time.monotonic() - start >= 0.1
+    assert fn.calls == 2
+    assert limiter.stats()["throttled"] == 1
+
+def test_client_errors_are_not_retried():
+    limiter = HubSpotRateLimiter(rate=100, burst=10)
+    fn = Flaky(FakeApiException(400))
+    with pytest.raises(FakeApiException):
+        limiter.call(fn)
+    assert fn.calls == 1
+    assert limiter.stats()["retries"] == 0
+
+def test_server_errors_stop_after_max_attempts():
+    limiter = HubSpotRateLimiter(rate=100, burst=10, max_attempts=3, backoff_base=0.01)
+    fn = Flaky(*(FakeApiException(502) for _ in range(5)))
+    with pytest.raises(FakeApiException):
+        limiter.call(fn)
+    assert fn.calls == 3
+
+def test_headers_retune_rate_and_clamp_tokens():
+    limiter = HubSpotRateLimiter(rate=50, burst=50)
+    limiter.observe({"X-HubSpot-RateLimit-Max": "100", "X-HubSpot-RateLimit-Interval-Milliseconds": "10000",
+                     "X-HubSpot-RateLimit-Remaining": "12"})
+    stats = limiter.stats()
+    assert stats["rate"] == pytest.approx(9.0)
+    assert stats["tokens"] <= 2.1
+
+def test_sqlite_backend_shares_the_bucket(tmp_path):
+    path = str(tmp_path / "limits.db")
+    first = HubSpotRateLimiter(rate=0.5, burst=2, db_path=path)
+    second = HubSpotRateLimiter(rate=0.5, burst=2, db_path=path)
+    first.acquire()
+    second.acquire()
+    assert first.stats()["tokens"] < 1
+    second.pause(5)
+    assert first.stats()["paused_for"] > 4
+    first.close()
+    second.close()
+
+def test_retry_after_parsing():
+    assert retry_after_seconds({"retry-after": "3"}) == 3.0
+    assert retry_after_seconds({}) is None
+    assert is_retryable(429) and is_retryable(503)
+    assert not is_retryable(404) and not is_retryable(None)
+
+def test_operation_names_for_metrics():
+    client = HubSpot(api_key="test")
+    assert operation_name(client.crm.contacts.basic_api.update) == "contacts.update"
+    assert operation_name(client.crm.deals.batch_api.create) == "deals.batch_create"
+    assert operation_name(lambda: None) == "<lambda>"
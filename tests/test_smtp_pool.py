@@ -0,0 +1,72 @@
+# tests/test_smtp_pool.py
+import smtplib
+import pytest
+from email.message import EmailMessage
+from agents.smtp_pool import SMTPConnectionPool
+
+class FakeSMTP:
+    """Records sends; can be told to drop the session like a server would."""
+    instances = []
+
+    def __init__(self):
+        self.sent = 0
+        self.drop_next = False
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def send_message(self, msg):
+        if self.drop_next:
+            self.drop_next = False
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.sent += 1
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        self.closed = True
+
+@pytest.fixture(autouse=True)
+def reset_instances():
+    FakeSMTP.instances = []
+
+def make_pool(**kwargs):
+    return SMTPConnectionPool("localhost", connection_factory=FakeSMTP, **kwargs)
+
+def message():
+    msg = EmailMessage()
+    msg["To"] = "user@example.com"
+    msg.set_content("hi")
+    return msg
+
+def test_sessions_are_reused():
+    pool = make_pool()
+    for _ in range(5):
+        pool.send_message(message())
+    assert len(FakeSMTP.instances) == 1
+    assert FakeSMTP.instances[0].sent == 5
+    assert pool.stats()["reused"] == 4
+
+def test_session_recycled_after_max_messages():
+    pool = make_pool(max_messages=2)
+    for _ in range(5):
+        pool.send_message(message())
+    assert len(FakeSMTP.instances) == 3
+    assert FakeSMTP.instances[0].closed
+
+def test_reconnects_when_server_drops_session():
+    pool = make_pool()
+    pool.send_message(message())
+    FakeSMTP.instances[0].drop_next = True
+    pool.send_message(message())
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[1].sent == 1
+    assert pool.stats()["reconnects"] == 1
+
+def test_idle_sessions_are_evicted():
+    pool = make_pool(max_idle=0)
+    pool.send_message(message())
+    pool.send_message(message())
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[0].closed
+    assert pool.stats()["evicted"] >= 1
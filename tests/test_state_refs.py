@@ -0,0 +1,33 @@
+# tests/test_state_refs.py
+import pytest
+from state_refs import StateRefStore, StateRefError, is_ref
+
+DETAILS = {f"property_{i}": "x" * 30 for i in range(40)}
+
+def test_large_fields_become_references(tmp_path):
+    store = StateRefStore(str(tmp_path / "refs.db"), min_bytes=512)
+    result = {"success": True, "id": "123", "details": DETAILS}
+    compacted = store.compact(result)
+    assert compacted["success"] is True and compacted["id"] == "123"
+    assert is_ref(compacted["details"])
+    assert store.expand(compacted) == result
+
+def test_small_fields_stay_inline(tmp_path):
+    store = StateRefStore(str(tmp_path / "refs.db"), min_bytes=512)
+    result = {"success": True, "details": {"email": "a@b.com"}}
+    assert store.compact(result) == result
+
+def test_references_survive_restart_and_are_shared(tmp_path):
+    path = str(tmp_path / "refs.db")
+    first = StateRefStore(path)
+    compacted = first.compact({"details": DETAILS})
+    assert first.compact({"details": dict(DETAILS)}) == compacted  # same content, same key
+    first.close()
+    assert StateRefStore(path).expand(compacted) == {"details": DETAILS}
+
+def test_unresolvable_reference_raises(tmp_path):
+    store = StateRefStore(str(tmp_path / "refs.db"), ttl=-1)
+    compacted = store.compact({"details": DETAILS})
+    with pytest.raises(StateRefError, match="state_refs_db_path"):
+        store.expand(compacted)
+    assert store.stats()["missing"] == 1
@@ -0,0 +1,19 @@
+# tests/test_ttl_store.py
+from ttl_store import TTLStore
+
+def test_evicted_records_are_read_back_from_sqlite(tmp_path):
+    store = TTLStore(str(tmp_path / "store.db"), "records", max_entries=1)
+    store.put("a", {"n": 1})
+    store.put("b", {"n": 2})
+    assert list(store._memory) == ["b"]
+    assert store.get("a") == {"n": 1}
+    assert store.stats()["hits"] == 1
+    store.close()
+
+def test_expired_records_are_misses_and_pruned(tmp_path):
+    store = TTLStore(str(tmp_path / "store.db"), "records", ttl=-1)
+    store.put("a", [1, 2])
+    assert store.prune() == 1
+    assert store.get("a") is None
+    assert store.stats()["misses"] == 1
+    store.close()
@@ -0,0 +1,18 @@
+# tests/test_utils.py
+import time
+import pytest
+from utils import load_config, open_optional, ConfigError
+
+def test_missing_config_fails_without_retrying(tmp_path, monkeypatch):
+    for name in ("GEMINI_API_KEY", "HUBSPOT_API_KEY", "SENDER_EMAIL"):
+        monkeypatch.delenv(name, raising=False)
+    start = time.perf_counter()
+    with pytest.raises(ConfigError, match="Missing config keys"):
+        load_config(str(tmp_path / "config.json"))
+    assert time.perf_counter() - start < 1  # retries back off for 4s or more
+
+def test_open_optional_returns_none_when_the_component_fails():
+    def broken():
+        raise OSError("read-only file system")
+    assert open_optional("Test store", broken) is None
+    assert open_optional("Test store", lambda: 42) == 42
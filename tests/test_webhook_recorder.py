@@ -0,0 +1,40 @@
+# tests/test_webhook_recorder.py
+import base64
+import hashlib
+import hmac
+import json
+from webhook_recorder import WebhookRecorder, read_recording, sign
+
+def test_records_body_and_replayable_headers(tmp_path):
+    path = tmp_path / "webhooks.jsonl"
+    recorder = WebhookRecorder(str(path))
+    body = json.dumps([{"eventId": 1, "subscriptionType": "contact.creation", "objectId": 7}]).encode()
+    headers = {"content-type": "application/json", "x-hubspot-signature": "abc", "cookie": "session=secret"}
+    assert recorder.record(body, headers, received_at=1700000000.5)
+    recorder.close()
+    [record] = list(read_recording(str(path)))
+    assert record["ts"] == 1700000000.5
+    assert record["body"].encode() == body
+    assert record["headers"] == {"content-type": "application/json", "x-hubspot-signature": "abc"}
+
+def test_stops_at_max_bytes(tmp_path):
+    recorder = WebhookRecorder(str(tmp_path / "webhooks.jsonl"), max_bytes=200)
+    results = [recorder.record(b'{"objectId": %d}' % i, {}) for i in range(5)]
+    assert results[0] and not results[-1]
+    assert recorder.stats()["recorded"] + recorder.stats()["dropped"] == 5
+    assert recorder.stats()["bytes"] <= 200
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "webhooks.jsonl"
+    path.write_text('{"ts": 1, "body": "{}"}\n{"ts": 2, "bo')
+    assert [record["ts"] for record in read_recording(str(path))] == [1]
+
+def test_from_config_is_opt_in(tmp_path):
+    assert WebhookRecorder.from_config({}) is None
+    recorder = WebhookRecorder.from_config({"webhook_record_path": str(tmp_path / "w.jsonl")})
+    assert isinstance(recorder, WebhookRecorder)
+    recorder.close()
+
+def test_sign_matches_hubspot_v1_signature():
+    expected = base64.b64encode(hmac.new(b"secret", b"{}", hashlib.sha256).digest()).decode()
+    assert sign(b"{}", "secret") == expected
@@ -0,0 +1,169 @@
+# tests/test_webhooks.py
+import asyncio
+import pytest
+from types import SimpleNamespace
+import metrics
+from idempotency import IdempotencyStore
+from webhooks import (parse_events, build_query, thread_id_for, process_event, process_batch,
+                      merge_events, EventCoalescer)
+
+class FakeGraph:
+    """Minimal stand-in for a compiled async graph."""
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.threads = []
+
+    async def astream(self, state, config):
+        thread_id = config["configurable"]["thread_id"]
+        self.threads.append(thread_id)
+        if any(thread_id.endswith(f"-{i}") for i in self.fail_ids):
+            raise RuntimeError("boom")
+        yield {"orchestrator": {"query": state["query"]}}
+
+    async def aget_state(self, config):
+        return SimpleNamespace(values={"thread": config["configurable"]["thread_id"]})
+
+def test_parse_events_single_and_batch():
+    event = {"subscriptionType": "contact.creation", "objectId": 1}
+    assert parse_events(event) == [event]
+    assert parse_events([event, event]) == [event, event]
+    with pytest.raises(ValueError):
+        parse_events("nope")
+
+def test_build_query_and_thread_id():
+    contact = {"subscriptionType": "contact.creation", "objectId": 7}
+    deal = {"subscriptionType": "deal.propertyChange", "objectId": 8, "propertyName": "amount", "propertyValue": "10"}
+    assert build_query(contact) == "Process new contact with ID 7"
+    assert build_query(deal) == "Process updated deal with ID 8: amount changed to 10"
+    assert thread_id_for(contact) == "webhook-7"
+    assert thread_id_for(deal) == "webhook-deal-8"
+
+def test_process_batch_reports_each_event():
+    graph = FakeGraph(fail_ids=[2])
+    events = [
+        {"eventId": 10, "subscriptionType": "contact.creation", "objectId": 1},
+        {"eventId": 11, "subscriptionType": "contact.creation", "objectId": 2},
+        {"eventId": 12, "subscriptionType": "contact.deletion", "objectId": 3},
+    ]
+    response = asyncio.run(process_batch(graph, events, asyncio.Semaphore(2)))
+    assert response["status"] == "partial"
+    assert response["counts"] == {"success": 1, "error": 1, "ignored": 1}
+    assert [r["eventId"] for r in response["results"]] == [10, 11, 12]
+    assert [r["status"] for r in response["results"]] == ["success", "error", "ignored"]
+
+def test_workflow_runs_are_counted():
+    metrics.REGISTRY.clear()
+    events = [{"subscriptionType": "contact.creation", "objectId": i} for i in (1, 2)]
+    asyncio.run(process_batch(FakeGraph(fail_ids=[2]), events, asyncio.Semaphore(2)))
+    assert metrics.WORKFLOWS.value(status="success") == 1
+    assert metrics.WORKFLOWS.value(status="error") == 1
+    assert metrics.WORKFLOW_SECONDS.count() == 2
+    assert metrics.WORKFLOWS_IN_FLIGHT.value() == 0
+
+def test_redelivery_returns_recorded_result(tmp_path):
+    graph = FakeGraph()
+    store = IdempotencyStore(path=str(tmp_path / "idem.db"))
+    event = {"eventId": 10, "subscriptionType": "contact.creation", "objectId": 1, "occurredAt": 5}
+
+    async def deliver_twice():
+        first = await process_event(graph, event, store=store)
+        second = await process_event(graph, event, store=store)
+        return first, second
+
+    first, second = asyncio.run(deliver_twice())
+    assert first["status"] == "success"
+    assert second["duplicate"] is True
+    assert second["result"] == first["result"]
+    assert graph.threads == ["webhook-1"]
+    store.close()
+
+def test_concurrent_redelivery_waits_for_run_in_flight(tmp_path):
+    graph = FakeGraph()
+    store = IdempotencyStore(path=str(tmp_path / "idem.db"))
+    event = {"eventId": 10, "subscriptionType": "contact.creation", "objectId": 1, "occurredAt": 5}
+    response = asyncio.run(process_batch(graph, [event, event], store=store))
+    assert [r["status"] for r in response["results"]] == ["success", "success"]
+    assert graph.threads == ["webhook-1"]
+    store.close()
+
+def test_redelivery_of_one_coalesced_event_is_a_duplicate(tmp_path):
+    graph = FakeGraph()
+    store = IdempotencyStore(path=str(tmp_path / "idem.db"))
+    creation = {"eventId": 10, "subscriptionType": "contact.creation", "objectId": 1, "occurredAt": 5}
+    change = {"eventId": 11, "subscriptionType": "contact.propertyChange", "objectId": 1, "occurredAt": 6,
+              "propertyName": "phone", "propertyValue": "2"}
+
+    async def burst_then_redelivery():
+        coalescer = EventCoalescer(lambda event: process_event(graph, event, store=store), window=0.01)
+        await process_batch(graph, [creation, change], store=store, coalescer=coalescer)
+        return await process_event(graph, creation, store=store)
+
+    redelivered = asyncio.run(burst_then_redelivery())
+    assert redelivered["duplicate"] is True
+    assert graph.threads == ["webhook-1"]
+    assert store.get(IdempotencyStore.key_for(change))["status"] == "success"
+    store.close()
+
+def test_merge_events_unions_changed_properties():
+    merged = merge_events([
+        {"eventId": 2, "subscriptionType": "contact.propertyChange", "objectId": 1, "occurredAt": 20,
+         "propertyName": "phone", "propertyValue": "2"},
+        {"eventId": 1, "subscriptionType": "contact.propertyChange", "objectId": 1, "occurredAt": 10,
+         "propertyName": "phone", "propertyValue": "1"},
+        {"eventId": 3, "subscriptionType": "contact.propertyChange", "objectId": 1, "occurredAt": 30,
+         "propertyName": "email", "propertyValue": "a@b.c"},
+    ])
+    assert merged["properties"] == {"phone": "2", "email": "a@b.c"}
+    assert merged["eventIds"] == [1, 2, 3]
+    assert merged["idempotencyKeys"] == [IdempotencyStore.key_for({"subscriptionType": "contact.propertyChange",
+                                                                    "eventId": i, "objectId": 1, "occurredAt": 10 * i})
+                                         for i in (1, 2, 3)]
+    assert build_query(merged) == "Process updated contact with ID 1: phone changed to 2, email changed to a@b.c"
+
+def test_merge_events_prefers_creation():
+    merged = merge_events([
+        {"eventId": 1, "subscriptionType": "contact.creation", "objectId": 1, "occurredAt": 10,
+         "idempotencyKeys": ["k1"]},
+        {"eventId": 2, "subscriptionType": "contact.propertyChange", "objectId": 1, "occurredAt": 20,
+         "propertyName": "phone", "propertyValue": "2", "idempotencyKeys": ["k2"]},
+    ])
+    assert merged["subscriptionType"] == "contact.creation"
+    assert merged["idempotencyKeys"] == ["k1", "k2"]  # a failed merged job releases both deliveries
+
+def test_coalescer_runs_once_per_object_burst():
+    calls = []
+
+    async def handler(event):
+        calls.append(event)
+        return {"status": "success"}
+
+    async def burst():
+        coalescer = EventCoalescer(handler, window=0.05)
+        events = [{"subscriptionType": "contact.propertyChange", "objectId": i % 2, "eventId": i,
+                   "propertyName": f"p{i}", "propertyValue": i} for i in range(6)]
+        outcomes = await asyncio.gather(*(coalescer.submit(event) for event in events))
+        return coalescer, outcomes
+
+    coalescer, outcomes = asyncio.run(burst())
+    assert len(calls) == 2
+    assert all(outcome["coalesced"] == 3 for outcome in outcomes)
+    assert coalescer.stats()["saved"] == 4
+
+def test_coalescer_keeps_per_object_order():
+    order = []
+
+    async def handler(event):
+        order.append(("start", event["eventId"]))
+        await asyncio.sleep(0.05)
+        order.append(("end", event["eventId"]))
+        return {"status": "success"}
+
+    async def two_bursts():
+        coalescer = EventCoalescer(handler, window=0.01)
+        first = asyncio.ensure_future(coalescer.submit({"subscriptionType": "contact.creation", "objectId": 1, "eventId": 1}))
+        await asyncio.sleep(0.02)  # first window has flushed and is still running
+        second = asyncio.ensure_future(coalescer.submit({"subscriptionType": "contact.creation", "objectId": 1, "eventId": 2}))
+        await asyncio.gather(first, second)
+
+    asyncio.run(two_bursts())
+    assert order == [("start", 1), ("end", 1), ("start", 2), ("end", 2)]
\ No newline at end of file
@@ -0,0 +1,99 @@
+# ttl_store.py
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from utils import logger
+
+class TTLStore:
+    """JSON values by key: an in-memory LRU with TTL in front of one SQLite table.
+
+    The memory tier holds the max_entries most recently used records; older ones
+    are read back from SQLite. Records older than ttl are misses and are deleted
+    from both tiers. The idempotency store, the parse cache and the state ref store
+    keep their own keys and values on top of this.
+    """
+
+    def __init__(self, path: str, table: str, column: str = "value", ttl: float = 86400.0,
+                 max_entries: int = 10000):
+        self.table = table
+        self.column = column
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                {column} TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+
+    def _remember(self, key: str, value: Any, created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """The stored value, or None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._conn.execute(
+                    f"SELECT {self.column}, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(key, *entry)
+            if entry is not None and now - entry[1] > self.ttl:
+                self._memory.pop(key, None)
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any, encoded: Optional[str] = None) -> None:
+        """Store value under key, replacing any earlier one; encoded is its JSON if already built."""
+        if encoded is None:
+            encoded = json.dumps(value, default=str)
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, {self.column}, created_at) VALUES (?, ?, ?)",
+                (key, encoded, now))
+
+    def prune(self) -> int:
+        """Drop expired records from the persistent tier; returns the number removed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl,))
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} expired records from {self.table}")
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,44 +1,71 @@
-# utils.py
-import json
-import logging
-import os
-from typing import Dict, Any
-from tenacity import retry, stop_after_attempt, wait_exponential
- 
-# Set up logging (industry standard: file + console, with levels)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()]
-)
-logger = logging.getLogger(__name__)
- 
-class ConfigError(Exception):
-    """Custom exception for config issues."""
-    pass
- 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def load_config(config_path: str = "config.json") -> Dict[str, str]:
-    """Load API configs from JSON, fallback to env vars for security."""
-    try:
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-        else:
-            config = {}
-        # Override with env vars (better for prod; e.g., set via dotenv)
-        config['gemini_api_key'] = os.getenv('GEMINI_API_KEY', config.get('gemini_api_key'))
-        config['hubspot_api_key'] = os.getenv('HUBSPOT_API_KEY', config.get('hubspot_api_key'))
-        config['sender_email'] = os.getenv('SENDER_EMAIL', config.get('sender_email'))
-         
-        # Require Gemini key and other essentials (we now use Gemini for all agents)
-        required_keys = ['hubspot_api_key', 'sender_email', 'gemini_api_key']
-        missing = [k for k in required_keys if not config.get(k)]
-        if missing:
-            raise ConfigError(f"Missing config keys: {missing}")
-         
-        logger.info("Config loaded successfully.")
-        return config
-    except Exception as e:
-        logger.error(f"Config load failed: {str(e)}")
+# utils.py
+import json
+import logging
+import os
+import threading
+from typing import Dict, Any, Callable, Optional, TypeVar
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+ 
+# Set up logging (industry standard: file + console, with levels)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+ 
+class ConfigError(Exception):
+    """Custom exception for config issues."""
+    pass
+
+T = TypeVar("T")
+
+_shared: Dict[tuple, Any] = {}
+_shared_lock = threading.Lock()
+
+def shared_instance(kind: str, key: Any, factory: Callable[[], T]) -> T:
+    """The process-wide `kind` for key (e.g. one store per SQLite path), built by factory on first use."""
+    with _shared_lock:
+        if (kind, key) not in _shared:
+            _shared[(kind, key)] = factory()
+        return _shared[(kind, key)]
+
+def open_optional(name: str, factory: Callable[[], T]) -> Optional[T]:
+    """Build an optional component (cache, index, store); if that fails, log it and return None.
+
+    Only the feature behind it is switched off, e.g. when its SQLite file is on a
+    read-only filesystem; the workflow keeps running without it.
+    """
+    try:
+        return factory()
+    except Exception as e:
+        logger.error(f"{name} disabled: {e}")
+        return None
+ 
+# Retries cover a config file that is briefly unreadable; missing keys or bad JSON fail at once
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       retry=retry_if_not_exception_type((ConfigError, ValueError)), reraise=True)
+def load_config(config_path: str = "config.json") -> Dict[str, str]:
+    """Load API configs from JSON, fallback to env vars for security."""
+    try:
+        if os.path.exists(config_path):
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+        else:
+            config = {}
+        # Override with env vars (better for prod; e.g., set via dotenv)
+        config['gemini_api_key'] = os.getenv('GEMINI_API_KEY', config.get('gemini_api_key'))
+        config['hubspot_api_key'] = os.getenv('HUBSPOT_API_KEY', config.get('hubspot_api_key'))
+        config['sender_email'] = os.getenv('SENDER_EMAIL', config.get('sender_email'))
+         
+        # Require Gemini key and other essentials (we now use Gemini for all agents)
+        required_keys = ['hubspot_api_key', 'sender_email', 'gemini_api_key']
+        missing = [k for k in required_keys if not config.get(k)]
+        if missing:
+            raise ConfigError(f"Missing config keys: {missing}")
+         
+        logger.info("Config loaded successfully.")
+        return config
+    except Exception as e:
+        logger.error(f"Config load failed: {str(e)}")
         raise
\ No newline at end of file
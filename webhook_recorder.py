@@ -0,0 +1,80 @@
+# webhook_recorder.py
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, Iterator, Mapping, Optional
+from utils import logger
+
+# Headers worth replaying; anything else (cookies, proxies' auth) is left out of the recording
+RECORDED_HEADERS = ("content-type", "user-agent", "x-hubspot-signature", "x-hubspot-signature-version",
+                    "x-hubspot-request-timestamp", "x-hubspot-signature-v3")
+
+def sign(body: bytes, secret: str) -> str:
+    """X-HubSpot-Signature for body: base64 HMAC-SHA256 with the app's client secret, as /webhook verifies."""
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode()
+
+class WebhookRecorder:
+    """Appends verified webhook deliveries to a JSONL file so production traffic can be replayed.
+
+    One line per delivery: arrival time, path, the RECORDED_HEADERS present and the raw
+    body as text, so scripts/replay_webhooks.py can resend it byte for byte. Recording
+    stops (with one warning) once the file reaches max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.recorded = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = os.path.getsize(path)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["WebhookRecorder"]:
+        """A recorder when webhook_record_path is set, else None (recording is opt-in)."""
+        path = config.get("webhook_record_path")
+        if not path:
+            return None
+        return cls(path, max_bytes=int(config.get("webhook_record_max_bytes", 100 * 1024 * 1024)))
+
+    def record(self, body: bytes, headers: Mapping[str, str], path: str = "/webhook",
+               received_at: Optional[float] = None) -> bool:
+        """Append one delivery; returns False when the size limit has been reached."""
+        kept = {name: headers[name] for name in RECORDED_HEADERS if name in headers}
+        line = json.dumps({"ts": received_at or time.time(), "path": path, "headers": kept,
+                           "body": body.decode("utf-8", errors="replace")}, separators=(",", ":")) + "\n"
+        size = len(line.encode("utf-8"))
+        with self._lock:
+            if self._size + size > self.max_bytes:
+                if not self.dropped:
+                    logger.warning(f"Webhook recording {self.path} reached {self.max_bytes} bytes; no longer recording")
+                self.dropped += 1
+                return False
+            self._file.write(line)
+            self._file.flush()
+            self._size += size
+            self.recorded += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "recorded": self.recorded, "dropped": self.dropped, "bytes": self._size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+def read_recording(path: str) -> Iterator[Dict[str, Any]]:
+    """Deliveries from a recording in file order; a truncated last line is skipped."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable line {number} of {path}")
@@ -0,0 +1,229 @@
+# webhooks.py
+import asyncio
+from contextlib import nullcontext
+from typing import Dict, Any, List, Optional, Union, Callable, Awaitable
+from utils import logger
+from idempotency import IdempotencyStore
+from metrics import WORKFLOWS, WORKFLOWS_IN_FLIGHT, WORKFLOW_SECONDS
+
+# Subscription types we run the workflow for, mapped to the orchestrator query they produce
+QUERY_TEMPLATES = {
+    "contact.creation": "Process new contact with ID {objectId}",
+    "contact.propertyChange": "Process updated contact with ID {objectId}: {changes}",
+    "company.creation": "Process new company with ID {objectId}",
+    "deal.creation": "Process new deal with ID {objectId}",
+    "deal.propertyChange": "Process updated deal with ID {objectId}: {changes}",
+}
+HANDLED_EVENT_TYPES = set(QUERY_TEMPLATES)
+
+# Deliveries running on this worker, so a concurrent redelivery waits for the first run
+_inflight: Dict[str, asyncio.Future] = {}
+
+def parse_events(data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Normalize a webhook body to a list of events (HubSpot batches up to 100 per request)."""
+    if isinstance(data, list):
+        return [event for event in data if isinstance(event, dict)]
+    if isinstance(data, dict):
+        return [data]
+    raise ValueError(f"Unexpected webhook payload type: {type(data).__name__}")
+
+def build_query(event: Dict[str, Any]) -> str:
+    """Turn a HubSpot webhook event into the orchestrator query."""
+    template = QUERY_TEMPLATES.get(event.get('subscriptionType'), QUERY_TEMPLATES["contact.creation"])
+    # Coalesced events carry every changed property; single events carry one
+    properties = event.get('properties') or {event.get('propertyName'): event.get('propertyValue')}
+    changes = ", ".join(f"{name} changed to {value}" for name, value in properties.items())
+    return template.format(objectId=event.get('objectId'), changes=changes)
+
+def thread_id_for(event: Dict[str, Any]) -> str:
+    """Checkpoint thread for the event's CRM object; contacts keep the original webhook-{id} form."""
+    object_type = event.get('subscriptionType', 'contact').split('.')[0]
+    if object_type == 'contact':
+        return f"webhook-{event.get('objectId')}"
+    return f"webhook-{object_type}-{event.get('objectId')}"
+
+def object_key(event: Dict[str, Any]) -> str:
+    """Identity of the CRM object an event is about, e.g. 'contact:123'."""
+    return f"{event.get('subscriptionType', 'contact').split('.')[0]}:{event.get('objectId')}"
+
+def merge_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge events for one object into a single event carrying the union of changed properties.
+
+    A creation in the burst wins over property changes (the new-object workflow sees
+    the latest values anyway); for repeated properties the latest occurredAt wins.
+    """
+    ordered = sorted(events, key=lambda event: event.get('occurredAt') or 0)
+    merged = dict(ordered[-1])
+    creations = [event for event in ordered if event.get('subscriptionType', '').endswith('.creation')]
+    if creations:
+        merged['subscriptionType'] = creations[0]['subscriptionType']
+    properties = {event['propertyName']: event.get('propertyValue') for event in ordered if event.get('propertyName')}
+    if properties:
+        merged['properties'] = properties
+        merged['propertyNames'] = list(properties)
+    merged['eventId'] = ordered[0].get('eventId')
+    merged['eventIds'] = [event.get('eventId') for event in ordered]
+    # The merged event matches no single delivery, so it carries the keys of all of them
+    merged['idempotencyKeys'] = list(dict.fromkeys(key for event in ordered for key in IdempotencyStore.keys_for(event)))
+    return merged
+
+def event_summary(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Identifying fields of an event, echoed back in per-event responses."""
+    return {
+        "eventId": event.get('eventId'),
+        "objectId": event.get('objectId'),
+        "subscriptionType": event.get('subscriptionType'),
+    }
+
+async def run_workflow(graph, event: Dict[str, Any], limiter: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+    """Stream the workflow for one event on the event loop, bounded by limiter."""
+    if not graph:
+        raise RuntimeError("Graph not initialized")
+    # Threads are reused per object: clear the previous run's results (messages are appended to)
+    initial_state = {"query": build_query(event), "parsed_data": {}, "hubspot_result": {}, "email_result": {},
+                     "error": "", "messages": []}
+    thread = {"configurable": {"thread_id": thread_id_for(event)}}
+    async with limiter or nullcontext():
+        status = "error"
+        with WORKFLOWS_IN_FLIGHT.track_inprogress(), WORKFLOW_SECONDS.time():
+            try:
+                async for update in graph.astream(initial_state, thread):
+                    logger.info(f"Graph event: {update}")
+                snapshot = await graph.aget_state(thread)
+                status = "error" if snapshot.values.get("error") else "success"
+            finally:
+                WORKFLOWS.inc(status=status)
+    logger.info(f"Graph result: {snapshot.values}")
+    return snapshot.values
+
+async def process_event(graph, event: Dict[str, Any], limiter: Optional[asyncio.Semaphore] = None,
+                        store: Optional[IdempotencyStore] = None) -> Dict[str, Any]:
+    """Run the workflow for a handled webhook event and shape the response.
+
+    With a store, repeat deliveries of an event that already succeeded (or is running
+    here right now) return the recorded result instead of starting another run. A
+    coalesced event is checked and recorded under the key of every delivery it merged,
+    so a later redelivery of any one of them is recognized.
+    """
+    event_type = event.get('subscriptionType', '')
+    if event_type not in HANDLED_EVENT_TYPES:
+        return {"status": "ignored", "message": f"Event {event_type} not handled"}
+    keys: List[str] = []
+    if store:
+        keys = store.keys_for(event)
+        records = [await asyncio.to_thread(store.get, key) for key in keys]
+        if all(record and record.get("status") == "success" for record in records):
+            logger.info(f"Duplicate delivery {keys[0]}; returning recorded result")
+            return {**records[0], "duplicate": True}
+        running = next((key for key in keys if key in _inflight), None)
+        if running:
+            logger.info(f"Duplicate delivery {running}; waiting for the run in flight")
+            return {**await asyncio.shield(_inflight[running]), "duplicate": True}
+        future = asyncio.get_running_loop().create_future()
+        for key in keys:
+            _inflight[key] = future
+    outcome = {"status": "error", "message": "Workflow cancelled"}
+    try:
+        final_state = await run_workflow(graph, event, limiter)
+        outcome = {"status": "success", "result": final_state}
+        for key in keys:
+            await asyncio.to_thread(store.put, key, outcome)
+    except Exception as e:
+        logger.error(f"Webhook processing failed: {str(e)}")
+        outcome = {"status": "error", "message": str(e)}
+    finally:
+        if keys:
+            for key in keys:
+                _inflight.pop(key, None)
+            future.set_result(outcome)
+    return outcome
+
+class EventCoalescer:
+    """Collects events per CRM object for `window` seconds and hands the merged event to handler once.
+
+    Flushes for the same object run one at a time in arrival order, so a later burst
+    never overtakes an earlier one. Every submitter gets the merged run's outcome.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]], window: float = 0.25):
+        self.handler = handler
+        self.window = window
+        self.events_in = 0
+        self.runs_out = 0
+        self._pending: Dict[str, tuple] = {}
+        self._locks: Dict[str, list] = {}  # object key -> [lock, number of flushes holding or waiting]
+        self._tasks: set = set()
+
+    async def submit(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Add an event to its object's window and wait for the merged outcome."""
+        key = object_key(event)
+        self.events_in += 1
+        if key not in self._pending:
+            loop = asyncio.get_running_loop()
+            self._pending[key] = ([], [])
+            loop.call_later(self.window, self._schedule_flush, key)
+        events, futures = self._pending[key]
+        future = asyncio.get_running_loop().create_future()
+        events.append(event)
+        futures.append(future)
+        return await future
+
+    def _schedule_flush(self, key: str) -> None:
+        task = asyncio.ensure_future(self._flush(key))
+        self._tasks.add(task)  # hold a reference until the flush finishes
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key: str) -> None:
+        events, futures = self._pending.pop(key)
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                self.runs_out += 1
+                if len(events) > 1:
+                    logger.info(f"Coalesced {len(events)} events for {key}")
+                try:
+                    outcome = await self.handler(merge_events(events))
+                except Exception as e:
+                    logger.error(f"Coalesced run for {key} failed: {str(e)}")
+                    outcome = {"status": "error", "message": str(e)}
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._locks.pop(key, None)
+        for future in futures:
+            if not future.done():
+                future.set_result({**outcome, "coalesced": len(events)})
+
+    def stats(self) -> Dict[str, Any]:
+        """Events received versus workflow invocations actually made."""
+        return {
+            "events": self.events_in,
+            "runs": self.runs_out,
+            "saved": self.events_in - self.runs_out,
+            "pending_objects": len(self._pending),
+        }
+
+async def process_batch(graph, events: List[Dict[str, Any]], limiter: Optional[asyncio.Semaphore] = None,
+                        store: Optional[IdempotencyStore] = None,
+                        coalescer: Optional[EventCoalescer] = None) -> Dict[str, Any]:
+    """Fan a batch out to one workflow per event; limiter bounds how many run at once.
+
+    With a coalescer, handled events for the same object share one merged run.
+    """
+    def dispatch(event: Dict[str, Any]) -> Awaitable[Dict[str, Any]]:
+        if coalescer and event.get('subscriptionType') in HANDLED_EVENT_TYPES:
+            return coalescer.submit(event)
+        return process_event(graph, event, limiter, store)
+
+    outcomes = await asyncio.gather(*(dispatch(event) for event in events))
+    results = [{**event_summary(event), **outcome} for event, outcome in zip(events, outcomes)]
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("success", "error", "ignored")}
+    logger.info(f"Webhook batch of {len(events)} processed: {counts}")
+    if counts["error"] and counts["error"] == len(results):
+        status = "error"
+    elif counts["error"]:
+        status = "partial"
+    else:
+        status = "success"
+    return {"status": status, "counts": counts, "results": results}
@@ -0,0 +1,98 @@
+# worker.py
+import asyncio
+from typing import Dict, Any, Callable, Awaitable, List, Optional
+from utils import logger, load_config, open_optional
+from job_queue import JobQueue
+from idempotency import IdempotencyStore
+
+class WorkerPool:
+    """Pulls webhook jobs from the JobQueue and runs them with bounded parallelism.
+
+    With a store, a job that fails for good replaces the 'queued' idempotency markers
+    of its deliveries with the error, so HubSpot redeliveries are queued again.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 concurrency: int = 4, poll_interval: float = 0.5, store: Optional[IdempotencyStore] = None):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.store = store
+        self._tasks: List[asyncio.Task] = []
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Keep a running job invisible to other workers until it is acked or failed."""
+        while True:
+            await asyncio.sleep(max(self.queue.visibility_timeout / 3, 0.01))
+            await asyncio.to_thread(self.queue.extend, job_id)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            logger.info(f"Worker {index} claimed job {job['id']} (attempt {job['attempts']}, lag {job['lag']:.2f}s)")
+            heartbeat = asyncio.create_task(self._heartbeat(job['id']))
+            try:
+                result = await self.handler(job['payload'])
+                if result.get("status") == "error":
+                    raise RuntimeError(result.get("message", "Workflow failed"))
+                await asyncio.to_thread(self.queue.ack, job['id'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if await asyncio.to_thread(self.queue.fail, job['id'], str(e)) and self.store:
+                    await asyncio.to_thread(self._release, job['payload'], str(e))
+            finally:
+                # extend only touches running jobs, so a beat racing the ack or fail is harmless
+                heartbeat.cancel()
+
+    def _release(self, event: Dict[str, Any], error: str) -> None:
+        for key in IdempotencyStore.keys_for(event):
+            self.store.put(key, {"status": "error", "message": error})
+
+    def start(self) -> None:
+        """Spawn the worker tasks on the running event loop."""
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info(f"Worker pool started with {self.concurrency} workers")
+
+    async def join(self) -> None:
+        """Wait on the workers (they only return when cancelled)."""
+        await asyncio.gather(*self._tasks)
+
+    async def stop(self) -> None:
+        """Cancel the workers; in-flight jobs become visible again after their timeout."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+async def run_workers() -> None:
+    """Run a standalone worker pool against the configured queue until cancelled."""
+    from graph import build_async_graph
+    from checkpointer import open_async_checkpointer
+    from webhooks import process_event
+
+    config = load_config()
+    queue = JobQueue.from_config(config)
+    store = None
+    if str(config.get("idempotency_enabled", "true")).lower() in ("1", "true", "yes"):
+        store = open_optional("Idempotency store", lambda: IdempotencyStore.from_config(config))
+    limiter = asyncio.Semaphore(int(config.get("max_concurrent_workflows", 32)))
+    async with open_async_checkpointer(config) as checkpointer:
+        graph = build_async_graph(checkpointer)
+        pool = WorkerPool(queue, lambda event: process_event(graph, event, limiter, store),
+                          concurrency=int(config.get("worker_concurrency", 4)), store=store)
+        pool.start()
+        try:
+            await pool.join()
+        finally:
+            await pool.stop()
+            queue.close()
+            if store:
+                store.close()
+
+if __name__ == "__main__":
+    asyncio.run(run_workers())